@@ -0,0 +1,3 @@
+"""
+Base package of benchmarking and load-testing tools.
+"""
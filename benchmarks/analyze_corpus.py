@@ -0,0 +1,100 @@
+r"""
+Derive a recommended list of modules to preload in the sandbox from a captured corpus.
+
+Each request's code (and any course library it uploads) is parsed to find
+the modules it imports, without executing anything. Modules are ranked by the
+fraction of requests that import them, optionally weighted by their measured
+import cost; standard library modules are listed but never recommended.
+Example::
+
+  python -m benchmarks.analyze_corpus --corpus ./corpus \
+      --import-costs import_costs.json --top 8
+
+The import costs file is a JSON object of module names to seconds, as written
+by ``manage.py profile_sandbox_imports --output``.
+"""
+
+import argparse
+import json
+import sys
+from collections import Counter
+
+from benchmarks.corpus import Corpus
+from codejail_service.imports import extract_imports, library_contents
+
+
+def analyze(corpus, import_costs=None, min_fraction=0.05, top=10):
+    """
+    Analyze the corpus and return a report dict.
+    """
+    import_costs = import_costs or {}
+    libraries = {}  # digest -> (provided, imported)
+    counts = Counter()
+
+    captured = corpus.requests()
+    for req in captured:
+        modules = extract_imports(req.params().get('code', ''))
+        for digest in req.files.values():
+            if digest not in libraries:
+                libraries[digest] = library_contents(corpus.read_file(digest))
+            provided, imported = libraries[digest]
+            # Modules from the course library itself can't be preloaded.
+            modules = (modules - provided) | imported
+        counts.update(modules)
+
+    total = len(captured)
+    rows = []
+    for module, count in counts.most_common():
+        fraction = count / total
+        cost = import_costs.get(module)
+        rows.append({
+            'module': module,
+            'requests': count,
+            'fraction': round(fraction, 4),
+            'stdlib': module in sys.stdlib_module_names,
+            'import_cost': cost,
+            # Expected import time saved per request by preloading the module
+            'score': round(fraction * cost, 6) if cost is not None else None,
+        })
+
+    # Standard library modules are mostly cheap or already imported at
+    # interpreter startup, so they aren't recommended even when unmeasured.
+    candidates = [row for row in rows if row['fraction'] >= min_fraction and not row['stdlib']]
+    if import_costs:
+        candidates = [row for row in candidates if row['score'] is not None]
+        candidates.sort(key=lambda row: row['score'], reverse=True)
+
+    return {
+        'requests': total,
+        'libraries': len(libraries),
+        'modules': rows,
+        'recommended_preload': [row['module'] for row in candidates[:top]],
+    }
+
+
+def main(argv=None):
+    """
+    Command-line entry point.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n', maxsplit=1)[0])
+    parser.add_argument('--corpus', required=True, help="Corpus directory (CODEJAIL_CAPTURE_DIR)")
+    parser.add_argument('--import-costs', help="JSON file of module names to import time in seconds")
+    parser.add_argument(
+        '--min-fraction', type=float, default=0.05,
+        help="Only recommend modules imported by at least this fraction of requests",
+    )
+    parser.add_argument('--top', type=int, default=10, help="Maximum number of modules to recommend")
+    args = parser.parse_args(argv)
+
+    import_costs = None
+    if args.import_costs:
+        with open(args.import_costs, encoding='utf-8') as f:
+            import_costs = json.load(f)
+
+    report = analyze(Corpus(args.corpus), import_costs, args.min_fraction, args.top)
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
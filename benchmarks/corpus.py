@@ -0,0 +1,65 @@
+"""
+Reading of request corpora captured by the service (see ``codejail_service.capture``).
+"""
+
+import json
+import os
+from dataclasses import dataclass
+
+from codejail_service.capture import FILES_SUBDIR, REQUESTS_SUBDIR
+
+
+@dataclass(frozen=True)
+class CapturedRequest:
+    """
+    A single captured code-exec request.
+    """
+
+    time: float
+    payload: str
+    files: dict  # file name -> SHA-256 hex digest
+
+    def params(self):
+        """
+        Return the decoded payload.
+        """
+        return json.loads(self.payload)
+
+
+class Corpus:
+    """
+    A captured request corpus on disk.
+    """
+
+    def __init__(self, root):
+        """
+        Read the corpus in directory ``root``.
+        """
+        self.root = root
+
+    def requests(self):
+        """
+        Return all captured requests, in order of capture time.
+        """
+        requests_dir = os.path.join(self.root, REQUESTS_SUBDIR)
+        captured = []
+        for name in os.listdir(requests_dir):
+            if not name.endswith('.json'):
+                continue  # partially written
+            with open(os.path.join(requests_dir, name), encoding='utf-8') as f:
+                record = json.load(f)
+            captured.append(CapturedRequest(time=record['time'], payload=record['payload'], files=record['files']))
+        return sorted(captured, key=lambda req: req.time)
+
+    def file_path(self, digest):
+        """
+        Return the path to an uploaded file's contents, by digest.
+        """
+        return os.path.join(self.root, FILES_SUBDIR, digest)
+
+    def read_file(self, digest):
+        """
+        Return an uploaded file's contents, by digest.
+        """
+        with open(self.file_path(digest), 'rb') as f:
+            return f.read()
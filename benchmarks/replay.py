@@ -0,0 +1,107 @@
+r"""
+Replay a captured request corpus against a codejail-service instance.
+
+Requests are sent at their original relative times (optionally sped up), and
+the latency distribution of the responses is reported. Example::
+
+  python -m benchmarks.replay --corpus /var/tmp/codejail-corpus \
+      --target http://localhost:8080 --speed 4
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.corpus import Corpus
+from benchmarks.stats import summarize
+
+
+def send(session, url, corpus, captured, *, timeout, scheduled):
+    """
+    Send one captured request and return a tuple of (status code or error name, latency in seconds).
+
+    Latency is measured from the scheduled send time, so that delays from
+    running out of client concurrency are counted rather than hidden.
+    """
+    files = {name: corpus.read_file(digest) for name, digest in captured.files.items()}
+    start = min(scheduled, time.monotonic())
+    try:
+        resp = session.post(url, data={'payload': captured.payload}, files=files or None, timeout=timeout)
+        outcome = resp.status_code
+    except requests.RequestException as e:
+        outcome = type(e).__name__
+    return (outcome, time.monotonic() - start)
+
+
+def replay(corpus, target, *, speed, concurrency, limit, timeout):
+    """
+    Replay the corpus and return a report dict.
+    """
+    captured = corpus.requests()[:limit]
+    if not captured:
+        raise ValueError("Corpus is empty")
+
+    url = f"{target.rstrip('/')}/api/v0/code-exec"
+    local = threading.local()
+
+    def session():
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        return local.session
+
+    start = time.monotonic()
+    first_time = captured[0].time
+    futures = []
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for req in captured:
+            scheduled = start + (req.time - first_time) / speed if speed else time.monotonic()
+            delay = scheduled - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(pool.submit(
+                lambda r=req, s=scheduled: send(session(), url, corpus, r, timeout=timeout, scheduled=s)
+            ))
+        results = [f.result() for f in futures]
+    elapsed = time.monotonic() - start
+
+    return {
+        'requests': len(results),
+        'elapsed': elapsed,
+        'rate': len(results) / elapsed,
+        'outcomes': dict(Counter(str(outcome) for outcome, _ in results)),
+        'latency': summarize([latency for _, latency in results]),
+    }
+
+
+def main(argv=None):
+    """
+    Command-line entry point.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n', maxsplit=1)[0])
+    parser.add_argument('--corpus', required=True, help="Corpus directory (CODEJAIL_CAPTURE_DIR)")
+    parser.add_argument('--target', required=True, help="Base URL of the service, e.g. http://localhost:8080")
+    parser.add_argument(
+        '--speed', type=float, default=1.0,
+        help="Replay rate relative to the original traffic (e.g. 4 for 4x). 0 sends as fast as possible.",
+    )
+    parser.add_argument('--concurrency', type=int, default=32, help="Maximum requests in flight")
+    parser.add_argument('--limit', type=int, default=None, help="Replay only the first N requests")
+    parser.add_argument('--timeout', type=float, default=60.0, help="Per-request timeout in seconds")
+    args = parser.parse_args(argv)
+
+    report = replay(
+        Corpus(args.corpus), args.target,
+        speed=args.speed, concurrency=args.concurrency, limit=args.limit, timeout=args.timeout,
+    )
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
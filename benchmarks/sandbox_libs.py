@@ -0,0 +1,157 @@
+r"""
+Benchmark common grading operations on sandbox libraries, through the code-exec endpoint.
+
+Each operation is run several times (after a warmup call) and the latency of
+the whole request is reported. Results can be saved as a baseline and later
+runs compared against it, to catch dependency upgrades that make common
+operations slower. Example::
+
+  python -m benchmarks.sandbox_libs --target http://localhost:8080 \
+      --baseline sandbox_libs_baseline.json
+"""
+
+import argparse
+import json
+import sys
+import time
+from textwrap import dedent
+
+import requests
+
+from benchmarks.stats import summarize
+
+# Representative operations, each of which sets ``out``.
+OPERATIONS = {
+    'sympy_simplify': dedent("""
+        import sympy
+        x = sympy.Symbol('x')
+        out = str(sympy.simplify((x**3 + x**2 - x - 1) / (x**2 + 2*x + 1)))
+        del x
+    """),
+    'sympy_equality': dedent("""
+        import sympy
+        from sympy.parsing.sympy_parser import parse_expr
+        out = sympy.simplify(parse_expr('sin(x)**2 + cos(x)**2') - parse_expr('1')) == 0
+    """),
+    'calc_evaluate': dedent("""
+        from calc import evaluator
+        out = evaluator({'x': 2.5}, {}, 'sqrt(x^2 + 1) * sin(pi/4) + 3e-2/x')
+    """),
+    'numpy_linalg': dedent("""
+        import numpy as np
+        rng = np.random.default_rng(0)
+        a = rng.random((200, 200)) + 200 * np.eye(200)
+        out = float(np.linalg.solve(a, np.ones(200)).sum() + np.linalg.eigvals(a).real.max())
+        del np, rng, a
+    """),
+    'scipy_optimize': dedent("""
+        from scipy.optimize import minimize, rosen
+        out = minimize(rosen, [1.3, 0.7, 0.8, 1.9, 1.2], method='Nelder-Mead').fun < 1e-3
+        del minimize, rosen
+    """),
+    'chem_parse': dedent("""
+        from chem import chemcalc
+        out = chemcalc.compare_chemical_expression('2H2 + O2 -> 2H2O', '2H2 + O2 -> 2H2O')
+        del chemcalc
+    """),
+    'matplotlib_render': dedent("""
+        import os
+        os.environ['TMPDIR'] = 'tmp'
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        _fig, ax = plt.subplots()
+        ax.plot(range(100), [i * i for i in range(100)])
+        plt.savefig('tmp/figure.png')
+        out = os.path.getsize('tmp/figure.png') > 0
+        del os, matplotlib, plt, _fig, ax
+    """),
+}
+
+
+def run_operation(session, url, code, timeout):
+    """
+    Execute code once, returning the latency in seconds; raises if the execution failed.
+    """
+    payload = json.dumps({'code': code, 'globals_dict': {}, 'slug': 'codejail-service-benchmarks'})
+    start = time.monotonic()
+    resp = session.post(url, data={'payload': payload}, timeout=timeout)
+    latency = time.monotonic() - start
+
+    resp.raise_for_status()
+    body = resp.json()
+    if 'emsg' in body:
+        raise RuntimeError(body['emsg'])
+    return latency
+
+
+def benchmark(target, operations, repeat, timeout):
+    """
+    Run each operation ``repeat`` times and return a dict of latency summaries by operation.
+    """
+    url = f"{target.rstrip('/')}/api/v0/code-exec"
+    session = requests.Session()
+    results = {}
+    for name in operations:
+        code = OPERATIONS[name]
+        run_operation(session, url, code, timeout)  # warmup
+        results[name] = summarize([run_operation(session, url, code, timeout) for _ in range(repeat)])
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare median latencies against a baseline of operation names to median seconds.
+
+    Returns a dict of the operations that are more than ``tolerance`` (a
+    fraction) slower than the baseline, to their ratio of new/old median.
+    """
+    regressions = {}
+    for name, summary in results.items():
+        if name not in baseline:
+            continue
+        ratio = summary['p50'] / baseline[name]
+        if ratio > 1 + tolerance:
+            regressions[name] = ratio
+    return regressions
+
+
+def main(argv=None):
+    """
+    Command-line entry point.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n', maxsplit=1)[0])
+    parser.add_argument('--target', required=True, help="Base URL of the service, e.g. http://localhost:8080")
+    parser.add_argument(
+        '--operation', action='append', dest='operations', choices=sorted(OPERATIONS),
+        help="Operation to run; may be repeated. Defaults to all.",
+    )
+    parser.add_argument('--repeat', type=int, default=10, help="Timed runs per operation")
+    parser.add_argument('--timeout', type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument('--baseline', help="Compare against this baseline file")
+    parser.add_argument(
+        '--tolerance', type=float, default=0.2,
+        help="Report operations whose median latency exceeds the baseline by more than this fraction",
+    )
+    parser.add_argument('--save-baseline', help="Write median latencies to this file as a new baseline")
+    args = parser.parse_args(argv)
+
+    results = benchmark(args.target, args.operations or list(OPERATIONS), args.repeat, args.timeout)
+    report = {'latency': results}
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            report['regressions'] = compare(results, json.load(f), args.tolerance)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump({name: summary['p50'] for name, summary in results.items()}, f, indent=2, sort_keys=True)
+
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+    if report.get('regressions'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""
+Measure the service's own overhead per request, with a simulated sandbox.
+
+The real sandbox is replaced by an executor that returns immediately, so
+what's measured is the cost of everything around it: the full view (routing,
+middleware, form parsing, checks, the ``safe_exec`` wrapper, and rendering),
+and separately the payload parse/validate and response serialization steps,
+for a fixed set of payload sizes. Results are compared to a baseline, and the
+command exits with status 1 if any exceeds it by more than the threshold, or
+is missing from the baseline (which should then be re-recorded with
+``--update-baseline``).
+Example::
+
+  python -m benchmarks.service_overhead --baseline benchmarks/baselines/service_overhead.json
+
+Timings are reported relative to a fixed pure-Python calibration workload,
+timed alternately with each measurement, so that a baseline recorded on one
+machine is roughly comparable to results on another, and so that changes in
+the machine's speed during a run (from other load, or CPU frequency changes)
+affect both alike.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+from unittest.mock import patch
+
+from benchmarks.stats import interleaved_median_seconds
+
+# Globals dict sizes (approximate bytes of JSON) to measure.
+PAYLOAD_SIZES = {
+    'small': 1024,
+    'medium': 64 * 1024,
+    'large': 1024 * 1024,
+}
+
+# Representative submitted code, including an edxapp-style prolog.
+CODE = """\
+import os
+os.environ['OPENBLAS_NUM_THREADS'] = '1'
+answer = expect == submission
+"""
+
+
+def make_globals(size):
+    """
+    Return a globals dict whose JSON encoding is roughly ``size`` bytes.
+    """
+    chunk = 'x' * 64
+    return {
+        'expect': 42,
+        'submission': 42,
+        'data': [chunk] * max(1, size // (len(chunk) + 4)),
+    }
+
+
+def simulated_safe_exec(code, globs, **kwargs):  # pylint: disable=unused-argument
+    """
+    Stand-in for codejail's ``safe_exec`` that runs nothing and leaves the globals unchanged.
+    """
+
+
+def make_calibration():
+    """
+    Return a fixed pure-Python workload, whose time is used as the unit for results.
+
+    It's a mix of small-object and bulk JSON work, like the measured steps,
+    so that it tracks their speed on any one machine.
+    """
+    workload = {'values': [{'i': i, 's': str(i) * 4} for i in range(2000)]}
+    document = json.dumps(make_globals(PAYLOAD_SIZES['large']))
+
+    def calibration():
+        json.loads(json.dumps(workload))
+        json.loads(document)
+
+    return calibration
+
+
+def measure(iterations):
+    """
+    Return dicts of ``<stage>.<size>`` to median seconds per call, and to the calibration's.
+    """
+    # pylint: disable=import-outside-toplevel
+    from django.test import Client, override_settings
+    from django.test.utils import setup_test_environment, teardown_test_environment
+    from jsonschema.exceptions import best_match
+    from rest_framework.renderers import JSONRenderer
+
+    from codejail_service.apps.api.v0 import views
+
+    setup_test_environment()
+    client = Client()
+    renderer = JSONRenderer()
+    calibration = make_calibration()
+    (results, units) = ({}, {})
+
+    with (
+        contextlib.ExitStack() as cleanup,
+        override_settings(CODEJAIL_ENABLED=True),
+        patch('codejail_service.apps.api.v0.views.is_exec_safe', return_value=True),
+        patch('codejail_service.codejail.real_safe_exec', simulated_safe_exec),
+    ):
+        cleanup.callback(teardown_test_environment)
+        for size_name, size in PAYLOAD_SIZES.items():
+            globals_dict = make_globals(size)
+            payload = json.dumps({'code': CODE, 'globals_dict': globals_dict, 'slug': 'benchmark'})
+
+            def view():
+                resp = client.post('/api/v0/code-exec', {'payload': payload})  # pylint: disable=cell-var-from-loop
+                assert resp.status_code == 200, resp.content
+
+            def parse_validate():
+                params = json.loads(payload)  # pylint: disable=cell-var-from-loop
+                assert best_match(views.payload_validator.iter_errors(params)) is None
+
+            def serialize():
+                renderer.render({'globals_dict': globals_dict})  # pylint: disable=cell-var-from-loop
+
+            for (stage, fn) in [('view', view), ('parse_validate', parse_validate), ('serialize', serialize)]:
+                name = f'{stage}.{size_name}'
+                (results[name], units[name]) = interleaved_median_seconds([fn, calibration], iterations)
+
+    return (results, units)
+
+
+def compare(relative, baseline, threshold):
+    """
+    Compare relative costs to a baseline of the same form.
+
+    Returns a dict of the measurements that exceed the baseline by more than
+    ``threshold`` (a fraction), to their ratio of new/old cost. Measurements
+    missing from the baseline are not compared (``main`` reports them
+    separately).
+    """
+    return {
+        name: cost / baseline[name]
+        for name, cost in relative.items()
+        if name in baseline and cost > baseline[name] * (1 + threshold)
+    }
+
+
+def main(argv=None):
+    """
+    Command-line entry point.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n', maxsplit=1)[0])
+    parser.add_argument('--iterations', type=int, default=200, help="Timed calls per measurement")
+    parser.add_argument('--rounds', type=int, default=5, help="Repeat all measurements, and keep the best")
+    parser.add_argument('--baseline', help="Compare against this baseline file")
+    parser.add_argument(
+        '--threshold', type=float, default=0.25,
+        help="Fail if a measurement exceeds its baseline by more than this fraction",
+    )
+    parser.add_argument('--update-baseline', action='store_true', help="Write the results to the baseline file")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'codejail_service.settings.test')
+    import django  # pylint: disable=import-outside-toplevel
+    django.setup()
+
+    # The best of several rounds, as run-to-run noise (from other load on
+    # the machine, or CPU frequency changes) only ever makes things slower.
+    rounds = [measure(args.iterations) for _ in range(args.rounds)]
+    relative = {
+        name: min(seconds[name] / units[name] for (seconds, units) in rounds)
+        for name in sorted(rounds[0][0])
+    }
+    report = {
+        'calibration_seconds': [units for (_, units) in rounds],
+        'seconds': [seconds for (seconds, _) in rounds],
+        'relative': relative,
+    }
+
+    if args.baseline and args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(relative, f, indent=2, sort_keys=True)
+            f.write('\n')
+    elif args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        report['missing_from_baseline'] = sorted(set(relative) - set(baseline))
+        report['regressions'] = compare(relative, baseline, args.threshold)
+
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+    if report.get('regressions') or report.get('missing_from_baseline'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
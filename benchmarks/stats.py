@@ -0,0 +1,81 @@
+"""
+Timing, and summary statistics for latency measurements.
+"""
+
+import gc
+import math
+import time
+
+
+def percentile(sorted_values, fraction):
+    """
+    Return the value at ``fraction`` (0 to 1) of an ascending list, by nearest rank.
+    """
+    if not sorted_values:
+        return math.nan
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(values):
+    """
+    Return a dict of summary statistics (in the same units as ``values``).
+    """
+    ordered = sorted(values)
+    return {
+        'count': len(ordered),
+        'min': ordered[0] if ordered else math.nan,
+        'p50': percentile(ordered, 0.50),
+        'p90': percentile(ordered, 0.90),
+        'p99': percentile(ordered, 0.99),
+        'max': ordered[-1] if ordered else math.nan,
+        'mean': sum(ordered) / len(ordered) if ordered else math.nan,
+    }
+
+
+# Each timing covers enough calls to take at least this long, so that the
+# fastest steps aren't lost in timer resolution and overhead.
+MIN_TIMING_SECONDS = 0.001
+
+
+def median_seconds(fn, iterations):
+    """
+    Call ``fn`` repeatedly and return the median time per call in seconds.
+    """
+    return interleaved_median_seconds([fn], iterations)[0]
+
+
+def interleaved_median_seconds(fns, iterations):
+    """
+    Call each of ``fns`` repeatedly, alternating between them, and return their median times per call in seconds.
+    """
+    # Warm up, and find how many calls make up a timing (as timeit does)
+    numbers = []
+    for fn in fns:
+        number = 1
+        while _timing(fn, number) * number < MIN_TIMING_SECONDS:
+            number *= 2
+        numbers.append(number)
+
+    # Garbage collection is off while timing (as in timeit), since when it
+    # runs depends on everything else the process has allocated.
+    gc.collect()
+    gc.disable()
+    try:
+        timings = [
+            [_timing(fn, number) for (fn, number) in zip(fns, numbers)]
+            for _ in range(iterations)
+        ]
+    finally:
+        gc.enable()
+    return [sorted(column)[iterations // 2] for column in zip(*timings)]
+
+
+def _timing(fn, number):
+    """
+    Call ``fn`` ``number`` times, and return the time per call in seconds.
+    """
+    start = time.perf_counter()
+    for _ in range(number):
+        fn()
+    return (time.perf_counter() - start) / number
@@ -0,0 +1,162 @@
+"""
+Compare the cost of the JSON and MessagePack encodings of the code-exec API.
+
+For numeric-heavy globals of several sizes, along with a course library,
+measures the time to encode a request and decode it the way the service
+does, and to encode and decode the response, in each encoding. Needs the
+optional ``msgpack`` package. Example::
+
+  python -m benchmarks.transport --iterations 50
+
+The JSON request is a multipart form with a ``payload`` field and the library
+as a file part; the MessagePack request is a single body holding both.
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+
+from benchmarks.stats import median_seconds
+
+# Number of floats in the globals for each size.
+GLOBALS_SIZES = {
+    'small': 100,
+    'medium': 10_000,
+    'large': 200_000,
+}
+
+# Size in bytes of the simulated course library.
+LIBRARY_BYTES = 256 * 1024
+
+
+def make_globals(count):
+    """
+    Return a numeric-heavy globals dict with ``count`` floats, including special values.
+    """
+    rng = random.Random(count)
+    values = [rng.uniform(-1e6, 1e6) for _ in range(count)]
+    values[::97] = [math.nan] * len(values[::97])
+    return {'samples': values, 'bounds': [-math.inf, math.inf], 'n': count}
+
+
+def measure(iterations):
+    """
+    Return a dict of ``<encoding>.<direction>.<size>`` to median seconds, and one of body sizes in bytes.
+    """
+    # pylint: disable=import-outside-toplevel
+    from django.conf import settings
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from django.core.files.uploadhandler import load_handler
+    from django.http.multipartparser import MultiPartParser
+    from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+    from rest_framework.renderers import JSONRenderer
+
+    from codejail_service.apps.api.v0.transport import msgpack
+
+    library = os.urandom(LIBRARY_BYTES)
+    renderer = JSONRenderer()
+    timings = {}
+    body_sizes = {}
+
+    for size_name, count in GLOBALS_SIZES.items():
+        globals_dict = make_globals(count)
+        params = {'code': "result = max(samples)", 'globals_dict': globals_dict, 'python_path': ['python_lib.zip']}
+
+        def json_request():
+            body = encode_multipart(BOUNDARY, {
+                'payload': json.dumps(params),  # pylint: disable=cell-var-from-loop
+                'python_lib.zip': SimpleUploadedFile('python_lib.zip', library),
+            })
+            meta = {'CONTENT_TYPE': MULTIPART_CONTENT, 'CONTENT_LENGTH': str(len(body))}
+            # The same upload handlers as the service
+            handlers = [load_handler(path) for path in settings.FILE_UPLOAD_HANDLERS]
+            parser = MultiPartParser(meta, _BytesStream(body), handlers, 'utf-8')
+            data, files = parser.parse()
+            json.loads(data['payload'])
+            files['python_lib.zip'].read()
+            return body
+
+        def msgpack_request():
+            body = msgpack.packb(
+                {'payload': params, 'files': {'python_lib.zip': library}},  # pylint: disable=cell-var-from-loop
+                use_bin_type=True,
+            )
+            msgpack.unpackb(body, raw=False)
+            return body
+
+        def json_response():
+            json.loads(renderer.render({'globals_dict': globals_dict}))  # pylint: disable=cell-var-from-loop
+
+        def msgpack_response():
+            msgpack.unpackb(
+                msgpack.packb({'globals_dict': globals_dict}, use_bin_type=True),  # pylint: disable=cell-var-from-loop
+                raw=False,
+            )
+
+        body_sizes[f'json.{size_name}'] = len(json_request())
+        body_sizes[f'msgpack.{size_name}'] = len(msgpack_request())
+        timings[f'json.request.{size_name}'] = median_seconds(json_request, iterations)
+        timings[f'msgpack.request.{size_name}'] = median_seconds(msgpack_request, iterations)
+        timings[f'json.response.{size_name}'] = median_seconds(json_response, iterations)
+        timings[f'msgpack.response.{size_name}'] = median_seconds(msgpack_response, iterations)
+
+    return (timings, body_sizes)
+
+
+class _BytesStream:
+    """
+    Minimal readable stream over bytes, as Django's multipart parser expects.
+    """
+
+    def __init__(self, data):
+        """
+        Read from the start of ``data``.
+        """
+        self.data = data
+        self.pos = 0
+
+    def read(self, size=-1):
+        """
+        Return up to ``size`` bytes (all remaining, if negative).
+        """
+        if size < 0:
+            size = len(self.data) - self.pos
+        chunk = self.data[self.pos:self.pos + size]
+        self.pos += len(chunk)
+        return chunk
+
+
+def main(argv=None):
+    """
+    Command-line entry point.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n', maxsplit=1)[0])
+    parser.add_argument('--iterations', type=int, default=50, help="Timed calls per measurement")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'codejail_service.settings.test')
+    import django  # pylint: disable=import-outside-toplevel
+    from django.conf import settings  # pylint: disable=import-outside-toplevel
+    django.setup()
+    # The large JSON payload is over Django's default form field limit; this
+    # measures encoding costs, not what a given deployment accepts.
+    settings.DATA_UPLOAD_MAX_MEMORY_SIZE = None
+
+    from codejail_service.apps.api.v0.transport import msgpack  # pylint: disable=import-outside-toplevel
+    if msgpack is None:
+        sys.exit("The msgpack package is not installed")
+
+    timings, body_sizes = measure(args.iterations)
+    speedups = {
+        name.removeprefix('json.'): seconds / timings['msgpack.' + name.removeprefix('json.')]
+        for name, seconds in timings.items() if name.startswith('json.')
+    }
+    json.dump({'seconds': timings, 'body_bytes': body_sizes, 'msgpack_speedup': speedups}, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,12 @@
+"""
+Client for the codejail-service code-exec API.
+
+Uses only the Python standard library, so that it can be used by edxapp and
+other callers without adding dependencies.
+"""
+
+from codejail_client.client import CodejailClient, CodejailError, ExecResult
+
+__version__ = '0.1.0'
+
+__all__ = ['CodejailClient', 'CodejailError', 'ExecResult']
@@ -0,0 +1,418 @@
+"""
+Pooled, retrying, optionally batching client for the code-exec API.
+"""
+
+import hashlib
+import http.client
+import json
+import queue
+import random
+import select
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlsplit
+
+LIBRARY_FILENAME = 'python_lib.zip'
+
+# Present on responses from a service that stores uploaded libraries, which
+# can then be referred to by hash.
+LIBRARY_STORE_HEADER = 'X-Codejail-Library-Store'
+
+# Only these statuses mean the request was not executed and may be retried:
+# the service is overloaded or temporarily unavailable.
+RETRY_STATUSES = {429, 503}
+
+# Errors when writing a request on a reused keep-alive connection that the
+# server has already closed. The server didn't receive the whole request, so
+# it can't have run it. (Once the request is written, a dropped connection
+# may instead mean that the server died while running it.)
+STALE_CONNECTION_ERRORS = (BrokenPipeError, ConnectionResetError, ConnectionAbortedError)
+
+
+@dataclass(frozen=True)
+class ExecResult:
+    """
+    Result of a code execution.
+
+    - globals_dict: Globals after execution (whether or not an error was raised)
+    - emsg: Error message if the code raised an error or was killed, or None
+    """
+
+    globals_dict: dict
+    emsg: Optional[str]
+
+
+class CodejailError(Exception):
+    """
+    The service refused or failed to execute a request.
+    """
+
+    def __init__(self, message, status=None, body=None):
+        """
+        Record the HTTP status and decoded response body, if there was a response.
+        """
+        super().__init__(message)
+        self.status = status
+        self.body = body
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """
+    HTTP connection over a Unix domain socket.
+    """
+
+    def __init__(self, socket_path, **kwargs):
+        super().__init__('localhost', **kwargs)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def encode_multipart(fields, files):
+    """
+    Encode form fields and files as multipart/form-data.
+
+    Arguments:
+        fields: Dict of field names to strings
+        files: List of (field name, filename, bytes) triples
+
+    Returns a tuple of (content type, body bytes).
+    """
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'.encode('utf-8')
+            + value.encode('utf-8') + b'\r\n'
+        )
+    for name, filename, contents in files:
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            'Content-Type: application/octet-stream\r\n\r\n'.encode('utf-8')
+            + contents + b'\r\n'
+        )
+    parts.append(f'--{boundary}--\r\n'.encode('utf-8'))
+    return (f'multipart/form-data; boundary={boundary}', b''.join(parts))
+
+
+def _is_dropped(conn):
+    """
+    Return True if an idle connection has been closed by the server.
+
+    An idle keep-alive connection has nothing to read unless the server has
+    closed it (or sent something unexpected, making it unusable anyway).
+    """
+    if conn.sock is None:
+        return True
+    try:
+        (readable, _, _) = select.select([conn.sock], [], [], 0)
+    except (OSError, ValueError):
+        return True
+    return bool(readable)
+
+
+class _ConnectionPool:
+    """
+    Pool of keep-alive HTTP connections to one server.
+    """
+
+    def __init__(self, base_url, size, connect_timeout, read_timeout):
+        parts = urlsplit(base_url)
+        self.path_prefix = parts.path.rstrip('/')
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        if parts.scheme == 'unix':
+            # e.g. unix:/run/codejail/codejail.sock
+            self.path_prefix = ''
+            self._factory = lambda: _UnixHTTPConnection(parts.path, timeout=connect_timeout)
+        elif parts.scheme == 'https':
+            self._factory = lambda: http.client.HTTPSConnection(parts.netloc, timeout=connect_timeout)
+        elif parts.scheme == 'http':
+            self._factory = lambda: http.client.HTTPConnection(parts.netloc, timeout=connect_timeout)
+        else:
+            raise ValueError(f"Unsupported URL scheme in {base_url!r}")
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def request(self, path, content_type, body):
+        """
+        POST a body and return a tuple of (status, headers, body bytes).
+        """
+        headers = {'Content-Type': content_type, 'Content-Length': str(len(body))}
+        try:
+            conn, reused = self._idle.get_nowait(), True
+        except queue.Empty:
+            conn, reused = self._factory(), False
+        if reused and _is_dropped(conn):
+            conn.close()
+            conn, reused = self._factory(), False
+
+        try:
+            try:
+                self._send(conn, path, headers, body)
+            except STALE_CONNECTION_ERRORS:
+                if not reused:
+                    raise
+                conn.close()
+                conn = self._factory()
+                self._send(conn, path, headers, body)
+            # The request may run from here on, so failures are never retried
+            resp = conn.getresponse()
+            data = resp.read()
+        except BaseException:
+            conn.close()
+            raise
+
+        if resp.will_close:
+            conn.close()
+        else:
+            try:
+                self._idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+        return (resp.status, resp.headers, data)
+
+    def _send(self, conn, path, headers, body):
+        """
+        Write a request on a connection, without waiting for the response.
+        """
+        if conn.sock is None:
+            conn.connect()
+        conn.sock.settimeout(self.read_timeout)
+        conn.request('POST', self.path_prefix + path, body=body, headers=headers)
+
+    def close(self):
+        """
+        Close all idle connections.
+        """
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class CodejailClient:
+    """
+    Client for the code-exec API of a codejail-service instance.
+
+    Arguments:
+        base_url: Base URL of the service, e.g. ``http://codejail:8080``, or
+          ``unix:/path/to/socket`` for an instance serving on a Unix socket
+        connect_timeout: Seconds to wait for a connection
+        read_timeout: Seconds to wait for a response; should be at least the
+          sandbox's wall-clock limit (times the batch size, if batching)
+        pool_size: Maximum number of idle keep-alive connections to keep
+        max_retries: Retries after a 429 or 503 response. Other failures are
+          never retried, as the code may already have been executed.
+        backoff_base: Seconds of backoff before the first retry, doubling for
+          each further retry (with full jitter)
+        backoff_max: Maximum seconds of backoff before a retry
+        upload_by_hash: If True, a course library is uploaded only the first
+          time it is used; afterwards, only its hash is sent
+        batch_window: If set, calls made concurrently from different threads
+          within this many seconds of each other are combined into one batch
+          request (of at most ``max_batch``). This adds up to this much latency
+          to every call.
+        max_batch: Maximum number of calls in one batch request
+    """
+
+    def __init__(
+        self, base_url, *, connect_timeout=5.0, read_timeout=60.0, pool_size=4,
+        max_retries=3, backoff_base=0.5, backoff_max=10.0,
+        upload_by_hash=True, batch_window=None, max_batch=16,
+    ):
+        """
+        Create a client for the service at ``base_url``; see the class docstring for the arguments.
+        """
+        self._pool = _ConnectionPool(base_url, pool_size, connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.upload_by_hash = upload_by_hash
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._known_libraries = set()
+        self._batch_lock = threading.Lock()
+        self._pending = []
+
+    def execute(self, code, globals_dict, *, library=None, limit_overrides_context=None, slug=None):
+        """
+        Execute code and return an ExecResult.
+
+        Arguments:
+            code: Python code to execute
+            globals_dict: Dict of initial globals (must be JSON-serializable)
+            library: Bytes of a course library zip, made importable as ``python_lib.zip``
+            limit_overrides_context: Name of a set of resource limit overrides
+            slug: Identifier of the caller's context (e.g. problem ID), for monitoring
+
+        Raises CodejailError if the service refused or failed to execute the code.
+        """
+        params = {'code': code, 'globals_dict': globals_dict, 'slug': slug}
+        if limit_overrides_context is not None:
+            params['limit_overrides_context'] = limit_overrides_context
+        if library is not None:
+            params['python_path'] = [LIBRARY_FILENAME]
+            params['python_lib_sha256'] = hashlib.sha256(library).hexdigest()
+
+        if self.batch_window:
+            return self._execute_batched(params, library)
+        return self._execute_single(params, library)
+
+    def close(self):
+        """
+        Close idle connections.
+        """
+        self._pool.close()
+
+    def _execute_single(self, params, library):
+        """
+        Execute one request on the code-exec endpoint.
+        """
+        send_library = library is not None and not (
+            self.upload_by_hash and params['python_lib_sha256'] in self._known_libraries
+        )
+        status, headers, body = self._call('/api/v0/code-exec', params, [library] if send_library else [])
+        if status == 409 and library is not None and not send_library:
+            # The service doesn't have the library (any more, or this is a
+            # different host); upload it.
+            self._known_libraries.discard(params['python_lib_sha256'])
+            status, headers, body = self._call('/api/v0/code-exec', params, [library])
+        if status == 200 and library is not None:
+            self._learn_library(params['python_lib_sha256'], headers)
+        return _to_result(status, body)
+
+    def _learn_library(self, digest, headers):
+        """
+        Remember that the service has a library, if it stores libraries.
+        """
+        if headers.get(LIBRARY_STORE_HEADER) == 'enabled':
+            self._known_libraries.add(digest)
+
+    def _call(self, path, payload, libraries):
+        """
+        POST a payload and libraries, retrying on 429/503, and return a tuple of (status, headers, parsed body).
+        """
+        fields = {'payload': json.dumps(payload)}
+        if path.endswith('-batch'):
+            files = [(f'library{i}', LIBRARY_FILENAME, contents) for i, contents in enumerate(libraries)]
+        else:
+            files = [(LIBRARY_FILENAME, LIBRARY_FILENAME, contents) for contents in libraries]
+        content_type, body = encode_multipart(fields, files)
+
+        for attempt in range(self.max_retries + 1):
+            status, headers, data = self._pool.request(path, content_type, body)
+            if status not in RETRY_STATUSES or attempt == self.max_retries:
+                break
+            time.sleep(self._backoff(attempt, headers.get('Retry-After')))
+
+        try:
+            return (status, headers, json.loads(data))
+        except ValueError as e:
+            raise CodejailError(f"Unparseable response with status {status}", status=status, body=data) from e
+
+    def _backoff(self, attempt, retry_after):
+        """
+        Return the number of seconds to wait before the given retry attempt (0-based).
+
+        Uses "full jitter" exponential backoff, but waits at least as long as a
+        ``Retry-After`` header (in seconds) asks.
+        """
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        try:
+            delay = max(delay, float(retry_after))
+        except (TypeError, ValueError):
+            pass
+        return delay
+
+    def _execute_batched(self, params, library):
+        """
+        Queue a request to be sent in the next batch, and wait for its result.
+
+        The first caller to find no batch pending becomes the batch's leader:
+        it waits for the batch window, then sends everything queued by then.
+        """
+        future = Future()
+        with self._batch_lock:
+            self._pending.append((params, library, future))
+            leader = len(self._pending) == 1
+            full = len(self._pending) >= self.max_batch
+            if full:
+                batch, self._pending = self._pending, []
+
+        if full:
+            self._send_batch(batch)
+        elif leader:
+            time.sleep(self.batch_window)
+            with self._batch_lock:
+                batch, self._pending = self._pending, []
+            if batch:
+                self._send_batch(batch)
+        return future.result()
+
+    def _send_batch(self, batch):
+        """
+        Send queued requests and resolve their futures.
+        """
+        if len(batch) == 1:
+            params, library, future = batch[0]
+            _resolve(future, lambda: self._execute_single(params, library))
+            return
+
+        libraries = {}
+        for params, library, _ in batch:
+            if library is not None and params['python_lib_sha256'] not in self._known_libraries:
+                libraries[params['python_lib_sha256']] = library
+
+        try:
+            status, headers, body = self._call(
+                '/api/v0/code-exec-batch', {'requests': [params for params, _, _ in batch]}, list(libraries.values()),
+            )
+            if status != 200:
+                raise CodejailError(body.get('error', f"Batch failed with status {status}"), status=status, body=body)
+        except BaseException as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        for (params, library, future), result in zip(batch, body['results']):
+            if result['status'] == 409 and library is not None:
+                # Evicted between batches; retry this one with the library.
+                _resolve(future, lambda p=params, lib=library: self._execute_single(p, lib))
+                continue
+            if result['status'] in RETRY_STATUSES and self.max_retries:
+                # Not executed, such as for lack of a free execution slot while
+                # the rest of the batch ran; retry this one on its own.
+                _resolve(future, lambda p=params, lib=library: self._execute_single(p, lib))
+                continue
+            if result['status'] == 200 and library is not None:
+                self._learn_library(params['python_lib_sha256'], headers)
+            _resolve(future, lambda r=result: _to_result(r['status'], r['body']))
+
+
+def _resolve(future, fn):
+    """
+    Set a future's result to the return value of ``fn``, or its exception.
+    """
+    try:
+        future.set_result(fn())
+    except BaseException as e:
+        future.set_exception(e)
+
+
+def _to_result(status, body):
+    """
+    Convert a code-exec response into an ExecResult, or raise CodejailError.
+    """
+    if status != 200:
+        message = body.get('error') if isinstance(body, dict) else None
+        raise CodejailError(message or f"Request failed with status {status}", status=status, body=body)
+    return ExecResult(globals_dict=body['globals_dict'], emsg=body.get('emsg'))
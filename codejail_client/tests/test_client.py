@@ -0,0 +1,275 @@
+"""
+Tests for the codejail-service client, against a scripted local HTTP server.
+"""
+
+import hashlib
+import http.client
+import json
+import threading
+import unittest
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from codejail_client import CodejailClient, CodejailError, ExecResult
+
+LIBRARY = b'PK-not-really-a-zip'
+LIBRARY_SHA256 = hashlib.sha256(LIBRARY).hexdigest()
+
+
+def parse_form(content_type, body):
+    """
+    Return a tuple of (fields dict, files dict) from a multipart/form-data body.
+    """
+    message = BytesParser().parsebytes(f'Content-Type: {content_type}\r\n\r\n'.encode() + body)
+    fields, files = {}, {}
+    for part in message.get_payload():
+        name = part.get_param('name', header='content-disposition')
+        if part.get_param('filename', header='content-disposition'):
+            files[name] = part.get_payload(decode=True)
+        else:
+            fields[name] = part.get_payload(decode=True).decode()
+    return (fields, files)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    Records each request and replies with the next scripted response.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """
+        Record the request and send the response for it.
+        """
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        fields, files = parse_form(self.headers['Content-Type'], body)
+        server = self.server
+        with server.lock:
+            server.requests.append({
+                'path': self.path,
+                'payload': json.loads(fields['payload']),
+                'files': files,
+                'connection': self.client_address,
+            })
+            status, headers, reply = server.respond(self.path, json.loads(fields['payload']), files)
+
+        if status is None:
+            # As if the worker died while running the request
+            self.close_connection = True  # pylint: disable=attribute-defined-outside-init
+            return
+
+        data = json.dumps(reply).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+        if reply.get('close_after'):
+            # Close the connection while the client keeps it as idle
+            self.close_connection = True  # pylint: disable=attribute-defined-outside-init
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+class ClientTestBase(unittest.TestCase):
+    """
+    Runs a local server whose responses come from ``self.respond``.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.respond = self.respond
+        # Set once the server has closed a connection
+        self.server.closed = threading.Event()
+        shutdown_request = self.server.shutdown_request
+
+        def record_shutdown(request):
+            shutdown_request(request)
+            self.server.closed.set()
+        self.server.shutdown_request = record_shutdown
+        self.scripted = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.base_url = f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def respond(self, path, payload, files):  # pylint: disable=unused-argument
+        """
+        Return the next scripted (status, headers, body), or a success echoing the globals.
+        """
+        if self.scripted:
+            return self.scripted.pop(0)
+        return (200, {}, {'globals_dict': {**payload['globals_dict'], 'ran': True}})
+
+    def client(self, **kwargs):
+        kwargs.setdefault('backoff_base', 0.001)
+        client = CodejailClient(self.base_url, **kwargs)
+        self.addCleanup(client.close)
+        return client
+
+
+class TestCodejailClient(ClientTestBase):
+    """Test the client against a local scripted server."""
+
+    def test_execute(self):
+        client = self.client()
+        result = client.execute("x = 1", {'a': 1}, slug='hw1')
+        assert result == ExecResult(globals_dict={'a': 1, 'ran': True}, emsg=None)
+        assert client.execute("x = 1", {}) == ExecResult(globals_dict={'ran': True}, emsg=None)
+
+        assert len(self.server.requests) == 2
+        first = self.server.requests[0]
+        second = self.server.requests[1]
+        assert first['path'] == '/api/v0/code-exec'
+        assert first['payload'] == {'code': "x = 1", 'globals_dict': {'a': 1}, 'slug': 'hw1'}
+        # Connection was kept alive and reused
+        assert first['connection'] == second['connection']
+
+    def test_idle_connection_closed_by_server(self):
+        """A kept-alive connection that the server has since closed is replaced before use."""
+        self.scripted = [(200, {}, {'globals_dict': {}, 'close_after': True})]
+        client = self.client()
+        client.execute("x = 1", {})
+        assert self.server.closed.wait(5)
+        assert client.execute("x = 1", {}).globals_dict == {'ran': True}
+        assert len(self.server.requests) == 2
+        assert self.server.requests[0]['connection'] != self.server.requests[1]['connection']
+
+    def test_no_resend_after_request_received(self):
+        """If the connection is dropped after the request was sent, the request isn't sent again."""
+        self.scripted = [(200, {}, {'globals_dict': {}}), (None, {}, None)]
+        client = self.client()
+        client.execute("x = 1", {})
+        with pytest.raises(http.client.RemoteDisconnected):
+            client.execute("x = 1", {})
+        # The second request went out on the kept-alive connection, and only once
+        assert len(self.server.requests) == 2
+        assert self.server.requests[0]['connection'] == self.server.requests[1]['connection']
+
+    def test_code_error(self):
+        self.scripted = [(200, {}, {'globals_dict': {}, 'emsg': "ZeroDivisionError"})]
+        assert self.client().execute("1/0", {}) == ExecResult(globals_dict={}, emsg="ZeroDivisionError")
+
+    def test_retry_overloaded(self):
+        self.scripted = [
+            (503, {'Retry-After': '0'}, {'error': "busy"}),
+            (429, {}, {'error': "busy"}),
+        ]
+        assert self.client().execute("x = 1", {}).globals_dict == {'ran': True}
+        assert len(self.server.requests) == 3
+
+    def test_retries_exhausted(self):
+        self.scripted = [(503, {}, {'error': "busy"})] * 3
+        with pytest.raises(CodejailError) as exc_info:
+            self.client(max_retries=2).execute("x = 1", {})
+        assert exc_info.value.status == 503
+        assert len(self.server.requests) == 3
+
+    def test_no_retry_on_other_errors(self):
+        self.scripted = [(500, {}, {'error': "Codejail service not enabled"})]
+        with pytest.raises(CodejailError, match="not enabled") as exc_info:
+            self.client().execute("x = 1", {})
+        assert exc_info.value.status == 500
+        assert len(self.server.requests) == 1
+
+    def test_backoff(self):
+        client = self.client(backoff_base=1.0, backoff_max=4.0)
+        assert all(0 <= client._backoff(10, None) <= 4.0 for _ in range(50))  # pylint: disable=protected-access
+        assert client._backoff(0, '7') == 7.0  # pylint: disable=protected-access
+        assert client._backoff(0, 'Wed, 21 Oct 2026 07:28:00 GMT') <= 1.0  # pylint: disable=protected-access
+
+    def test_library_by_hash(self):
+        store_headers = {'X-Codejail-Library-Store': 'enabled'}
+        self.scripted = [
+            (200, store_headers, {'globals_dict': {}}),
+            (200, store_headers, {'globals_dict': {}}),
+            # The library was evicted
+            (409, store_headers, {'error': "Unknown library", 'missing_library_sha256': LIBRARY_SHA256}),
+            (200, store_headers, {'globals_dict': {}}),
+        ]
+        client = self.client()
+        for _ in range(3):
+            client.execute("import course_library", {}, library=LIBRARY)
+
+        assert [bool(r['files']) for r in self.server.requests] == [True, False, False, True]
+        assert self.server.requests[0]['files'] == {'python_lib.zip': LIBRARY}
+        assert all(r['payload']['python_lib_sha256'] == LIBRARY_SHA256 for r in self.server.requests)
+        assert all(r['payload']['python_path'] == ['python_lib.zip'] for r in self.server.requests)
+
+    def test_library_without_store(self):
+        """If the service doesn't store libraries, they're always uploaded."""
+        client = self.client()
+        for _ in range(2):
+            client.execute("import course_library", {}, library=LIBRARY)
+        assert [bool(r['files']) for r in self.server.requests] == [True, True]
+
+    def test_batching(self):
+        """Concurrent calls are combined into one batch request."""
+        def respond(path, payload, files):
+            assert path == '/api/v0/code-exec-batch'
+            assert list(files.values()) == [LIBRARY]
+            return (200, {}, {'results': [
+                {'status': 200, 'body': {'globals_dict': request['globals_dict']}}
+                for request in payload['requests']
+            ]})
+        self.server.respond = respond
+
+        client = self.client(batch_window=0.5)
+        results = {}
+
+        def call(i):
+            results[i] = client.execute("x = 1", {'i': i}, library=LIBRARY)
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(self.server.requests) == 1
+        assert results == {i: ExecResult(globals_dict={'i': i}, emsg=None) for i in range(3)}
+
+    def test_batch_of_one(self):
+        """A call that isn't joined by any others is sent on its own."""
+        client = self.client(batch_window=0.01)
+        assert client.execute("x = 1", {}).globals_dict == {'ran': True}
+        assert self.server.requests[0]['path'] == '/api/v0/code-exec'
+
+    def test_batch_entry_retried(self):
+        """Calls whose requests in a batch were refused as overloaded are retried on their own."""
+        def respond(path, payload, files):  # pylint: disable=unused-argument
+            if path == '/api/v0/code-exec':
+                return (200, {}, {'globals_dict': {**payload['globals_dict'], 'retried': True}})
+            return (200, {}, {'results': [
+                {'status': 503, 'body': {'error': "busy"}} if request['globals_dict']['i'] == 1
+                else {'status': 200, 'body': {'globals_dict': request['globals_dict']}}
+                for request in payload['requests']
+            ]})
+        self.server.respond = respond
+
+        client = self.client(batch_window=0.5)
+        results = {}
+
+        def call(i):
+            results[i] = client.execute("x = 1", {'i': i})
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert [r['path'] for r in self.server.requests] == ['/api/v0/code-exec-batch', '/api/v0/code-exec']
+        assert results == {
+            0: ExecResult(globals_dict={'i': 0}, emsg=None),
+            1: ExecResult(globals_dict={'i': 1, 'retried': True}, emsg=None),
+            2: ExecResult(globals_dict={'i': 2}, emsg=None),
+        }
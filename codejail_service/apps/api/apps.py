@@ -8,7 +8,9 @@ from codejail.django_integration_utils import apply_django_settings
 from django.apps import AppConfig
 from django.conf import settings
 
-from codejail_service.startup_check import run_startup_safety_check
+from codejail_service.import_profile import run_startup_import_profile
+from codejail_service.startup_check import is_exec_safe, run_startup_safety_check
+from codejail_service.supervisor_client import uses_supervisor, wait_for_supervisor
 
 log = logging.getLogger(__name__)
 
@@ -26,6 +28,16 @@ class CodejailApiConfig(AppConfig):
         # Codejail needs this at startup
         apply_django_settings(settings.CODE_JAIL)
 
+        # With a sandbox supervisor, the checks below run sandboxes through
+        # it, so give it a chance to finish starting up first.
+        if uses_supervisor():
+            wait_for_supervisor(settings.CODEJAIL_SUPERVISOR_STARTUP_WAIT)
+
         # Perform self-check and initialize status for healthcheck and
         # code-exec views to consult.
         run_startup_safety_check()
+
+        # Optionally measure sandbox library import times, so that
+        # regressions from dependency upgrades show up at deploy time.
+        if is_exec_safe():
+            run_startup_import_profile()
@@ -0,0 +1,97 @@
+"""
+Async variant of the code-exec endpoint, for serving under ASGI.
+
+The request is read and checked exactly as by ``views.code_exec``, and the
+response is the same. The difference is in waiting: the request waits for a
+free execution slot as a coroutine (see ``worker_concurrency``), and the
+sandbox runs on the worker's execution thread pool while the event loop goes
+on serving other requests.
+
+DRF views can't be async, so this is a plain Django view that uses DRF's
+request parsing and response rendering directly.
+"""
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponseNotAllowed
+from rest_framework.exceptions import APIException, NotAcceptable
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.request import Request
+from rest_framework.views import exception_handler
+
+from codejail_service.apps.api.v0.transport import PARSER_CLASSES, RENDERER_CLASSES
+from codejail_service.apps.api.v0.views import (
+    _check_available,
+    _read_request,
+    _refuse_supervisor_unavailable,
+    execution_response,
+    payload_validator,
+    prepare_execution,
+    run_execution
+)
+from codejail_service.supervisor_client import SupervisorUnavailable
+from codejail_service.worker_concurrency import WORKER_CONCURRENCY
+
+# The browsable API needs a DRF view to render.
+ASYNC_RENDERER_CLASSES = [cls for cls in RENDERER_CLASSES if not issubclass(cls, BrowsableAPIRenderer)]
+
+
+async def code_exec(request):
+    """
+    Executes code in a codejail sandbox for a remote caller, waiting for the sandbox asynchronously.
+
+    Accepts and returns the same as ``views.code_exec``, except that a request
+    arriving while the worker is running as many executions as it may waits
+    for one to finish, rather than being refused.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    drf_request = Request(request, parsers=[parser() for parser in PARSER_CLASSES])
+    (execution, response) = await sync_to_async(_prepare, thread_sensitive=False)(drf_request)
+    if execution is not None:
+        try:
+            (result, usage) = await WORKER_CONCURRENCY.run(run_execution, execution)
+        except SupervisorUnavailable as e:
+            response = _refuse_supervisor_unavailable(e)
+        else:
+            response = execution_response(execution, result, usage)
+
+    # Large globals can take a while to serialize
+    return await sync_to_async(_render, thread_sensitive=False)(drf_request, response)
+
+
+def _prepare(request):
+    """
+    Read and check a code-exec request.
+
+    Returns a tuple of (Execution, error response), exactly one of which is None.
+    """
+    try:
+        if (unavailable := _check_available()) is not None:
+            return (None, unavailable)
+
+        (params, params_json, extra_files, error_response) = _read_request(request, payload_validator)
+        if error_response is not None:
+            return (None, error_response)
+
+        return prepare_execution(params, params_json, extra_files)
+    except APIException as e:
+        # Such as a malformed body; handled as DRF's views would
+        return (None, exception_handler(e, {'request': request}))
+
+
+def _render(request, response):
+    """
+    Render a response in the encoding the request asked for, as DRF's views do.
+    """
+    renderers = [renderer() for renderer in ASYNC_RENDERER_CLASSES]
+    try:
+        (renderer, media_type) = request.negotiator.select_renderer(request, renderers)
+    except NotAcceptable as e:
+        response = exception_handler(e, {'request': request})
+        (renderer, media_type) = (renderers[0], renderers[0].media_type)
+
+    response.accepted_renderer = renderer
+    response.accepted_media_type = media_type
+    response.renderer_context = {'request': request, 'response': response}
+    return response.render()
@@ -0,0 +1,179 @@
+"""
+Limits on the size and complexity of code-exec requests.
+
+These are checked before the request is fully materialized, so that an
+oversized request is refused without tying up the worker:
+
+- The body size is checked against ``Content-Length`` before the body is read.
+- A JSON payload is scanned for nesting depth, key count, code length, and
+  globals size before it is parsed. The scan only tokenizes strings and
+  brackets, in time linear in the payload's length, and stops at the first
+  limit exceeded.
+- A MessagePack body can't be scanned without decoding it, but the decoder
+  refuses maps with too many keys as it goes, and the decoded payload is
+  checked before validation.
+
+Each limit is configured by a setting, and disabled if that setting is None.
+Lengths of code and globals are measured in the request's encoding.
+"""
+
+import re
+
+from django.conf import settings
+from rest_framework.exceptions import APIException
+
+# Start of the next string or bracket.
+_JSON_TOKEN_START_RE = re.compile(r'["\[{\]}]')
+# Rest of a string after its opening quote.
+_JSON_STRING_REST_RE = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"')
+# Colon following a string that is an object key.
+_JSON_COLON_RE = re.compile(r'\s*:')
+
+
+class RequestTooLarge(APIException):
+    """
+    A request exceeded one of the size or complexity limits.
+
+    ``limit`` is the name of the limit that was exceeded: one of ``body``,
+    ``code``, ``globals``, ``depth``, or ``keys``.
+    """
+    status_code = 413
+    default_code = 'too_large'
+
+    def __init__(self, limit, detail):
+        super().__init__(detail)
+        self.limit = limit
+
+
+def check_content_length(request):
+    """
+    Raise RequestTooLarge if the request declares a body over ``CODEJAIL_MAX_REQUEST_BYTES``.
+    """
+    max_bytes = settings.CODEJAIL_MAX_REQUEST_BYTES
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return
+    if max_bytes is not None and length > max_bytes:
+        raise RequestTooLarge('body', f"Request body is {length} bytes; the limit is {max_bytes}")
+
+
+def _json_tokens(text):
+    """
+    Yield a tuple of (start, token end, end, is key) for each string and bracket in a JSON text.
+
+    The token end excludes, and the end includes, the colon following an
+    object key. Each string is passed over exactly once, so the scan takes
+    time linear in the length of the text. An unterminated string ends the
+    scan, since the text can't be valid JSON (and so will fail to parse).
+    """
+    pos = 0
+    while (match := _JSON_TOKEN_START_RE.search(text, pos)) is not None:
+        start = match.start()
+        if text[start] != '"':
+            pos = start + 1
+            yield (start, pos, pos, False)
+            continue
+
+        string = _JSON_STRING_REST_RE.match(text, start + 1)
+        if string is None:
+            return
+        token_end = pos = string.end()
+        if colon := _JSON_COLON_RE.match(text, pos):
+            pos = colon.end()
+        yield (start, token_end, pos, colon is not None)
+
+
+def check_payload_json(payload_json, payload_depth=1):
+    """
+    Raise RequestTooLarge if a payload JSON string exceeds any of the limits.
+
+    Arguments:
+        payload_json: The payload, as a JSON string (not yet parsed)
+        payload_depth: Nesting depth of the code-exec payload objects, whose
+          ``code`` and ``globals_dict`` values are measured. 1 for the payload
+          of a single request, 3 for those inside a batch.
+    """
+    max_depth = settings.CODEJAIL_MAX_PAYLOAD_DEPTH
+    max_keys = settings.CODEJAIL_MAX_PAYLOAD_KEYS
+    max_code = settings.CODEJAIL_MAX_CODE_BYTES
+    max_globals = settings.CODEJAIL_MAX_GLOBALS_BYTES
+
+    depth = 0
+    keys = 0
+    # Name of a payload key whose value is the next token
+    value_of = None
+    # Offset of the start of a globals_dict value currently being scanned
+    globals_start = None
+
+    for (start, token_end, end, is_key) in _json_tokens(payload_json):
+        first = payload_json[start]
+        (prev_value_of, value_of) = (value_of, None)
+
+        if globals_start is not None and max_globals is not None and end - globals_start > max_globals:
+            raise RequestTooLarge('globals', f"globals_dict exceeds the limit of {max_globals} bytes")
+
+        if is_key:
+            keys += 1
+            if max_keys is not None and keys > max_keys:
+                raise RequestTooLarge('keys', f"Payload has more than {max_keys} object keys")
+            if depth == payload_depth:
+                value_of = payload_json[start:token_end]
+        elif first == '"':
+            if prev_value_of == '"code"' and max_code is not None and token_end - start - 2 > max_code:
+                raise RequestTooLarge('code', f"Code exceeds the limit of {max_code} bytes")
+        elif first in '[{':
+            depth += 1
+            if max_depth is not None and depth > max_depth:
+                raise RequestTooLarge('depth', f"Payload is nested more than {max_depth} levels deep")
+            if prev_value_of == '"globals_dict"':
+                globals_start = start
+        else:
+            if depth == payload_depth + 1:
+                globals_start = None
+            depth -= 1
+
+
+def check_payload(params, payload_depth, encoded_size):
+    """
+    Raise RequestTooLarge if an already-decoded payload exceeds any of the limits.
+
+    Arguments:
+        params: The decoded payload
+        payload_depth: As for ``check_payload_json``
+        encoded_size: Function returning the size in bytes of a value in the
+          request's encoding, used to measure globals
+    """
+    max_depth = settings.CODEJAIL_MAX_PAYLOAD_DEPTH
+    max_keys = settings.CODEJAIL_MAX_PAYLOAD_KEYS
+    max_code = settings.CODEJAIL_MAX_CODE_BYTES
+    max_globals = settings.CODEJAIL_MAX_GLOBALS_BYTES
+
+    keys = 0
+    # Iterative, since the point is to be safe against deep nesting
+    stack = [(params, 0)]
+    while stack:
+        (value, depth) = stack.pop()
+        if isinstance(value, dict):
+            children = value.values()
+            keys += len(value)
+            if max_keys is not None and keys > max_keys:
+                raise RequestTooLarge('keys', f"Payload has more than {max_keys} object keys")
+        elif isinstance(value, list):
+            children = value
+        else:
+            continue
+
+        depth += 1
+        if max_depth is not None and depth > max_depth:
+            raise RequestTooLarge('depth', f"Payload is nested more than {max_depth} levels deep")
+
+        if depth == payload_depth and isinstance(value, dict):
+            code = value.get('code')
+            if isinstance(code, str) and max_code is not None and len(code.encode()) > max_code:
+                raise RequestTooLarge('code', f"Code exceeds the limit of {max_code} bytes")
+            globals_dict = value.get('globals_dict')
+            if max_globals is not None and globals_dict is not None and encoded_size(globals_dict) > max_globals:
+                raise RequestTooLarge('globals', f"globals_dict exceeds the limit of {max_globals} bytes")
+
+        stack.extend((child, depth) for child in children)
@@ -0,0 +1,124 @@
+"""
+Test the async code-exec view.
+"""
+
+import asyncio
+import json
+import threading
+from unittest.mock import patch
+
+import codejail.safe_exec
+from django.core.handlers.asgi import ASGIHandler
+from django.test import AsyncClient, TestCase, override_settings
+
+from codejail_service import startup_check
+from codejail_service.apps.api.v0 import views
+from codejail_service.worker_concurrency import WorkerConcurrency
+
+ENDPOINT = '/api/v0/code-exec-async'
+
+
+@override_settings(
+    ROOT_URLCONF='codejail_service.urls',
+    CODEJAIL_ENABLED=True,
+)
+class TestAsyncExecService(TestCase):
+    """Test the async variant of the code exec view."""
+
+    def setUp(self):
+        super().setUp()
+        # As in the tests of the sync view: pretend the sandbox is working, and
+        # run code in-process.
+        startup_check.STARTUP_SAFETY_CHECK_OK = True
+        codejail.safe_exec.ALWAYS_BE_UNSAFE = True
+        self.client = AsyncClient()
+        patcher = patch('codejail_service.apps.api.v0.async_views.WORKER_CONCURRENCY', WorkerConcurrency())
+        self.concurrency = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        super().tearDown()
+        startup_check.STARTUP_SAFETY_CHECK_OK = None
+        codejail.safe_exec.ALWAYS_BE_UNSAFE = False
+
+    async def _post(self, params):
+        return await self.client.post(ENDPOINT, {'payload': json.dumps(params)})
+
+    async def test_success(self):
+        resp = await self._post({'code': 'retval = 3 + 4', 'globals_dict': {}})
+        assert resp.status_code == 200
+        assert json.loads(resp.content) == {'globals_dict': {'retval': 7}}
+
+    async def test_error(self):
+        resp = await self._post({'code': 'raise Exception("oops")', 'globals_dict': {'x': 1}})
+        assert resp.status_code == 200
+        body = json.loads(resp.content)
+        assert body['globals_dict'] == {'x': 1}
+        assert 'oops' in body['emsg']
+
+    async def test_refusals(self):
+        """Requests are checked just as by the sync view."""
+        resp = await self.client.post(ENDPOINT, {})
+        assert resp.status_code == 400
+        assert json.loads(resp.content) == {'error': "Missing 'payload' parameter in POST body"}
+
+        resp = await self._post({'code': 'x = 1', 'globals_dict': {}, 'unsafely': True})
+        assert resp.status_code == 400
+        assert json.loads(resp.content) == {'error': "Refusing codejail execution with unsafely=true"}
+
+    @override_settings(CODEJAIL_ENABLED=False)
+    async def test_disabled(self):
+        resp = await self._post({'code': 'x = 1', 'globals_dict': {}})
+        assert resp.status_code == 500
+
+    async def test_malformed_body(self):
+        resp = await self.client.post(
+            ENDPOINT, b'--nope\r\n', content_type='multipart/form-data; boundary=x',
+        )
+        assert resp.status_code == 400
+
+    async def test_not_post(self):
+        resp = await self.client.get(ENDPOINT)
+        assert resp.status_code == 405
+
+    @override_settings(CODEJAIL_WORKER_CONCURRENCY=1)
+    async def test_waits_for_slot(self):
+        """
+        Requests over the limit wait for a slot, and health checks are answered in the meantime.
+        """
+        release = threading.Event()
+        real_run_execution = views.run_execution
+
+        def slow_run_execution(execution):
+            release.wait(5)
+            return real_run_execution(execution)
+
+        with patch('codejail_service.apps.api.v0.async_views.run_execution', slow_run_execution):
+            requests = [
+                asyncio.ensure_future(self._post({'code': f'retval = {n}', 'globals_dict': {}}))
+                for n in range(3)
+            ]
+            for _ in range(500):
+                if self.concurrency.report()['waiting'] == 2:
+                    break
+                await asyncio.sleep(0.01)
+            assert self.concurrency.report()['waiting'] == 2
+            assert self.concurrency.in_flight == 1
+
+            health = await asyncio.wait_for(self.client.get('/health/'), 5)
+            assert health.status_code == 200
+
+            release.set()
+            responses = await asyncio.gather(*requests)
+
+        assert [json.loads(resp.content) for resp in responses] == [
+            {'globals_dict': {'retval': n}} for n in range(3)
+        ]
+        assert self.concurrency.report()['peak'] == 1
+
+
+class TestAsgiApplication(TestCase):
+
+    def test_application(self):
+        from codejail_service.asgi import application  # pylint: disable=import-outside-toplevel
+        assert isinstance(application, ASGIHandler)
@@ -0,0 +1,98 @@
+"""
+Tests for request size and complexity limits.
+"""
+
+import json
+import time
+
+import ddt
+import pytest
+from django.test import TestCase, override_settings
+
+from codejail_service.apps.api.v0.limits import RequestTooLarge, check_payload, check_payload_json
+
+LIMITS = {
+    'CODEJAIL_MAX_CODE_BYTES': 20,
+    'CODEJAIL_MAX_GLOBALS_BYTES': 100,
+    'CODEJAIL_MAX_PAYLOAD_DEPTH': 5,
+    'CODEJAIL_MAX_PAYLOAD_KEYS': 10,
+}
+
+
+def nested(depth):
+    """
+    Return a value with lists nested ``depth`` deep.
+    """
+    value = 1
+    for _ in range(depth):
+        value = [value]
+    return value
+
+
+@ddt.ddt
+@override_settings(**LIMITS)
+class TestLimits(TestCase):
+    """Test the request size and complexity checks."""
+
+    def assert_both(self, payload, limit, payload_depth=1):
+        """
+        Assert that the payload is refused for the given limit (or accepted, if None) in both checks.
+        """
+        checks = [
+            lambda: check_payload_json(json.dumps(payload), payload_depth),
+            lambda: check_payload(payload, payload_depth, encoded_size=lambda value: len(json.dumps(value))),
+        ]
+        for check in checks:
+            if limit is None:
+                check()
+            else:
+                with pytest.raises(RequestTooLarge) as exc_info:
+                    check()
+                assert exc_info.value.limit == limit
+                assert exc_info.value.status_code == 413
+
+    @ddt.data(
+        ({'code': "x = 1", 'globals_dict': {'a': [1, 2, "three"]}}, None),
+        ({'code': "x = 1" * 10, 'globals_dict': {}}, 'code'),
+        ({'code': "x = 1", 'globals_dict': {'a': "x" * 200}}, 'globals'),
+        ({'code': "x = 1", 'globals_dict': {'a': nested(4)}}, 'depth'),
+        ({'code': "x = 1", 'globals_dict': {str(i): i for i in range(10)}}, 'keys'),
+        # Keys named like payload keys are only measured at the payload level
+        ({'code': "x = 1", 'globals_dict': {'code': "x" * 50}}, None),
+        # Schema mismatches are left for the schema check
+        ({'code': ["x" * 50], 'globals_dict': 5}, None),
+    )
+    @ddt.unpack
+    def test_single(self, payload, limit):
+        self.assert_both(payload, limit)
+
+    @ddt.data(
+        ({'requests': [{'code': "x", 'globals_dict': {}}] * 2}, None),
+        ({'requests': [{'code': "x", 'globals_dict': {}}, {'code': "x" * 30, 'globals_dict': {}}]}, 'code'),
+        ({'requests': [{'code': "x", 'globals_dict': {'a': "x" * 200}}]}, 'globals'),
+    )
+    @ddt.unpack
+    def test_batch(self, payload, limit):
+        self.assert_both(payload, limit, payload_depth=3)
+
+    def test_escaped_strings(self):
+        """Brackets and escaped quotes inside strings aren't mistaken for structure."""
+        check_payload_json(json.dumps({'code': '"[[[[[[\\"{{{{{{', 'globals_dict': {}}))
+
+    def test_unterminated_strings(self):
+        """Unterminated strings full of escaped quotes are scanned in linear time, not rescanned from each quote."""
+        for payload_json in [
+            '"' + '\\"' * 500_000,
+            '{"code": "' + '\\"' * 500_000,
+            '[[["' + '\\"' * 500_000,
+        ]:
+            start = time.monotonic()
+            check_payload_json(payload_json)
+            assert time.monotonic() - start < 2
+
+    @override_settings(
+        CODEJAIL_MAX_CODE_BYTES=None, CODEJAIL_MAX_GLOBALS_BYTES=None,
+        CODEJAIL_MAX_PAYLOAD_DEPTH=None, CODEJAIL_MAX_PAYLOAD_KEYS=None,
+    )
+    def test_disabled(self):
+        self.assert_both({'code': "x" * 50, 'globals_dict': {str(i): nested(20) for i in range(20)}}, None)
@@ -2,19 +2,28 @@
 Test codejail service views.
 """
 
+import hashlib
 import io
 import json
 import math
+import sys
+import tempfile
 import textwrap
+import threading
 from os import path
 from unittest.mock import call, patch
 
 import codejail.safe_exec
 import ddt
+import pytest
 from django.test import TestCase, override_settings
 from rest_framework.test import APIClient
 
 from codejail_service import startup_check
+from codejail_service.apps.api.v0 import views
+from codejail_service.apps.api.v0.transport import msgpack
+from codejail_service.circuit_breaker import CircuitBreaker
+from codejail_service.supervisor_client import SupervisorUnavailable
 
 
 @override_settings(
@@ -116,6 +125,24 @@ class TestExecService(TestCase):
             call('codejail.exec.status', 'executed.success'),
         ]
 
+    @override_settings(CODEJAIL_USAGE_RESPONSE_HEADER=True)
+    def test_usage_header(self):
+        """Resource usage can be reported in a response header."""
+        client = APIClient()
+        resp = client.post(
+            '/api/v0/code-exec', {'payload': json.dumps(self.standard_params)}, format='multipart',
+        )
+        assert resp.status_code == 200
+        assert resp['X-Codejail-Usage'].startswith('cpu_user=')
+
+    def test_no_usage_header_by_default(self):
+        client = APIClient()
+        resp = client.post(
+            '/api/v0/code-exec', {'payload': json.dumps(self.standard_params)}, format='multipart',
+        )
+        assert resp.status_code == 200
+        assert 'X-Codejail-Usage' not in resp
+
     def test_unsafely(self):
         """unsafely=true is rejected"""
         self._test_codejail_api(
@@ -229,6 +256,15 @@ class TestExecService(TestCase):
         )
         mock_set_custom_attribute.assert_any_call('codejail.exec.status', 'executed.error')
 
+    @ddt.data({}, {'scientific': {'modules': ['numpy']}})
+    def test_deeply_nested_code(self, warm_pools):
+        """Code too deeply nested for the parser is reported by the sandbox, rather than failing the request."""
+        params = {'code': "from __future__ import division\nx = 1" + "+1" * 100000, 'globals_dict': {}}
+        with override_settings(CODEJAIL_WARM_POOLS=warm_pools):
+            resp = APIClient().post('/api/v0/code-exec', {'payload': json.dumps(params)}, format='multipart')
+        assert resp.status_code == 200
+        assert json.loads(resp.content)['emsg']
+
     @patch('codejail_service.apps.api.v0.views.set_custom_attribute')
     def test_can_pass_limit_override(self, mock_set_custom_attribute):
         """Test that limit override is accepted."""
@@ -245,6 +281,71 @@ class TestExecService(TestCase):
             'codejail.exec.limit_override', 'xxxxxxx some junk xxxxxxxx',
         )
 
+    @override_settings(CODEJAIL_CIRCUIT_BREAKER_THRESHOLD=2)
+    @patch('codejail_service.apps.api.v0.views.set_custom_attribute')
+    def test_circuit_breaker(self, mock_set_custom_attribute):
+        """Code that keeps getting killed is short-circuited with the cached error."""
+        killed = "Couldn't execute jailed code: stdout: b'', stderr: b'' with status code: -9"
+        params = {'code': 'while True: pass', 'globals_dict': {'x': 1}}
+
+        with (
+                patch.object(views, 'CIRCUIT_BREAKER', CircuitBreaker(threshold=2, window=60, cooldown=60)),
+                patch.object(views, 'safe_exec', return_value=({'x': 1}, killed)) as mock_safe_exec,
+        ):
+            for _ in range(3):
+                self._test_codejail_api(
+                    params=params, exp_status=200, exp_body={'globals_dict': {'x': 1}, 'emsg': killed},
+                )
+
+        assert mock_safe_exec.call_count == 2
+        assert mock_set_custom_attribute.call_args_list[-1] == call('codejail.exec.status', 'rejected.circuit_open')
+
+    @override_settings(CODEJAIL_MIN_NPROC_HEADROOM=5, CODEJAIL_PROCESS_WATCHDOG_INTERVAL=10)
+    @patch('codejail_service.apps.api.v0.views.set_custom_attribute')
+    def test_nproc_headroom(self, mock_set_custom_attribute):
+        """Executions are refused when the sandbox user is close to its process limit."""
+        with patch.object(views.SANDBOX_PROCESSES, 'headroom', return_value=4):
+            client = APIClient()
+            resp = client.post('/api/v0/code-exec', {'payload': json.dumps(self.standard_params)}, format='multipart')
+
+        assert resp.status_code == 503
+        assert resp['Retry-After'] == '10'
+        mock_set_custom_attribute.assert_has_calls([
+            call('codejail.exec.nproc_headroom', 4),
+            call('codejail.exec.status', 'rejected.nproc_headroom'),
+        ])
+
+        with patch.object(views.SANDBOX_PROCESSES, 'headroom', return_value=5):
+            self._test_codejail_api(exp_status=200, exp_body={'globals_dict': {'retval': 7}})
+
+    @override_settings(CODEJAIL_WORKER_CONCURRENCY=1)
+    @patch('codejail_service.apps.api.v0.views.set_custom_attribute')
+    def test_worker_capacity(self, mock_set_custom_attribute):
+        """Executions are refused while the worker is running as many as it may."""
+        with views.WORKER_CONCURRENCY.slot():
+            client = APIClient()
+            resp = client.post('/api/v0/code-exec', {'payload': json.dumps(self.standard_params)}, format='multipart')
+
+        assert resp.status_code == 503
+        assert resp['Retry-After'] == '1'
+        assert mock_set_custom_attribute.call_args_list[-1] == call('codejail.exec.status', 'rejected.capacity')
+
+        self._test_codejail_api(exp_status=200, exp_body={'globals_dict': {'retval': 7}})
+
+    @patch('codejail_service.apps.api.v0.views.set_custom_attribute')
+    def test_supervisor_unavailable(self, mock_set_custom_attribute):
+        """Executions that the sandbox supervisor doesn't run are refused."""
+        with patch(
+                'codejail_service.apps.api.v0.views.safe_exec',
+                side_effect=SupervisorUnavailable('busy', "Sandbox supervisor queue is full"),
+        ):
+            client = APIClient()
+            resp = client.post('/api/v0/code-exec', {'payload': json.dumps(self.standard_params)}, format='multipart')
+
+        assert resp.status_code == 503
+        assert resp['Retry-After'] == '1'
+        assert mock_set_custom_attribute.call_args_list[-1] == call('codejail.exec.status', 'rejected.supervisor_busy')
+
     def test_accept_float_specials(self):
         """
         We can accept and return NaN/Infinity in JSON.
@@ -267,3 +368,240 @@ class TestExecService(TestCase):
 
         assert math.isnan(resp_json['globals_dict']['out_special'])
         assert 'emsg' not in resp_json
+
+    def _library(self):
+        """
+        Return the bytes of the test course library and its digest.
+        """
+        with open(path.join(path.dirname(__file__), 'test_course_library.zip'), 'rb') as f:
+            contents = f.read()
+        return (contents, hashlib.sha256(contents).hexdigest())
+
+    def test_library_by_hash(self):
+        """A library uploaded once can then be referred to by hash."""
+        contents, digest = self._library()
+        params = {
+            'code': "from course_library import triangular_number\nresult = triangular_number(6)",
+            'globals_dict': {},
+            'python_path': ['python_lib.zip'],
+            'python_lib_sha256': digest,
+        }
+
+        with tempfile.TemporaryDirectory() as store_dir, override_settings(CODEJAIL_LIBRARY_STORE_DIR=store_dir):
+            # Not known yet
+            self._test_codejail_api(
+                params=params, exp_status=409,
+                exp_body={'error': "Unknown library; resend with the file", 'missing_library_sha256': digest},
+            )
+            # Upload...
+            self._test_codejail_api(
+                params=params, files={'python_lib.zip': io.BytesIO(contents)},
+                exp_status=200, exp_body={'globals_dict': {'result': 21}},
+            )
+            # ...and then the hash is enough.
+            with patch('codejail_service.apps.api.v0.views.set_custom_attribute') as mock_set_custom_attribute:
+                self._test_codejail_api(params=params, exp_status=200, exp_body={'globals_dict': {'result': 21}})
+            mock_set_custom_attribute.assert_any_call('codejail.exec.library_source', 'store')
+
+    def test_library_store_header(self):
+        """Callers are told when the library store is enabled."""
+        client = APIClient()
+        resp = client.post('/api/v0/code-exec', {'payload': json.dumps(self.standard_params)}, format='multipart')
+        assert 'X-Codejail-Library-Store' not in resp
+
+        with tempfile.TemporaryDirectory() as store_dir, override_settings(CODEJAIL_LIBRARY_STORE_DIR=store_dir):
+            resp = client.post(
+                '/api/v0/code-exec', {'payload': json.dumps(self.standard_params)}, format='multipart',
+            )
+        assert resp['X-Codejail-Library-Store'] == 'enabled'
+
+    def test_extracted_library(self):
+        """Course libraries can be imported from a pre-extracted directory instead of the zip."""
+        contents, digest = self._library()
+        saved_path = list(sys.path)
+        self.addCleanup(setattr, sys, 'path', saved_path)
+        self.addCleanup(sys.modules.pop, 'course_library', None)
+        # codejail's unsafe mode leaves the python path of earlier tests on sys.path
+        sys.path = [entry for entry in saved_path if entry != 'python_lib.zip']
+        code = textwrap.dedent("""
+            import sys
+            sys.modules.pop('course_library', None)
+            import course_library
+            location = course_library.__file__
+            result = course_library.triangular_number(6)
+        """)
+
+        with tempfile.TemporaryDirectory() as root, override_settings(CODEJAIL_LIBRARY_EXTRACT_DIR=root):
+            self._test_codejail_api(
+                params={'code': code, 'globals_dict': {}, 'python_path': ['python_lib.zip']},
+                files={'python_lib.zip': io.BytesIO(contents)},
+                exp_status=200,
+                exp_body={'globals_dict': {
+                    'location': path.join(root, digest, 'course_library.py'),
+                    'result': 21,
+                }},
+            )
+
+    def test_library_hash_mismatch(self):
+        """An uploaded library must match the hash given for it."""
+        self._test_codejail_api(
+            params={**self.standard_params, 'python_lib_sha256': 'f' * 64},
+            files={'python_lib.zip': io.BytesIO(self._library()[0])},
+            exp_status=400, exp_body={'error': "Uploaded library does not match python_lib_sha256"},
+        )
+
+    @patch('codejail_service.apps.api.v0.views.set_custom_attribute')
+    def test_bad_library(self, mock_set_custom_attribute):
+        """Uploaded libraries that aren't valid zip files are refused before execution."""
+        with patch('codejail_service.apps.api.v0.views.safe_exec') as mock_safe_exec:
+            self._test_codejail_api(
+                files={'python_lib.zip': io.BytesIO(b'TESTING')},
+                exp_status=400, exp_body={'error': "Library is not a valid zip archive: File is not a zip file"},
+            )
+        mock_safe_exec.assert_not_called()
+        mock_set_custom_attribute.assert_called_with('codejail.exec.status', 'invalid.library.bad_archive')
+
+    # In-process executions change directory, so they can't run concurrently
+    @override_settings(CODEJAIL_WORKER_CONCURRENCY=1)
+    def test_batch(self):
+        """Several requests can be executed in one call, with shared libraries."""
+        contents, digest = self._library()
+        batch = {'requests': [
+            self.standard_params,
+            {'code': '1/0', 'globals_dict': {}},
+            {'globals_dict': {}},
+            {
+                'code': "from course_library import triangular_number\nresult = triangular_number(3)",
+                'globals_dict': {},
+                'python_path': ['python_lib.zip'],
+                'python_lib_sha256': digest,
+            },
+        ]}
+
+        client = APIClient()
+        with patch('codejail_service.apps.api.v0.views.set_custom_attribute') as mock_set_custom_attribute:
+            resp = client.post(
+                '/api/v0/code-exec-batch',
+                {'payload': json.dumps(batch), 'anything': io.BytesIO(contents)},
+                format='multipart',
+            )
+
+        assert resp.status_code == 200
+        assert json.loads(resp.content) == {'results': [
+            {'status': 200, 'body': {'globals_dict': {'retval': 7}}},
+            {'status': 200, 'body': {'globals_dict': {}, 'emsg': 'ZeroDivisionError: division by zero'}},
+            {'status': 400, 'body': {
+                'error': "Payload JSON did not match schema at path $: 'code' is a required property",
+            }},
+            {'status': 200, 'body': {'globals_dict': {'result': 6}}},
+        ]}
+        mock_set_custom_attribute.assert_any_call('codejail.batch.size', 4)
+        mock_set_custom_attribute.assert_any_call('codejail.exec.library_source', 'batch')
+
+    @override_settings(CODEJAIL_WORKER_CONCURRENCY=2)
+    def test_batch_concurrent(self):
+        """The requests of a batch are executed concurrently, up to the worker's limit."""
+        both_running = threading.Barrier(2, timeout=5)
+
+        def fake_safe_exec(code, globals_dict, **kwargs):  # pylint: disable=unused-argument
+            both_running.wait()
+            return ({**globals_dict, 'thread': threading.current_thread().name}, None)
+
+        batch = {'requests': [{'code': 'x = 1', 'globals_dict': {'i': i}} for i in range(2)]}
+        with patch('codejail_service.apps.api.v0.views.safe_exec', fake_safe_exec):
+            resp = APIClient().post('/api/v0/code-exec-batch', {'payload': json.dumps(batch)}, format='multipart')
+
+        assert resp.status_code == 200
+        results = json.loads(resp.content)['results']
+        assert [r['status'] for r in results] == [200, 200]
+        # In order, and each on a thread of its own
+        assert [r['body']['globals_dict']['i'] for r in results] == [0, 1]
+        assert len({r['body']['globals_dict']['thread'] for r in results}) == 2
+
+    @override_settings(CODEJAIL_BATCH_MAX_REQUESTS=2)
+    def test_batch_too_large(self):
+        client = APIClient()
+        resp = client.post(
+            '/api/v0/code-exec-batch',
+            {'payload': json.dumps({'requests': [self.standard_params] * 3})},
+            format='multipart',
+        )
+        assert resp.status_code == 400
+        assert json.loads(resp.content) == {'error': "Batch may contain at most 2 requests"}
+
+    @override_settings(CODEJAIL_MAX_REQUEST_BYTES=1000)
+    @patch('codejail_service.apps.api.v0.views.set_custom_attribute')
+    def test_body_too_large(self, mock_set_custom_attribute):
+        """Requests are refused by declared size, before the body is parsed."""
+        params = {'code': "x = 1", 'globals_dict': {'data': "x" * 1000}}
+        with patch('codejail_service.apps.api.v0.views.check_payload_json') as mock_check:
+            resp = APIClient().post('/api/v0/code-exec', {'payload': json.dumps(params)}, format='multipart')
+
+        assert resp.status_code == 413
+        assert "the limit is 1000" in json.loads(resp.content)['error']
+        mock_check.assert_not_called()
+        mock_set_custom_attribute.assert_called_with('codejail.exec.status', 'invalid.too_large.body')
+
+    @ddt.data(
+        ({'CODEJAIL_MAX_CODE_BYTES': 10}, {'code': "x = 1" * 10, 'globals_dict': {}}, 'code'),
+        ({'CODEJAIL_MAX_GLOBALS_BYTES': 10}, {'code': "x = 1", 'globals_dict': {'a': "x" * 10}}, 'globals'),
+        ({'CODEJAIL_MAX_PAYLOAD_DEPTH': 3}, {'code': "x = 1", 'globals_dict': {'a': [[1]]}}, 'depth'),
+        ({'CODEJAIL_MAX_PAYLOAD_KEYS': 3}, {'code': "x = 1", 'globals_dict': {'a': 1, 'b': 2}}, 'keys'),
+    )
+    @ddt.unpack
+    @patch('codejail_service.apps.api.v0.views.set_custom_attribute')
+    def test_payload_too_complex(self, limits, params, limit, mock_set_custom_attribute):
+        """Oversized or overly complex payloads are refused before being parsed."""
+        with (
+            override_settings(**limits),
+            patch('codejail_service.apps.api.v0.views._parse_payload') as mock_parse,
+        ):
+            client = APIClient()
+            resp = client.post('/api/v0/code-exec', {'payload': json.dumps(params)}, format='multipart')
+
+        assert resp.status_code == 413
+        mock_parse.assert_not_called()
+        mock_set_custom_attribute.assert_called_with('codejail.exec.status', f'invalid.too_large.{limit}')
+
+    @pytest.mark.skipif(msgpack is None, reason="msgpack not installed")
+    @override_settings(CODEJAIL_MAX_PAYLOAD_KEYS=3)
+    def test_msgpack_too_complex(self):
+        body = msgpack.packb({'payload': {'code': "x = 1", 'globals_dict': {'a': 1, 'b': 2}}})
+        resp = APIClient().post('/api/v0/code-exec', body, content_type='application/msgpack')
+        assert resp.status_code == 413
+        assert json.loads(resp.content) == {'error': "Payload has more than 3 object keys"}
+
+    @pytest.mark.skipif(msgpack is None, reason="msgpack not installed")
+    def test_msgpack(self):
+        """Code, globals, and library can be sent in one MessagePack body, with special floats intact."""
+        contents, _digest = self._library()
+        body = msgpack.packb({
+            'payload': {
+                'code': "from course_library import triangular_number\nresult = triangular_number(x)\ny = z",
+                'globals_dict': {'x': 4, 'z': math.inf},
+                'python_path': ['python_lib.zip'],
+            },
+            'files': {'python_lib.zip': contents},
+        })
+
+        resp = APIClient().post(
+            '/api/v0/code-exec', body, content_type='application/msgpack', HTTP_ACCEPT='application/msgpack',
+        )
+
+        assert resp.status_code == 200
+        assert resp['Content-Type'] == 'application/msgpack'
+        assert msgpack.unpackb(resp.content) == {'globals_dict': {'x': 4, 'z': math.inf, 'result': 10, 'y': math.inf}}
+
+    @pytest.mark.skipif(msgpack is None, reason="msgpack not installed")
+    @ddt.data(
+        ({}, "Missing 'payload' key in request body"),
+        ({'payload': {'code': "a = 1", 'globals_dict': {}}, 'files': {'python_lib.zip': "not bytes"}},
+         "'files' must map file names to bytes"),
+        ({'payload': {'code': "a = 1"}},
+         "Payload JSON did not match schema at path $: 'globals_dict' is a required property"),
+    )
+    @ddt.unpack
+    def test_msgpack_invalid(self, body, error):
+        resp = APIClient().post('/api/v0/code-exec', msgpack.packb(body), content_type='application/msgpack')
+        assert resp.status_code == 400
+        assert json.loads(resp.content) == {'error': error}
@@ -4,9 +4,11 @@ URL routing for the v0 API.
 
 from django.urls import path
 
-from . import views
+from . import async_views, views
 
 app_name = 'v0'
 urlpatterns = [
     path('code-exec', views.code_exec),
+    path('code-exec-batch', views.code_exec_batch),
+    path('code-exec-async', async_views.code_exec),
 ]
@@ -2,19 +2,41 @@
 Codejail service API.
 """
 
+import io
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
 
+from django.conf import settings
 from edx_django_utils.monitoring import set_custom_attribute
 from edx_toggles.toggles import SettingToggle
 from jsonschema.exceptions import best_match as json_error_best_match
 from jsonschema.validators import Draft202012Validator
-from rest_framework.decorators import api_view, parser_classes
-from rest_framework.parsers import FormParser, MultiPartParser
+from rest_framework.decorators import api_view, parser_classes, renderer_classes
 from rest_framework.response import Response
 
+from codejail_service.apps.api.v0.limits import RequestTooLarge, check_content_length, check_payload, check_payload_json
+from codejail_service.apps.api.v0.transport import PARSER_CLASSES, RENDERER_CLASSES, is_msgpack, msgpack_size
+from codejail_service.capture import maybe_capture
+from codejail_service.circuit_breaker import CIRCUIT_BREAKER, get_breaker_key
 from codejail_service.codejail import safe_exec
+from codejail_service.library_check import check_library
+from codejail_service.library_extract import extracted_library_dir
+from codejail_service.library_store import (
+    LIBRARY_FILENAME,
+    LIBRARY_STORE_HEADER,
+    get_library_store,
+    library_digest,
+    remember_library
+)
+from codejail_service.routing import record_route_usage, route_execution
+from codejail_service.sandbox_procs import SANDBOX_PROCESSES
 from codejail_service.startup_check import is_exec_safe
+from codejail_service.supervisor_client import SupervisorUnavailable
+from codejail_service.usage import USAGE_HEADER, record_usage, run_measured
+from codejail_service.worker_concurrency import WORKER_CONCURRENCY, get_worker_limit
 
 log = logging.getLogger(__name__)
 
@@ -48,15 +70,31 @@ payload_schema = {
                 {'type': 'null'},
             ],
         },
+        # Identifies a course library by SHA-256 hex digest, which is
+        # either uploaded alongside or was uploaded by an earlier request.
+        'python_lib_sha256': {'type': 'string', 'pattern': '^[0-9a-f]{64}$'},
         # We'll parse this but won't respect it.
         'unsafely': {'type': 'boolean'},
     },
     'required': ['code', 'globals_dict'],
 }
+
+# Schema for the JSON passed in the v0 batch API's 'payload' field. Each
+# request is validated against payload_schema separately, so that one bad
+# request doesn't prevent the others from running.
+batch_payload_schema = {
+    'type': 'object',
+    'properties': {
+        'requests': {'type': 'array'},
+    },
+    'required': ['requests'],
+}
 # Use this rather than jsonschema.validate, since that would check the schema
 # every time it is called. Best to do it just once at startup.
 Draft202012Validator.check_schema(payload_schema)
 payload_validator = Draft202012Validator(payload_schema)
+Draft202012Validator.check_schema(batch_payload_schema)
+batch_payload_validator = Draft202012Validator(batch_payload_schema)
 
 # .. toggle_name: CODEJAIL_ENABLED
 # .. toggle_implementation: SettingToggle
@@ -71,7 +109,8 @@ CODEJAIL_ENABLED = SettingToggle('CODEJAIL_ENABLED', default=False, module_name=
 
 
 @api_view(['POST'])
-@parser_classes([FormParser, MultiPartParser])
+@parser_classes(PARSER_CLASSES)
+@renderer_classes(RENDERER_CLASSES)
 def code_exec(request):
     """
     Executes code in a codejail sandbox for a remote caller.
@@ -97,16 +136,102 @@ def code_exec(request):
     implementations will not accept or produce. Python's `json` module allows
     them by default, but other implementations may need to be configured
     specially.
+
+    If msgpack is installed, the request and response may instead be
+    MessagePack; see the `transport` module.
+    """
+    if (unavailable := _check_available()) is not None:
+        return unavailable
+
+    (params, params_json, extra_files, error_response) = _read_request(request, payload_validator)
+    if error_response is not None:
+        return error_response
+
+    return _execute(params, params_json, extra_files)
+
+
+@api_view(['POST'])
+@parser_classes(PARSER_CLASSES)
+@renderer_classes(RENDERER_CLASSES)
+def code_exec_batch(request):
+    """
+    Executes several independent code-exec requests in one call.
+
+    Accepts a POST of a form containing a `payload` value and zero or more
+    course library files. The payload is JSON with a single key `requests`,
+    a list of payloads as accepted by `code_exec`. Uploaded files may have any
+    field name; each is treated as a course library, and requests refer to
+    them by `python_lib_sha256`. (Libraries from earlier requests may also be
+    referred to, as with `code_exec`.)
+
+    The requests are executed concurrently, up to the worker's limit of
+    concurrent executions (see `worker_concurrency.get_worker_limit`); each
+    still takes an execution slot of its own, and any refused for lack of one
+    get a 503 in their entry, as from `code_exec`. If the batch itself is valid,
+    the response is a 200 with JSON containing the key `results`, a list with
+    one entry per request, in order. Each entry has the keys `status` and
+    `body`, containing the HTTP status and response body that `code_exec`
+    would have returned for that request.
+
+    As with `code_exec`, the request and response may instead be MessagePack.
+    """
+    if (unavailable := _check_available()) is not None:
+        return unavailable
+
+    (batch, _batch_json, uploaded_files, error_response) = _read_request(request, batch_payload_validator, batch=True)
+    if error_response is not None:
+        return error_response
+
+    batch_requests = batch['requests']
+    # .. custom_attribute_name: codejail.batch.size
+    # .. custom_attribute_description: Number of code-exec requests in a batch request. The
+    #   requests are executed on threads of their own, so the other ``codejail.exec.*``
+    #   attributes of a batch request only describe refusals of the batch as a whole.
+    set_custom_attribute('codejail.batch.size', len(batch_requests))
+    if len(batch_requests) > settings.CODEJAIL_BATCH_MAX_REQUESTS:
+        set_custom_attribute('codejail.exec.status', 'invalid.batch.too_large')
+        return Response(
+            {'error': f"Batch may contain at most {settings.CODEJAIL_BATCH_MAX_REQUESTS} requests"},
+            status=400,
+        )
+
+    libraries = {library_digest(contents): contents for _name, contents in uploaded_files}
+
+    results = []
+    if batch_requests:
+        workers = min(len(batch_requests), get_worker_limit())
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='codejail-batch') as executor:
+            for response in executor.map(lambda params: _execute_batch_entry(params, libraries), batch_requests):
+                results.append({'status': response.status_code, 'body': response.data})
+
+    return Response({'results': results}, headers=_library_store_headers())
+
+
+def _execute_batch_entry(params, libraries):
+    """
+    Check and execute one request of a batch, and return its response.
+    """
+    if json_error := json_error_best_match(payload_validator.iter_errors(params)):
+        set_custom_attribute('codejail.exec.status', 'invalid.payload.schema_mismatch')
+        return Response({'error': _schema_error_message(json_error)}, status=400)
+    return _execute(params, None, [], libraries)
+
+
+def _check_available():
+    """
+    Return an error response if code-exec calls can't be accepted at all, or None if they can.
     """
     if not CODEJAIL_ENABLED.is_enabled():
         # .. custom_attribute_name: codejail.exec.status
         # .. custom_attribute_description: Type of response from code execution request.
         #   Value is dot-delimited string where the first segment is one of "disabled" (the
         #   API is refusing all requests), "invalid" (this particular request was refused),
-        #   or "executed" (the request was executed). Further segments give additional
-        #   information. Of particular note are the values "executed.success" and
-        #   "executed.error", which distinguish between executions that completed normally
-        #   and those that raised an error or were killed.
+        #   "rejected" (this particular request was valid, but was not executed in order to
+        #   protect the service), or "executed" (the request was executed). Further segments
+        #   give additional information. Of particular note are the values "executed.success"
+        #   and "executed.error", which distinguish between executions that completed normally
+        #   and those that raised an error or were killed, and "rejected.circuit_open", where
+        #   a cached error was returned for code that keeps exhausting its resource limits.
         set_custom_attribute('codejail.exec.status', 'disabled.feature_switch')
         return Response({'error': "Codejail service not enabled"}, status=500)
 
@@ -114,27 +239,203 @@ def code_exec(request):
         set_custom_attribute('codejail.exec.status', 'disabled.safety_checks_failed')
         return Response({'error': "Codejail service is not correctly configured"}, status=500)
 
-    params_json = request.data.get('payload')
-    if params_json is None:
+    return None
+
+
+def _schema_error_message(json_error):
+    """
+    Return the error message for a payload that doesn't match its schema.
+    """
+    return (
+        "Payload JSON did not match schema "
+        f"at path {json_error.json_path}: {json_error.message}"
+    )
+
+
+def _read_request(request, validator, batch=False):
+    """
+    Read the payload and uploaded files from a request, in either encoding.
+
+    Returns a tuple of (params, params JSON, files, error response). If the
+    error response is not None, the request should be refused with it.
+    Otherwise, params is the validated payload, params JSON is the payload's
+    JSON string (or None, if the request wasn't JSON), and files is a list of
+    (filename, bytes) pairs.
+
+    ``batch`` is True for batch requests, whose payload holds a list of
+    code-exec payloads, and whose files are all course libraries.
+
+    Uploaded course libraries are validated before their contents are read.
+    """
+    payload_depth = 3 if batch else 1
+    try:
+        # Before anything reads the body
+        check_content_length(request)
+
+        if is_msgpack(request):
+            return _read_msgpack_request(request, validator, batch)
+
+        params_json = request.data.get('payload')
+        if params_json is None:
+            set_custom_attribute('codejail.exec.status', 'invalid.payload.missing')
+            return (None, None, None, Response({'error': "Missing 'payload' parameter in POST body"}, status=400))
+
+        check_payload_json(params_json, payload_depth)
+    except RequestTooLarge as e:
+        log.warning(f"Refusing oversized request: {e.detail}")
+        # Status is ``invalid.too_large.<limit>``, where the limit is one of
+        # body, code, globals, depth, or keys.
+        set_custom_attribute('codejail.exec.status', f'invalid.too_large.{e.limit}')
+        return (None, None, None, Response({'error': str(e.detail)}, status=413))
+
+    (params, error_response) = _parse_payload(params_json, validator)
+    if error_response is not None:
+        return (None, None, None, error_response)
+
+    # Uploads are spooled to disk, and hashed as they arrived
+    uploads = [(filename, file, _uploaded_digest(file)) for filename, file in request.FILES.items()]
+    if (error_response := _check_libraries(uploads, batch)) is not None:
+        return (None, None, None, error_response)
+
+    # Convert to a list of (string, bytestring) pairs. Any duplicated file names
+    # are resolved as last-wins.
+    files = [(filename, file.read()) for filename, file, _digest in uploads]
+    return (params, params_json, files, None)
+
+
+def _read_msgpack_request(request, validator, batch):
+    """
+    Read a MessagePack request, returning the same as ``_read_request``.
+
+    Raises RequestTooLarge if the payload exceeds the limits.
+    """
+    body = request.data if isinstance(request.data, dict) else {}
+    params = body.get('payload')
+    files = body.get('files') or {}
+    if params is None:
         set_custom_attribute('codejail.exec.status', 'invalid.payload.missing')
-        return Response({'error': "Missing 'payload' parameter in POST body"}, status=400)
+        return (None, None, None, Response({'error': "Missing 'payload' key in request body"}, status=400))
+    if not (isinstance(files, dict) and all(isinstance(c, bytes) for c in files.values())):
+        set_custom_attribute('codejail.exec.status', 'invalid.files')
+        return (None, None, None, Response({'error': "'files' must map file names to bytes"}, status=400))
 
+    check_payload(params, 3 if batch else 1, encoded_size=msgpack_size)
+
+    if json_error := json_error_best_match(validator.iter_errors(params)):
+        error_msg = _schema_error_message(json_error)
+        log.error(error_msg)
+        set_custom_attribute('codejail.exec.status', 'invalid.payload.schema_mismatch')
+        return (None, None, None, Response({'error': error_msg}, status=400))
+
+    uploads = [(filename, io.BytesIO(contents), library_digest(contents)) for filename, contents in files.items()]
+    if (error_response := _check_libraries(uploads, batch)) is not None:
+        return (None, None, None, error_response)
+    return (params, None, list(files.items()), None)
+
+
+def _uploaded_digest(file):
+    """
+    Return the SHA-256 hex digest of an uploaded file.
+    """
+    if (digest := getattr(file, 'sha256', None)) is not None:
+        return digest
+    # Not uploaded through HashingFileUploadHandler
+    digest = library_digest(file.read())
+    file.seek(0)
+    return digest
+
+
+def _check_libraries(uploads, batch):
+    """
+    Validate uploaded course libraries, before their contents are read.
+
+    ``uploads`` is a list of (filename, seekable file object, digest). Returns
+    an error response if any library is unacceptable, or None.
+    """
+    names = {filename for (filename, _file, _digest) in uploads}
+    if not batch and names - {LIBRARY_FILENAME}:
+        # Refused later, by name
+        return None
+
+    for (_filename, file, digest) in uploads:
+        if (problem := check_library(file, digest)) is not None:
+            log.warning(f"Refusing course library {digest}: {problem}")
+            set_custom_attribute('codejail.exec.status', 'invalid.library.bad_archive')
+            return Response({'error': problem}, status=400)
+    return None
+
+
+def _parse_payload(params_json, validator):
+    """
+    Parse and validate payload JSON.
+
+    Returns a tuple of (params, error response), exactly one of which is None.
+    """
     try:
         params = json.loads(params_json)
     except json.decoder.JSONDecodeError as e:
         log.error(f"Payload was not valid JSON: {e}")
         set_custom_attribute('codejail.exec.status', 'invalid.payload.bad_json')
-        return Response({'error': f"Unable to parse payload JSON: {e}"}, status=400)
+        return (None, Response({'error': f"Unable to parse payload JSON: {e}"}, status=400))
 
-    if json_error := json_error_best_match(payload_validator.iter_errors(params)):
-        error_msg = (
-            "Payload JSON did not match schema "
-            f"at path {json_error.json_path}: {json_error.message}"
-        )
+    if json_error := json_error_best_match(validator.iter_errors(params)):
+        error_msg = _schema_error_message(json_error)
         log.error(error_msg)
         set_custom_attribute('codejail.exec.status', 'invalid.payload.schema_mismatch')
-        return Response({'error': error_msg}, status=400)
+        return (None, Response({'error': error_msg}, status=400))
+
+    return (params, None)
+
+
+@dataclass
+class Execution:
+    """
+    A checked code-exec request, ready to run.
+    """
+
+    code: str
+    globals_dict: dict
+    python_path: list
+    extra_files: list
+    limit_overrides_context: Optional[str]
+    slug: Optional[str]
+    breaker_key: Optional[str]
+    pool: Optional[str]
+
+
+def _execute(params, params_json, extra_files, batch_libraries=None):
+    """
+    Check and execute a single code-exec request, and return the response.
+
+    Arguments:
+        params: Payload, already validated against payload_schema
+        params_json: The payload's JSON string, or None if it wasn't sent as JSON
+        extra_files: List of (filename, bytes) pairs uploaded with the request
+        batch_libraries: For batch requests, dict of digest to contents of
+          the course libraries uploaded with the batch
+    """
+    (execution, error_response) = prepare_execution(params, params_json, extra_files, batch_libraries)
+    if error_response is not None:
+        return error_response
+
+    with WORKER_CONCURRENCY.slot() as has_slot:
+        if not has_slot:
+            return _refuse_over_capacity()
+        try:
+            (result, usage) = run_execution(execution)
+        except SupervisorUnavailable as e:
+            return _refuse_supervisor_unavailable(e)
+
+    return execution_response(execution, result, usage)
 
+
+def prepare_execution(params, params_json, extra_files, batch_libraries=None):
+    """
+    Check a single code-exec request, and prepare it for execution.
+
+    Takes the same arguments as ``_execute``. Returns a tuple of (Execution,
+    error response), exactly one of which is None.
+    """
     # These first two are required params, but schema check has
     # already ensured they are present.
     complete_code = params['code']  # includes standard prolog
@@ -159,17 +460,13 @@ def code_exec(request):
     # .. custom_attribute_name: codejail.exec.files_count
     # .. custom_attribute_description: The number of files the request included in a
     #   codejail execution request. Normally there should be zero or one entries.
-    set_custom_attribute('codejail.exec.files_count', len(request.FILES))
+    set_custom_attribute('codejail.exec.files_count', len(extra_files))
     # .. custom_attribute_name: codejail.exec.slug
     # .. custom_attribute_description: "Slug" ID passed in the request. This is
     #   usually going to be a problem ID, and may help identify what XBlock was
     #   involved.
     set_custom_attribute('codejail.exec.slug', slug)
 
-    # Convert to a list of (string, bytestring) pairs. Any duplicated file names
-    # are resolved as last-wins.
-    extra_files = [(filename, file.read()) for filename, file in request.FILES.items()]
-
     # The following checks protect against vulnerabilities that would be
     # introduced by exposing `safe_exec` directly. edxapp contains protections
     # against these features being abused, but those protections are outside of
@@ -182,42 +479,97 @@ def code_exec(request):
     # *arbitrary file reads* in the broader filesystem by sandboxed code
     # regardless of AppArmor settings. These reads would happen with the
     # privilege level of the webapp user, not the sandbox user.
-    if unexpected := set(python_path) - {'python_lib.zip'}:
+    if unexpected := set(python_path) - {LIBRARY_FILENAME}:
         log.error(f"Unexpected python_path entries in request: {unexpected!r}")
         set_custom_attribute('codejail.exec.status', 'invalid.python_path')
-        return Response({'error': "Only allowed entry in 'python_path' is 'python_lib.zip'"}, status=400)
+        return (None, Response({'error': "Only allowed entry in 'python_path' is 'python_lib.zip'"}, status=400))
 
     # Only allow a known safe name for uploaded files. (In practice, edxapp
     # only ever sends a file called python_lib.zip). Due to a lack of checks in
     # codejail, unrestricted filenames allow *arbitrary file writes* in the
     # broader filesystem regardless of AppArmor settings. These writes would
     # happen with the privilege level of the webapp user, not the sandbox user.
-    if unexpected := {name for (name, _bytes) in extra_files} - {'python_lib.zip'}:
+    if unexpected := {name for (name, _bytes) in extra_files} - {LIBRARY_FILENAME}:
         log.error(f"Unexpected filenames in request: {unexpected!r}")
         set_custom_attribute('codejail.exec.status', 'invalid.files')
-        return Response({'error': "Only allowed name for uploaded file is 'python_lib.zip'"}, status=400)
+        return (None, Response({'error': "Only allowed name for uploaded file is 'python_lib.zip'"}, status=400))
 
     # Far too dangerous to allow unsafe executions to come in over the
     # network, even if we were to authenticate them. The caller is the
     # one who has the context on safety.
     if unsafely:
         set_custom_attribute('codejail.exec.status', 'invalid.unsafely')
-        return Response({'error': "Refusing codejail execution with unsafely=true"}, status=400)
+        return (None, Response({'error': "Refusing codejail execution with unsafely=true"}, status=400))
 
-    # This wrapped version of safe_exec doesn't mutate the globals dict
-    (globals_out, error_message) = safe_exec(
-        complete_code,
-        input_globals_dict,
+    (extra_files, error_response) = _resolve_library(params.get('python_lib_sha256'), extra_files, batch_libraries)
+    if error_response is not None:
+        return (None, error_response)
+
+    # Opt-in sampling of real traffic for offline replay and analysis
+    maybe_capture(params_json, extra_files, params)
+
+    breaker_key = get_breaker_key(complete_code, input_globals_dict, extra_files, slug)
+    if (cached_error := CIRCUIT_BREAKER.check(breaker_key)) is not None:
+        log.info(f"Skipping execution for {slug=} due to open circuit breaker")
+        set_custom_attribute('codejail.exec.status', 'rejected.circuit_open')
+        return (None, Response({'globals_dict': input_globals_dict, 'emsg': cached_error}))
+
+    if (refusal := _check_nproc_headroom()) is not None:
+        return (None, refusal)
+
+    execution = Execution(
+        code=complete_code,
+        globals_dict=input_globals_dict,
         python_path=python_path,
         extra_files=extra_files,
         limit_overrides_context=limit_overrides_context,
         slug=slug,
+        breaker_key=breaker_key,
+        pool=route_execution(complete_code),
     )
+    return (execution, None)
+
+
+def run_execution(execution):
+    """
+    Run a prepared execution in the sandbox.
+
+    Blocks until the sandbox finishes. Returns a tuple of ((globals dict,
+    error message), ExecutionUsage).
+    """
+    (python_path, library_dir) = _use_extracted_library(execution.python_path, execution.extra_files)
+
+    # This wrapped version of safe_exec doesn't mutate the globals dict
+    return run_measured(
+        safe_exec,
+        execution.code,
+        execution.globals_dict,
+        python_path=python_path,
+        extra_files=execution.extra_files,
+        limit_overrides_context=execution.limit_overrides_context,
+        slug=execution.slug,
+        library_dir=library_dir,
+    )
+
+
+def execution_response(execution, result, usage):
+    """
+    Record the outcome of an execution, and return the response for it.
+    """
+    (globals_out, error_message) = result
+    slug = execution.slug
+    record_usage(usage, slug)
+    record_route_usage(execution.pool, usage)
+    if CIRCUIT_BREAKER.record(execution.breaker_key, error_message):
+        log.warning(f"Circuit breaker opened for {slug=} after repeated resource limit kills")
+    headers = _library_store_headers()
+    if settings.CODEJAIL_USAGE_RESPONSE_HEADER:
+        headers[USAGE_HEADER] = usage.as_header()
 
     if error_message is None:
         log.debug("Codejail execution succeeded for {slug=}, with globals={globals_out!r}")
         set_custom_attribute('codejail.exec.status', 'executed.success')
-        return Response({'globals_dict': globals_out})
+        return Response({'globals_dict': globals_out}, headers=headers)
     else:
         log.debug("Codejail execution failed for {slug=} with: {error_message}")
         # Nothing in edxapp actually *uses* the returned globals when there's an
@@ -227,4 +579,119 @@ def code_exec(request):
         # globals for backward-compatibility, just in case anything actually does
         # care.
         set_custom_attribute('codejail.exec.status', 'executed.error')
-        return Response({'globals_dict': globals_out, 'emsg': error_message})
+        return Response({'globals_dict': globals_out, 'emsg': error_message}, headers=headers)
+
+
+def _check_nproc_headroom():
+    """
+    Return an error response if the sandbox user is too close to its process limit, or None.
+
+    Uses the latest reading from the process watchdog (see ``sandbox_procs``).
+    """
+    if (headroom := SANDBOX_PROCESSES.headroom()) is None:
+        return None
+
+    # .. custom_attribute_name: codejail.exec.nproc_headroom
+    # .. custom_attribute_description: Number of processes and threads the sandbox user could
+    #   still start before reaching its NPROC limit, as of the process watchdog's latest check.
+    #   Only present when the watchdog is enabled (``CODEJAIL_PROCESS_WATCHDOG_INTERVAL``).
+    set_custom_attribute('codejail.exec.nproc_headroom', headroom)
+    if headroom >= settings.CODEJAIL_MIN_NPROC_HEADROOM:
+        return None
+
+    log.warning(f"Refusing execution with only {headroom} sandbox processes left before NPROC limit")
+    set_custom_attribute('codejail.exec.status', 'rejected.nproc_headroom')
+    return Response(
+        {'error': "Sandbox process limit nearly exhausted; try again later"},
+        status=503, headers={'Retry-After': str(settings.CODEJAIL_PROCESS_WATCHDOG_INTERVAL)},
+    )
+
+
+def _refuse_over_capacity():
+    """
+    Return the error response for a request arriving while this worker is running as many executions as it may.
+    """
+    log.warning(f"Refusing execution with {settings.CODEJAIL_WORKER_CONCURRENCY} executions already running")
+    set_custom_attribute('codejail.exec.status', 'rejected.capacity')
+    return Response(
+        {'error': "Worker is at its limit of concurrent executions; try again later"},
+        status=503, headers={'Retry-After': '1'},
+    )
+
+
+def _refuse_supervisor_unavailable(e):
+    """
+    Return the error response for an execution that the sandbox supervisor didn't run.
+    """
+    log.warning(f"Sandbox supervisor did not run execution ({e.reason}): {e}")
+    set_custom_attribute('codejail.exec.status', f'rejected.supervisor_{e.reason}')
+    return Response(
+        {'error': "Sandbox supervisor unable to run code; try again later"},
+        status=503, headers={'Retry-After': '1'},
+    )
+
+
+def _use_extracted_library(python_path, extra_files):
+    """
+    Import the course library from a pre-extracted directory instead of the zip, if enabled.
+
+    Returns a tuple of (python path, library directory). If the library has
+    been extracted, it is removed from the python path and its directory is
+    returned, to be put on ``sys.path`` by the sandbox prolog. The zip is
+    still provided to the sandbox, in case the code reads it directly.
+    Otherwise, the python path is unchanged and the directory is None.
+    """
+    contents = dict(extra_files).get(LIBRARY_FILENAME)
+    if contents is None or LIBRARY_FILENAME not in python_path:
+        return (python_path, None)
+
+    library_dir = extracted_library_dir(library_digest(contents), contents)
+    if library_dir is None:
+        return (python_path, None)
+    return ([entry for entry in python_path if entry != LIBRARY_FILENAME], library_dir)
+
+
+def _library_store_headers():
+    """
+    Return response headers advertising the library store, if enabled.
+    """
+    return {LIBRARY_STORE_HEADER: 'enabled'} if get_library_store() is not None else {}
+
+
+def _resolve_library(library_sha256, extra_files, batch_libraries):
+    """
+    Find the course library for a request, and keep any uploaded library for later requests.
+
+    Returns a tuple of (extra files, error response), exactly one of which is None.
+    """
+    uploaded = dict(extra_files).get(LIBRARY_FILENAME)
+
+    if library_sha256 is None:
+        if uploaded is not None:
+            remember_library(uploaded)
+        return (extra_files, None)
+
+    if uploaded is not None:
+        source = 'uploaded'
+        if library_digest(uploaded) != library_sha256:
+            set_custom_attribute('codejail.exec.status', 'invalid.library.hash_mismatch')
+            return (None, Response({'error': "Uploaded library does not match python_lib_sha256"}, status=400))
+        remember_library(uploaded)
+    elif (uploaded := (batch_libraries or {}).get(library_sha256)) is not None:
+        source = 'batch'
+        remember_library(uploaded)
+    elif (store := get_library_store()) is not None and (uploaded := store.get(library_sha256)) is not None:
+        source = 'store'
+    else:
+        set_custom_attribute('codejail.exec.status', 'invalid.library.unknown')
+        return (None, Response(
+            {'error': "Unknown library; resend with the file", 'missing_library_sha256': library_sha256},
+            status=409,
+        ))
+
+    # .. custom_attribute_name: codejail.exec.library_source
+    # .. custom_attribute_description: Where the course library for a request that named it by
+    #   ``python_lib_sha256`` came from: "uploaded" (with the request), "batch" (with the
+    #   batch the request was part of), or "store" (uploaded by an earlier request).
+    set_custom_attribute('codejail.exec.library_source', source)
+    return ([(LIBRARY_FILENAME, uploaded)], None)
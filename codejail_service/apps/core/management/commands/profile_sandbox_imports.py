@@ -0,0 +1,54 @@
+"""
+Measure how long sandbox libraries take to import inside the sandbox.
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from codejail_service.import_profile import get_profile_modules, profile_imports, publish_profile
+from codejail_service.startup_check import is_exec_safe, run_startup_safety_check
+
+
+class Command(BaseCommand):
+    """
+    Profile sandbox library import times.
+    """
+    help = "Import each sandbox library in a fresh sandbox and report the cumulative import time."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--module', action='append', dest='modules',
+            help=(
+                "Module to profile; may be repeated. Defaults to CODEJAIL_IMPORT_PROFILE_MODULES, "
+                "or the packages in requirements/sandbox/base.in."
+            ),
+        )
+        parser.add_argument(
+            '--output',
+            help="Write a JSON object of module names to import time in seconds to this file.",
+        )
+
+    def handle(self, *args, **options):
+        run_startup_safety_check()
+        if not is_exec_safe():
+            raise CommandError("Startup safety checks failed; refusing to run code in the sandbox")
+
+        results = profile_imports(options['modules'] or get_profile_modules())
+        publish_profile(results)
+
+        for module, result in sorted(results.items(), key=lambda item: -item[1].get('seconds', -1)):
+            if 'error' in result:
+                self.stdout.write(f"{module}: failed: {result['error']}")
+            else:
+                self.stdout.write(
+                    f"{module}: {result['seconds']:.3f} s ({result['modules_loaded']} modules loaded)"
+                )
+
+        if options['output']:
+            costs = {module: result['seconds'] for module, result in results.items() if 'seconds' in result}
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(costs, f, indent=2, sort_keys=True)
+
+        if any('error' in result for result in results.values()):
+            raise CommandError("Some sandbox imports failed")
@@ -0,0 +1,23 @@
+"""
+Middleware for the codejail service.
+"""
+
+from django.utils.deprecation import MiddlewareMixin
+from edx_django_utils.monitoring import DeploymentMonitoringMiddleware as SyncDeploymentMonitoringMiddleware
+
+
+class DeploymentMonitoringMiddleware(MiddlewareMixin):
+    """
+    Record the Python and Django versions as custom attributes, supporting async requests.
+
+    The same as edx-django-utils' middleware of the same name, which only
+    supports sync requests. Under ASGI, a sync-only middleware holds a thread
+    for the whole of every request, including while it waits for a sandbox.
+    """
+
+    def process_request(self, request):
+        """
+        Record the versions before the request is handled.
+        """
+        SyncDeploymentMonitoringMiddleware.record_python_version()
+        SyncDeploymentMonitoringMiddleware.record_django_version()
@@ -0,0 +1,65 @@
+"""
+Tests for build_sandbox_caches management command.
+"""
+
+import os
+import stat
+import tempfile
+from io import StringIO
+from unittest.mock import Mock, patch
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from codejail_service.apps.core.management.commands.build_sandbox_caches import CACHE_IMPORTS
+
+
+class TestBuildSandboxCaches(TestCase):
+    """Test the build_sandbox_caches management command."""
+
+    def test_requires_cache_dir(self):
+        with pytest.raises(CommandError, match="No cache directory"):
+            call_command('build_sandbox_caches', python='/sandbox/bin/python')
+
+    def test_requires_python(self):
+        with pytest.raises(CommandError, match="No sandbox Python"):
+            call_command('build_sandbox_caches', cache_dir='/tmp/whatever')
+
+    @patch('codejail_service.apps.core.management.commands.build_sandbox_caches.subprocess.run')
+    def test_build(self, mock_run):
+        """
+        Caches are built, timings reported, and the result is made read-only.
+        """
+        # Before, populate, after
+        timings = ['2.0'] * len(CACHE_IMPORTS) + ['2.0'] * len(CACHE_IMPORTS) + ['0.5'] * len(CACHE_IMPORTS)
+        mock_run.side_effect = [Mock(returncode=0, stdout='')] + [Mock(returncode=0, stdout=t) for t in timings]
+        out = StringIO()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            cache_dir = os.path.join(tmp, 'caches')
+            call_command(
+                'build_sandbox_caches', cache_dir=cache_dir, python='/sandbox/bin/python',
+                compile_bytecode=True, stdout=out,
+            )
+
+            assert os.path.isdir(os.path.join(cache_dir, 'matplotlib'))
+            assert os.path.isdir(os.path.join(cache_dir, 'nltk_data'))
+            assert not os.stat(cache_dir).st_mode & stat.S_IWUSR
+            # Let the temp dir be cleaned up
+            os.chmod(cache_dir, 0o755)
+            for name in os.listdir(cache_dir):
+                os.chmod(os.path.join(cache_dir, name), 0o755)
+
+        assert mock_run.call_count == 1 + len(timings)
+        assert "Import of matplotlib.pyplot: 2.000 s without caches, 0.500 s with caches" in out.getvalue()
+
+    @patch(
+        'codejail_service.apps.core.management.commands.build_sandbox_caches.subprocess.run',
+        return_value=Mock(returncode=1, stderr='boom'),
+    )
+    def test_subprocess_failure(self, _mock_run):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            with pytest.raises(CommandError, match="failed with status 1: boom"):
+                call_command('build_sandbox_caches', cache_dir=cache_dir, python='/sandbox/bin/python')
@@ -0,0 +1,30 @@
+"""
+Tests for the service's middleware.
+"""
+
+import platform
+from unittest.mock import Mock, call, patch
+
+import django
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+
+from codejail_service.apps.core.middleware import DeploymentMonitoringMiddleware
+
+
+class DeploymentMonitoringMiddlewareTests(TestCase):
+    """Tests of the async-capable deployment monitoring middleware."""
+
+    @patch('edx_django_utils.monitoring.internal.middleware._set_custom_attribute')
+    def test_versions_recorded(self, mock_set_custom_attribute):
+        response = HttpResponse()
+        middleware = DeploymentMonitoringMiddleware(Mock(return_value=response))
+
+        assert middleware(RequestFactory().get('/')) is response
+        assert mock_set_custom_attribute.call_args_list == [
+            call('python_version', platform.python_version()),
+            call('django_version', django.__version__),
+        ]
+
+    def test_async_capable(self):
+        assert DeploymentMonitoringMiddleware.async_capable
@@ -0,0 +1,59 @@
+"""
+Tests for profile_sandbox_imports management command.
+"""
+
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+COMMAND_MODULE = 'codejail_service.apps.core.management.commands.profile_sandbox_imports'
+
+
+@patch(f'{COMMAND_MODULE}.run_startup_safety_check')
+@patch(f'{COMMAND_MODULE}.publish_profile')
+class TestProfileSandboxImports(TestCase):
+    """Test the profile_sandbox_imports management command."""
+
+    @patch(f'{COMMAND_MODULE}.is_exec_safe', return_value=False)
+    def test_unsafe(self, _is_safe, _publish, _check):
+        with pytest.raises(CommandError, match="safety checks failed"):
+            call_command('profile_sandbox_imports')
+
+    @patch(f'{COMMAND_MODULE}.is_exec_safe', return_value=True)
+    @patch(f'{COMMAND_MODULE}.profile_imports')
+    def test_output(self, mock_profile_imports, _is_safe, mock_publish, _check):
+        results = {
+            'numpy': {'seconds': 0.25, 'modules_loaded': 100},
+            'sympy': {'seconds': 1.5, 'modules_loaded': 800},
+        }
+        mock_profile_imports.return_value = results
+        out = StringIO()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'costs.json')
+            call_command('profile_sandbox_imports', modules=['numpy', 'sympy'], output=output, stdout=out)
+            with open(output, encoding='utf-8') as f:
+                assert json.load(f) == {'numpy': 0.25, 'sympy': 1.5}
+
+        mock_profile_imports.assert_called_once_with(['numpy', 'sympy'])
+        mock_publish.assert_called_once_with(results)
+        # Slowest first
+        assert out.getvalue().splitlines() == [
+            "sympy: 1.500 s (800 modules loaded)",
+            "numpy: 0.250 s (100 modules loaded)",
+        ]
+
+    @patch(f'{COMMAND_MODULE}.is_exec_safe', return_value=True)
+    @patch(f'{COMMAND_MODULE}.profile_imports', return_value={'nope': {'error': "ModuleNotFoundError"}})
+    def test_failure(self, _profile, _is_safe, _publish, _check):
+        out = StringIO()
+        with pytest.raises(CommandError, match="Some sandbox imports failed"):
+            call_command('profile_sandbox_imports', modules=['nope'], stdout=out)
+        assert "nope: failed: ModuleNotFoundError" in out.getvalue()
@@ -39,3 +39,20 @@ class HealthTests(TestCase):
         }
 
         self.assertJSONEqual(response.content, expected_data)
+
+
+class SandboxStatsTests(TestCase):
+    """Tests of the sandbox stats endpoint."""
+
+    def test_stats(self):
+        response = self.client.get(reverse('sandbox_stats'))
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        assert set(data.keys()) == {
+            'usage', 'slow_problems', 'pools', 'janitor', 'processes', 'memory', 'concurrency', 'supervisor',
+        }
+        assert 'executions' in data['usage']
+        assert data['memory']['rss_bytes'] > 0
+        assert 'by_cpu_seconds' in data['slow_problems']
+        assert 'bytes' in data['janitor']
@@ -4,7 +4,15 @@ import logging
 from django.http import JsonResponse
 from edx_django_utils.monitoring import ignore_transaction
 
+from codejail_service.janitor import JANITOR
+from codejail_service.routing import POOL_STATS
+from codejail_service.sandbox_procs import SANDBOX_PROCESSES
+from codejail_service.slow_problems import SLOW_PROBLEMS
 from codejail_service.startup_check import is_exec_safe
+from codejail_service.supervisor_client import supervisor_stats, uses_supervisor
+from codejail_service.usage import WORKER_USAGE
+from codejail_service.worker_concurrency import WORKER_CONCURRENCY
+from codejail_service.worker_memory import WORKER_MEMORY
 
 logger = logging.getLogger(__name__)
 
@@ -25,3 +33,32 @@ def health(_request):
         return JsonResponse({'status': 'OK'}, status=200)
     else:
         return JsonResponse({'status': 'UNAVAILABLE'}, status=503)
+
+
+def sandbox_stats(_request):
+    """
+    Report sandbox usage statistics for the worker process serving the request.
+
+    Includes running totals of sandbox resource usage, the problems (slugs)
+    that have recently consumed the most sandbox time, per-pool routing
+    statistics, how many leftover sandbox directories have been removed, the
+    process watchdog's latest count of sandbox processes, the worker's own
+    memory use, and how many executions it has run at once. Each worker keeps
+    its own statistics, identified by ``pid``. With a sandbox supervisor, its
+    statistics for the whole host are included under ``supervisor``.
+
+    Returns:
+        HttpResponse: 200 with a JSON body
+    """
+    ignore_transaction()
+
+    return JsonResponse({
+        'usage': WORKER_USAGE.snapshot(),
+        'slow_problems': SLOW_PROBLEMS.report(),
+        'pools': POOL_STATS.report(),
+        'janitor': JANITOR.report(),
+        'processes': SANDBOX_PROCESSES.report(),
+        'memory': WORKER_MEMORY.report(),
+        'concurrency': WORKER_CONCURRENCY.report(),
+        'supervisor': supervisor_stats() if uses_supervisor() else None,
+    })
@@ -0,0 +1,19 @@
+"""
+ASGI config for codejail-service.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Under ASGI, the async code-exec endpoint (``/api/v0/code-exec-async``) waits
+for sandboxes without holding a thread per waiting request.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+"""
+from os.path import abspath, dirname
+from sys import path
+
+from django.core.asgi import get_asgi_application
+
+SITE_ROOT = dirname(dirname(abspath(__file__)))
+path.append(SITE_ROOT)
+
+application = get_asgi_application()
@@ -0,0 +1,146 @@
+"""
+Opt-in capture of code-exec requests into an on-disk corpus, for replay.
+
+Corpus layout, under ``CODEJAIL_CAPTURE_DIR``:
+
+- ``requests/<id>.json``: One file per captured request, containing ``time``
+  (Unix timestamp of receipt), ``payload`` (the request's payload JSON string,
+  exactly as received), and ``files`` (a dict of uploaded file names to the
+  SHA-256 hex digest of their contents).
+- ``files/<sha256>``: Contents of uploaded files, stored once per digest.
+
+The corpus contains learner-submitted code and data, and should be handled
+accordingly.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+log = logging.getLogger(__name__)
+
+REQUESTS_SUBDIR = 'requests'
+FILES_SUBDIR = 'files'
+
+# How often (in seconds) to re-measure the corpus size on disk, since other
+# workers are adding to it as well.
+SIZE_RECHECK_INTERVAL = 60
+
+
+class CorpusWriter:
+    """
+    Writes sampled requests into a corpus directory, up to a size cap.
+    """
+
+    def __init__(self, root, max_bytes):
+        """
+        Write into the corpus directory ``root``, stopping once it holds ``max_bytes``.
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self._size = None
+        self._size_checked_at = 0
+        self._lock = threading.Lock()
+
+    def _corpus_size(self):
+        """
+        Return the (approximate) current size of the corpus in bytes.
+        """
+        now = time.monotonic()
+        if self._size is None or now - self._size_checked_at > SIZE_RECHECK_INTERVAL:
+            total = 0
+            for subdir in (REQUESTS_SUBDIR, FILES_SUBDIR):
+                path = os.path.join(self.root, subdir)
+                if os.path.isdir(path):
+                    total += sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+            self._size = total
+            self._size_checked_at = now
+        return self._size
+
+    def write(self, payload_json, extra_files):
+        """
+        Add a request to the corpus, unless the corpus is full.
+
+        Returns True if the request was written.
+        """
+        with self._lock:
+            return self._write(payload_json, extra_files)
+
+    def _write(self, payload_json, extra_files):
+        """
+        Write a request to the corpus, with the lock held.
+        """
+        if self._corpus_size() >= self.max_bytes:
+            return False
+
+        os.makedirs(os.path.join(self.root, REQUESTS_SUBDIR), exist_ok=True)
+        os.makedirs(os.path.join(self.root, FILES_SUBDIR), exist_ok=True)
+
+        file_hashes = {}
+        for name, contents in extra_files:
+            digest = hashlib.sha256(contents).hexdigest()
+            file_hashes[name] = digest
+            file_path = os.path.join(self.root, FILES_SUBDIR, digest)
+            if not os.path.exists(file_path):
+                _write_atomic(file_path, contents)
+                self._size += len(contents)
+
+        record = json.dumps({
+            'time': time.time(),
+            'payload': payload_json,
+            'files': file_hashes,
+        }).encode('utf-8')
+        _write_atomic(os.path.join(self.root, REQUESTS_SUBDIR, f"{uuid.uuid4().hex}.json"), record)
+        self._size += len(record)
+        return True
+
+
+def _write_atomic(path, contents):
+    """
+    Write a file so that readers never see it partially written.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(contents)
+    os.replace(tmp_path, path)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def maybe_capture(payload_json, extra_files, params=None):
+    """
+    Sample a request into the capture corpus, if capture is enabled.
+
+    ``payload_json`` is the payload JSON string as received. For requests
+    that weren't sent as JSON, it is None, and the parsed ``params`` are
+    serialized instead (only if the request is sampled).
+
+    Never raises; failures are logged.
+    """
+    global _writer
+
+    root = getattr(settings, 'CODEJAIL_CAPTURE_DIR', None)
+    if not root or random.random() >= settings.CODEJAIL_CAPTURE_SAMPLE_RATE:
+        return
+
+    with _writer_lock:
+        if _writer is None or _writer.root != root:
+            _writer = CorpusWriter(root, settings.CODEJAIL_CAPTURE_MAX_BYTES)
+        writer = _writer
+
+    if payload_json is None:
+        payload_json = json.dumps(params)
+
+    try:
+        writer.write(payload_json, extra_files)
+    except OSError as e:
+        log.warning(f"Unable to capture request into corpus: {e!r}")
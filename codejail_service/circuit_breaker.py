@@ -0,0 +1,151 @@
+"""
+Circuit breaker for code that repeatedly exhausts sandbox resource limits.
+
+Some problems deterministically run out of time or memory, and every retry
+costs a full resource limit's worth of sandbox time. After enough consecutive
+resource kills for the same key within a window, further executions for that
+key are answered with the last error instead of being run, until a cooldown
+period has passed. Then a single execution is let through as a probe: if it
+is also killed the breaker opens again, and otherwise it closes.
+
+State is kept per worker process (shared by its threads) and is bounded in size.
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+# codejail reports a killed sandbox with the signal as a negative status
+# code. SIGKILL is sent when the wall-clock limit is exceeded (and after
+# SIGXCPU, when the CPU limit is exceeded).
+KILLED_STATUS_RE = re.compile(r'status code: -(9|24)\b')
+
+
+def is_resource_kill(error_message):
+    """
+    Return True if the execution error indicates the sandbox ran out of time or memory.
+    """
+    if error_message is None:
+        return False
+    return bool(KILLED_STATUS_RE.search(error_message)) or 'MemoryError' in error_message
+
+
+def get_breaker_key(code, globals_dict, extra_files, slug):
+    """
+    Return the circuit breaker key for an execution, per ``CODEJAIL_CIRCUIT_BREAKER_KEY``.
+
+    With ``'code'`` (the default), the key is a hash of the code, the globals
+    (which carry the learner's answer), and any uploaded files (the course
+    library), so only identical executions are affected. With ``'slug'``, it is the slug, and executions without a slug
+    are never short-circuited (the key is None).
+
+    Returns None if the circuit breaker is disabled.
+    """
+    if not getattr(settings, 'CODEJAIL_CIRCUIT_BREAKER_THRESHOLD', 0):
+        return None
+
+    if getattr(settings, 'CODEJAIL_CIRCUIT_BREAKER_KEY', 'code') == 'slug':
+        return f"slug:{slug}" if slug else None
+
+    digest = hashlib.sha256(code.encode('utf-8'))
+    # Canonical form, so that the order of keys doesn't matter
+    canonical_globals = json.dumps(globals_dict, sort_keys=True, separators=(',', ':'), default=repr)
+    digest.update(b'\0' + canonical_globals.encode('utf-8'))
+    for name, contents in sorted(extra_files):
+        digest.update(b'\0' + name.encode('utf-8') + b'\0')
+        digest.update(contents)
+    return f"code:{digest.hexdigest()}"
+
+
+class _Circuit:
+    """
+    State for a single key.
+    """
+
+    def __init__(self):
+        self.kill_times = []
+        self.opened_at = None
+        self.last_error = None
+
+
+class CircuitBreaker:
+    """
+    Per-key circuit breakers, holding at most ``max_keys`` keys (least recently used are dropped).
+    """
+
+    def __init__(self, threshold, window, cooldown, max_keys=10000):
+        """
+        Open a key's circuit after ``threshold`` kills within ``window`` seconds, for ``cooldown`` seconds.
+        """
+        self.threshold = threshold
+        self.window = window
+        self.cooldown = cooldown
+        self.max_keys = max_keys
+        self.circuits = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, key):
+        """
+        Return the cached error message if executions for ``key`` should be skipped, else None.
+        """
+        if key is None or not self.threshold:
+            return None
+
+        with self._lock:
+            circuit = self.circuits.get(key)
+            if circuit is None or circuit.opened_at is None:
+                return None
+
+            self.circuits.move_to_end(key)
+            if time.monotonic() - circuit.opened_at < self.cooldown:
+                return circuit.last_error
+
+            # Half-open: let this execution through as a probe. Until it reports
+            # back, other executions are still skipped; if it never does, the
+            # next cooldown expiry allows another probe.
+            circuit.opened_at = time.monotonic()
+            return None
+
+    def record(self, key, error_message):
+        """
+        Record the result of an execution for ``key``.
+
+        Returns True if this result opened the breaker.
+        """
+        if key is None or not self.threshold:
+            return False
+
+        with self._lock:
+            if not is_resource_kill(error_message):
+                # Any other outcome resets the count and closes the breaker.
+                self.circuits.pop(key, None)
+                return False
+
+            circuit = self.circuits.get(key)
+            if circuit is None:
+                circuit = self.circuits[key] = _Circuit()
+                if len(self.circuits) > self.max_keys:
+                    self.circuits.popitem(last=False)
+            self.circuits.move_to_end(key)
+
+            now = time.monotonic()
+            circuit.kill_times = [t for t in circuit.kill_times if now - t < self.window] + [now]
+            circuit.last_error = error_message
+
+            was_open = circuit.opened_at is not None
+            if was_open or len(circuit.kill_times) >= self.threshold:
+                circuit.opened_at = now
+                return not was_open
+            return False
+
+
+CIRCUIT_BREAKER = CircuitBreaker(
+    threshold=getattr(settings, 'CODEJAIL_CIRCUIT_BREAKER_THRESHOLD', 0),
+    window=getattr(settings, 'CODEJAIL_CIRCUIT_BREAKER_WINDOW', 600),
+    cooldown=getattr(settings, 'CODEJAIL_CIRCUIT_BREAKER_COOLDOWN', 300),
+)
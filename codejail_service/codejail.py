@@ -2,23 +2,84 @@
 Wrappers and utilities for codejail library.
 """
 
+import contextlib
 import logging
+import os
+import threading
 from copy import deepcopy
 from json.decoder import JSONDecodeError
 
+from codejail import jail_code
+from codejail import safe_exec as codejail_safe_exec
 from codejail.safe_exec import SafeExecException
 from codejail.safe_exec import safe_exec as real_safe_exec
 from edx_django_utils.monitoring import record_exception
 
+from codejail_service.sandbox_env import add_sandbox_prolog
+from codejail_service.sandbox_users import sandbox_user_slot
+from codejail_service.supervisor_client import exec_in_supervisor, uses_supervisor
+
 log = logging.getLogger(__name__)
 
+# Held by executions that take codejail paths which aren't thread-safe.
+_unsafe_path_lock = threading.Lock()
+
+
+def _uses_shared_state():
+    """
+    Return True if codejail is set up to run code in a way that threads can't do concurrently.
+
+    Unsafe execution (``ALWAYS_BE_UNSAFE``) changes the working directory and
+    ``sys.path`` of the whole process, and the proxy process (the ``PROXY``
+    limit, or the ``CODEJAIL_PROXY`` environment variable) is a single pipe
+    shared by the process.
+    """
+    if codejail_safe_exec.ALWAYS_BE_UNSAFE:
+        return True
+    use_proxy = jail_code.LIMITS.get('PROXY')
+    if use_proxy is None:
+        use_proxy = int(os.environ.get('CODEJAIL_PROXY', '0'))
+    return bool(use_proxy)
+
 
-def safe_exec(code, input_globals, **kwargs):
+def _exclusive_if_needed():
+    """
+    Return a context manager that serializes executions when codejail's configuration requires it.
+    """
+    return _unsafe_path_lock if _uses_shared_state() else contextlib.nullcontext()
+
+
+def safe_exec(code, input_globals, library_dir=None, **kwargs):
     """
     Call safe_exec and work around several of its problems.
 
+    If ``CODEJAIL_SUPERVISOR_SOCKET`` is set, the sandbox supervisor runs the
+    code instead of this process (see ``supervisor``), and
+    ``SupervisorUnavailable`` is raised if it doesn't. Otherwise, see
+    ``safe_exec_locally``; the arguments and return value are the same.
+    """
+    if uses_supervisor():
+        return exec_in_supervisor(code, input_globals, library_dir=library_dir, **kwargs)
+    return safe_exec_locally(code, input_globals, library_dir=library_dir, **kwargs)
+
+
+def safe_exec_locally(code, input_globals, library_dir=None, **kwargs):
+    """
+    Call codejail's safe_exec in this process and work around several of its problems.
+
     input_globals is not mutated, unlike in the codejail library.
 
+    The sandbox prolog (see ``sandbox_env``) is added to the start of the
+    code, after any ``__future__`` imports. If ``library_dir`` is given, the
+    prolog puts that pre-extracted course library on ``sys.path``.
+
+    If several sandbox users are configured, the code runs as whichever one
+    has a free slot (see ``sandbox_users``), waiting for one if necessary.
+
+    Safe to call from several threads at once. Executions are only serialized
+    when codejail is configured in a way that isn't thread-safe (unsafe mode
+    or the proxy process).
+
     Returns a tuple of (globals dict, error message).
 
     - globals dict: The globals dictionary that resulted from execution,
@@ -31,8 +92,10 @@ def safe_exec(code, input_globals, **kwargs):
     """
     # Prevent mutation of input
     output_globals = deepcopy(input_globals)
+    code = add_sandbox_prolog(code, kwargs.get('limit_overrides_context'), library_dir)
     try:
-        real_safe_exec(code, output_globals, **kwargs)
+        with _exclusive_if_needed(), sandbox_user_slot():
+            real_safe_exec(code, output_globals, **kwargs)
         return (output_globals, None)
     except SafeExecException as e:
         # These exception messages can be safely returned to the user, as they
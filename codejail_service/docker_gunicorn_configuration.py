@@ -1,13 +1,34 @@
 """
 gunicorn configuration file: https://docs.gunicorn.org/en/develop/configure.html.
 """
+import gc
 import multiprocessing  # pylint: disable=unused-import
+import os
 
 preload_app = True
+# Keep clearly above CODEJAIL_SUPERVISOR_TIMEOUT, so that a worker waiting on
+# the sandbox supervisor gives up and answers before it is killed.
 timeout = 300
 
+# Don't collect garbage in the arbiter while the app is preloaded; the
+# surviving objects are frozen before workers are forked (see ``when_ready``)
+# and collection is re-enabled in each worker (see ``post_fork``).
+gc.disable()
+
 workers = 2
 
+# Threads per worker. Above 1, gunicorn uses its threaded worker, and each
+# process can wait on several sandboxes at once; see
+# ``CODEJAIL_WORKER_CONCURRENCY`` for capping concurrent executions to match.
+threads = int(os.environ.get('CODEJAIL_SERVICE_THREADS', '1'))
+
+# Serve on a Unix domain socket when co-located with the caller (e.g. as a
+# sidecar), skipping the TCP stack and any load balancer. A ``--bind`` on the
+# command line takes precedence over this; pass ``--bind`` for both the socket
+# and a TCP address to serve on both.
+if unix_socket := os.environ.get('CODEJAIL_SERVICE_UNIX_SOCKET'):
+    bind = [f'unix:{unix_socket}']
+
 
 def pre_request(worker, req):
     """Log requests before they are processed."""
@@ -44,13 +65,52 @@ def close_all_caches():
 
 
 def post_fork(server, worker):  # pylint: disable=unused-argument
-    """Close the cache so newly forked workers cannot accidentally share the socket with the parent processes."""
+    """
+    Close the cache so newly forked workers cannot accidentally share the socket with the parent processes.
+
+    Also record the number of workers, among which the sandbox capacity is divided.
+    """
+    from codejail_service.worker_concurrency import set_worker_count  # pylint: disable=import-outside-toplevel
     close_all_caches()
+    gc.enable()
+    set_worker_count(server.cfg.workers)
+
+
+def post_worker_init(worker):  # pylint: disable=unused-argument
+    """Start the background janitor and sandbox process watchdog in each worker, unless a supervisor runs them."""
+    # pylint: disable=import-outside-toplevel
+    from codejail_service.janitor import start_janitor
+    from codejail_service.sandbox_procs import start_process_watchdog
+    from codejail_service.supervisor_client import uses_supervisor
+    if uses_supervisor():
+        return
+    start_janitor()
+    start_process_watchdog()
+
+
+def post_request(worker, req, environ, resp):  # pylint: disable=unused-argument
+    """Gracefully recycle the worker once its RSS is over ``CODEJAIL_WORKER_MAX_RSS_BYTES``."""
+    from codejail_service.worker_memory import WORKER_MEMORY  # pylint: disable=import-outside-toplevel
+    if worker.alive and (rss := WORKER_MEMORY.check()) is not None:
+        worker.log.info("Recycling worker %s with RSS of %d bytes" % (worker.pid, rss))
+        # The same as gunicorn does on reaching --max-requests: finish up and
+        # exit, and the arbiter starts a replacement.
+        worker.alive = False
 
 
 def when_ready(server):  # pylint: disable=unused-argument
-    """When running in debug mode, run Django's `check` to better match what `manage.py runserver` does."""
+    """
+    Freeze the preloaded app's objects before workers are forked.
+
+    When running in debug mode, also run Django's `check` to better match what `manage.py runserver` does.
+    """
     from django.conf import settings  # lint-amnesty, pylint: disable=import-outside-toplevel
     from django.core.management import call_command  # lint-amnesty, pylint: disable=import-outside-toplevel
     if settings.DEBUG:
         call_command("check")
+
+    # Move everything created by preloading the app into the permanent
+    # generation, so that collections in workers don't write to those objects'
+    # pages (un-sharing them).
+    gc.freeze()
+    gc.enable()
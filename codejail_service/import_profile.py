@@ -0,0 +1,128 @@
+"""
+Measure how long sandbox libraries take to import inside the sandbox.
+
+Import time is paid by every execution that uses a library, but depends on
+the node type, the sandbox's confinement, and the library versions, so it's
+best measured in place. Each module is imported in its own fresh sandbox, so
+the time reported for a module is cumulative: it includes any dependencies
+it imports (e.g. numpy, for scipy).
+"""
+
+import logging
+import os
+import re
+from textwrap import dedent
+
+from django.conf import settings
+from edx_django_utils.monitoring import set_custom_attribute
+
+from codejail_service.codejail import safe_exec
+
+log = logging.getLogger(__name__)
+
+# Sandbox requirements file whose packages are profiled by default.
+SANDBOX_REQUIREMENTS_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'requirements', 'sandbox', 'base.in',
+)
+
+# Top-level modules of distributions that don't just install a module named
+# after the distribution (with dashes replaced by underscores). These come
+# from each distribution's ``top_level.txt``; the sandbox's packages aren't
+# installed alongside the service, so they can't be looked up at runtime.
+DISTRIBUTION_MODULES = {
+    'codejail-includes': ['eia', 'loncapa', 'verifiers'],
+    'openedx-calc': ['calc'],
+}
+
+PROFILE_CODE = dedent("""
+    import sys
+    import time
+
+    _before = set(sys.modules)
+    _start = time.perf_counter()
+    __import__(module)
+    seconds = time.perf_counter() - _start
+    modules_loaded = len(set(sys.modules) - _before)
+""")
+
+
+def read_sandbox_modules(requirements_file=SANDBOX_REQUIREMENTS_FILE):
+    """
+    Return the top-level module names of the packages listed in a requirements file.
+    """
+    modules = []
+    with open(requirements_file, encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if not line or line.startswith('-'):
+                continue
+            distribution = re.split(r'[\[<>=!~;\s]', line, maxsplit=1)[0].lower()
+            modules.extend(DISTRIBUTION_MODULES.get(distribution, [distribution.replace('-', '_')]))
+    return modules
+
+
+def get_profile_modules():
+    """
+    Return the modules to profile, per ``CODEJAIL_IMPORT_PROFILE_MODULES``.
+    """
+    modules = getattr(settings, 'CODEJAIL_IMPORT_PROFILE_MODULES', None)
+    if modules is None:
+        modules = read_sandbox_modules()
+    return modules
+
+
+def profile_imports(modules):
+    """
+    Import each module in a fresh sandbox and return a dict of results by module name.
+
+    Each result is a dict with either ``seconds`` (cumulative import time) and
+    ``modules_loaded`` (number of modules the import added to ``sys.modules``),
+    or ``error`` (the error message if the import failed).
+    """
+    results = {}
+    for module in modules:
+        (globals_out, error_message) = safe_exec(PROFILE_CODE, {'module': module})
+        if error_message is not None:
+            results[module] = {'error': error_message}
+        else:
+            results[module] = {
+                'seconds': globals_out['seconds'],
+                'modules_loaded': globals_out['modules_loaded'],
+            }
+    return results
+
+
+def publish_profile(results):
+    """
+    Log the import profile and record it as custom attributes.
+    """
+    for module, result in results.items():
+        if 'error' in result:
+            log.warning(f"Sandbox import of {module} failed: {result['error']}")
+            continue
+
+        log.info(
+            f"Sandbox import of {module} took {result['seconds']:.3f} s "
+            f"({result['modules_loaded']} modules loaded)"
+        )
+        # .. custom_attribute_name: codejail.import_profile.<MODULE>
+        # .. custom_attribute_description: Cumulative time in seconds to import the
+        #   sandbox library ``<MODULE>`` in a fresh sandbox, including its dependencies.
+        #   Recorded by the ``profile_sandbox_imports`` management command, and at
+        #   startup when ``CODEJAIL_IMPORT_PROFILE_AT_STARTUP`` is enabled.
+        set_custom_attribute(f"codejail.import_profile.{module}", result['seconds'])
+
+
+def run_startup_import_profile():
+    """
+    Profile and publish sandbox import times, if enabled by ``CODEJAIL_IMPORT_PROFILE_AT_STARTUP``.
+
+    Never raises; failures are logged.
+    """
+    if not getattr(settings, 'CODEJAIL_IMPORT_PROFILE_AT_STARTUP', False):
+        return
+
+    try:
+        publish_profile(profile_imports(get_profile_modules()))
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        log.error(f"Sandbox import profile failed: {e!r}")
@@ -0,0 +1,73 @@
+"""
+Static analysis of the modules that submitted code imports.
+
+Code is only parsed, never executed.
+"""
+
+import ast
+import io
+import zipfile
+
+# Functions which import a module named by their first argument.
+DYNAMIC_IMPORT_FUNCTIONS = {'__import__', 'import_module'}
+
+
+def extract_imports(code):
+    """
+    Return the set of top-level module names imported anywhere in ``code``.
+
+    Includes imports nested in functions and conditionals, and calls to
+    ``__import__`` or ``importlib.import_module`` with a literal module name.
+    Relative imports are ignored. Code that can't be parsed (including code
+    nested too deeply for the parser) yields an empty set.
+    """
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError, RecursionError, MemoryError):
+        return set()
+
+    modules = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            if node.level == 0 and node.module:
+                modules.add(node.module)
+        elif isinstance(node, ast.Call) and node.args:
+            func = node.func
+            name = func.id if isinstance(func, ast.Name) else getattr(func, 'attr', None)
+            arg = node.args[0]
+            if name in DYNAMIC_IMPORT_FUNCTIONS and isinstance(arg, ast.Constant) and isinstance(arg.value, str):
+                modules.add(arg.value)
+
+    return {module.split('.')[0] for module in modules}
+
+
+def library_contents(zip_bytes):
+    """
+    Return a tuple of (modules provided, modules imported) for a course library zip.
+
+    - modules provided: Top-level module and package names that the library
+      makes importable (and which therefore don't come from the sandbox's
+      installed packages)
+    - modules imported: Top-level names imported by the library's own Python files
+
+    A corrupt zip yields two empty sets.
+    """
+    provided = set()
+    imported = set()
+    try:
+        with zipfile.ZipFile(io.BytesIO(zip_bytes)) as zf:
+            for name in zf.namelist():
+                parts = name.split('/')
+                if not name.endswith('.py'):
+                    continue
+                if len(parts) == 1:
+                    provided.add(parts[0][:-len('.py')])
+                else:
+                    provided.add(parts[0])
+                imported |= extract_imports(zf.read(name).decode('utf-8', errors='replace'))
+    except (zipfile.BadZipFile, OSError):
+        return (set(), set())
+
+    return (provided, imported - provided)
@@ -0,0 +1,200 @@
+"""
+Background removal of sandbox working directories left behind by failed executions.
+
+codejail runs each execution in a fresh ``codejail-*`` temporary directory,
+holding the code, the course library, and the sandbox's own ``tmp``
+directory, and removes it afterwards. If the worker is killed mid-execution
+(for example by gunicorn's timeout), the directory is left behind. Over time
+these use up disk space and slow down operations on the temp filesystem.
+
+The janitor is a thread in each worker (started by a gunicorn hook) that
+periodically removes such directories once they are older than
+``CODEJAIL_JANITOR_MAX_AGE`` seconds. Workers on a host coordinate through a
+lock file so that only one does so at a time. Files written by the sandbox
+may only be removable by the sandbox user that wrote them, so removal falls
+back to the same ``sudo -u <sandbox user> find`` command that codejail's
+sudoers configuration already allows, for each sandbox user in turn.
+"""
+
+import fcntl
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+from codejail_service.sandbox_users import get_sandbox_user_names
+
+log = logging.getLogger(__name__)
+
+# Prefix of the temporary directories codejail creates for each execution.
+SANDBOX_DIR_PREFIX = 'codejail-'
+
+# Lock file held by the worker that is reaping, in the temp directory.
+LOCK_FILENAME = '.codejail-janitor.lock'
+
+
+def _tree_size(path):
+    """
+    Return the total size in bytes of the files under a directory that are visible to us.
+    """
+    total = 0
+    for dirpath, _dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class Janitor:
+    """
+    Finds and removes stale sandbox working directories, keeping running totals.
+    """
+
+    def __init__(self, root, max_age, sandbox_users=()):
+        """
+        Reap directories in ``root`` older than ``max_age`` seconds, with help from ``sandbox_users`` if needed.
+        """
+        self.root = root
+        self.max_age = max_age
+        self.sandbox_users = list(sandbox_users)
+        self._lock = threading.Lock()
+        self.totals = {'passes': 0, 'dirs': 0, 'bytes': 0, 'failed': 0}
+
+    def find_stale(self):
+        """
+        Return the paths of sandbox working directories older than the maximum age.
+        """
+        cutoff = time.time() - self.max_age
+        stale = []
+        for entry in os.scandir(self.root):
+            if not entry.name.startswith(SANDBOX_DIR_PREFIX):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False) and entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                    stale.append(entry.path)
+            except FileNotFoundError:  # removed in the meantime
+                continue
+        return stale
+
+    def _remove(self, path):
+        """
+        Remove a directory, falling back to the sandbox users for files we can't remove.
+        """
+        try:
+            shutil.rmtree(path)
+            return
+        except PermissionError:
+            if not self.sandbox_users:
+                raise
+
+        # We don't know which sandbox user wrote the files, so try each in turn
+        for (attempt, user) in enumerate(self.sandbox_users, start=1):
+            subprocess.run(
+                ['sudo', '-u', user, 'find', path, '-mindepth', '1', '-delete'],
+                capture_output=True, timeout=60, check=False,
+            )
+            try:
+                shutil.rmtree(path)
+                return
+            except PermissionError:
+                if attempt == len(self.sandbox_users):
+                    raise
+
+    def reap(self):
+        """
+        Remove stale directories, and return a dict of how many were removed, bytes reclaimed, and failures.
+        """
+        result = {'dirs': 0, 'bytes': 0, 'failed': 0}
+        for path in self.find_stale():
+            size = _tree_size(path)
+            try:
+                self._remove(path)
+            except FileNotFoundError:
+                continue
+            except (OSError, subprocess.SubprocessError) as e:
+                log.warning(f"Unable to remove stale sandbox directory {path}: {e!r}")
+                result['failed'] += 1
+                continue
+            result['dirs'] += 1
+            result['bytes'] += size
+
+        with self._lock:
+            self.totals['passes'] += 1
+            for key, value in result.items():
+                self.totals[key] += value
+
+        if result['dirs'] or result['failed']:
+            log.info(
+                f"Removed {result['dirs']} stale sandbox directories ({result['bytes']} bytes); "
+                f"{result['failed']} could not be removed"
+            )
+        return result
+
+    def report(self):
+        """
+        Return a JSON-ready summary of this worker's reaping so far.
+        """
+        with self._lock:
+            return dict(self.totals)
+
+    def run_pass(self):
+        """
+        Reap, unless another worker on this host is already doing so.
+
+        Returns the result of ``reap``, or None if skipped.
+        """
+        lock_path = os.path.join(self.root, LOCK_FILENAME)
+        with open(lock_path, 'a', encoding='utf-8') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            try:
+                return self.reap()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+JANITOR = Janitor(
+    root=tempfile.gettempdir(),
+    max_age=getattr(settings, 'CODEJAIL_JANITOR_MAX_AGE', 3600),
+    sandbox_users=get_sandbox_user_names(),
+)
+
+_started_in_pid = None
+
+
+def _run_forever(janitor, interval):
+    """
+    Run reaping passes every ``interval`` seconds. Never raises.
+    """
+    while True:
+        time.sleep(interval)
+        try:
+            janitor.run_pass()
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            log.error(f"Error in sandbox directory janitor: {e!r}", exc_info=True)
+
+
+def start_janitor():
+    """
+    Start the janitor thread in this process, if enabled and not already started.
+
+    Call from each worker process after it has been forked (threads don't
+    survive a fork).
+    """
+    global _started_in_pid
+
+    interval = getattr(settings, 'CODEJAIL_JANITOR_INTERVAL', 0)
+    if not interval or _started_in_pid == os.getpid():
+        return
+
+    _started_in_pid = os.getpid()
+    threading.Thread(target=_run_forever, args=(JANITOR, interval), name='codejail-janitor', daemon=True).start()
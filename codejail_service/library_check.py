@@ -0,0 +1,79 @@
+"""
+Validation of course library archives, cached by hash.
+
+A course library is a zip file that the sandbox imports from. A corrupt
+archive, or a zip bomb, would otherwise only be noticed once a sandbox has
+been spawned for it. Each library's central directory is checked instead:
+number of entries, total uncompressed size, and the compression ratio of
+each entry. Only the central directory is read, so this is cheap, and the
+verdict is cached by SHA-256 digest so that a library uploaded over and over
+is only checked once per worker.
+"""
+
+import threading
+import zipfile
+from collections import OrderedDict
+
+from django.conf import settings
+
+# Entries smaller than this are not checked for compression ratio, since
+# small files of repetitive text legitimately compress very well.
+RATIO_CHECK_MIN_BYTES = 1024 ** 2
+
+# Number of verdicts to remember per worker.
+VERDICT_CACHE_SIZE = 1024
+
+_verdicts = OrderedDict()
+_verdicts_lock = threading.Lock()
+
+
+def inspect_library(fileobj):
+    """
+    Inspect a library archive's central directory.
+
+    Returns an error message describing why the library is unacceptable, or None if it is fine.
+    """
+    max_entries = settings.CODEJAIL_LIBRARY_MAX_ENTRIES
+    max_uncompressed = settings.CODEJAIL_LIBRARY_MAX_UNCOMPRESSED_BYTES
+    max_ratio = settings.CODEJAIL_LIBRARY_MAX_COMPRESSION_RATIO
+
+    try:
+        with zipfile.ZipFile(fileobj) as archive:
+            entries = archive.infolist()
+    except (zipfile.BadZipFile, zipfile.LargeZipFile, ValueError, EOFError) as e:
+        return f"Library is not a valid zip archive: {e}"
+
+    if len(entries) > max_entries:
+        return f"Library has {len(entries)} entries; the limit is {max_entries}"
+
+    total = sum(entry.file_size for entry in entries)
+    if total > max_uncompressed:
+        return f"Library would uncompress to {total} bytes; the limit is {max_uncompressed}"
+
+    for entry in entries:
+        if entry.file_size >= RATIO_CHECK_MIN_BYTES and entry.file_size > entry.compress_size * max_ratio:
+            return f"Library entry {entry.filename!r} has a suspicious compression ratio"
+
+    return None
+
+
+def check_library(fileobj, digest):
+    """
+    Return an error message if the library with this digest is unacceptable, or None if it is fine.
+
+    ``fileobj`` must be seekable; it is left positioned at the start. The
+    verdict is cached by digest.
+    """
+    with _verdicts_lock:
+        if digest in _verdicts:
+            _verdicts.move_to_end(digest)
+            return _verdicts[digest]
+
+    verdict = inspect_library(fileobj)
+    fileobj.seek(0)
+
+    with _verdicts_lock:
+        _verdicts[digest] = verdict
+        if len(_verdicts) > VERDICT_CACHE_SIZE:
+            _verdicts.popitem(last=False)
+    return verdict
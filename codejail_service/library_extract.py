@@ -0,0 +1,238 @@
+"""
+Pre-extracted, read-only copies of course libraries for the sandbox to import from.
+
+Normally a course library is copied into each sandbox as ``python_lib.zip``
+and imported through zipimport, which decompresses and compiles every module
+it imports on every execution. When ``CODEJAIL_LIBRARY_EXTRACT_DIR`` is set,
+each library is instead extracted once, under its SHA-256 hex digest, its
+modules are compiled to bytecode by the sandbox's Python, and the directory
+is made read-only. The sandbox is then pointed at that directory instead of
+being given the zip.
+
+The directory may be shared by all workers on a host. Its total size is kept
+under ``CODEJAIL_LIBRARY_EXTRACT_MAX_BYTES`` by removing the least recently
+used extractions, other than those used very recently (which may be in use by
+a running sandbox).
+"""
+
+import io
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import time
+import zipfile
+
+from django.conf import settings
+
+from codejail_service.library_store import SHA256_RE
+
+log = logging.getLogger(__name__)
+
+# Extractions used more recently than this (in seconds) are never evicted.
+EVICTION_GRACE_SECONDS = 300
+
+# Seconds to allow for compiling a library's bytecode.
+COMPILE_TIMEOUT = 60
+
+
+def _tree_size(path):
+    """
+    Return the total size in bytes of the files under a directory.
+    """
+    total = 0
+    for dirpath, _dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def _uncompiled_modules(path):
+    """
+    Return the paths (relative to ``path``) of the modules under a directory that have no bytecode.
+    """
+    uncompiled = []
+    for dirpath, dirnames, filenames in os.walk(path):
+        if '__pycache__' in dirnames:
+            dirnames.remove('__pycache__')
+            cached = os.listdir(os.path.join(dirpath, '__pycache__'))
+        else:
+            cached = []
+        for filename in filenames:
+            if not filename.endswith('.py'):
+                continue
+            stem = filename[:-len('.py')]
+            if not any(name.startswith(f"{stem}.") and name.endswith('.pyc') for name in cached):
+                uncompiled.append(os.path.relpath(os.path.join(dirpath, filename), path))
+    return sorted(uncompiled)
+
+
+def _set_tree_writable(path, writable):
+    """
+    Make a directory tree read-only, or make its directories writable again (for removal).
+    """
+    for dirpath, _dirnames, filenames in os.walk(path):
+        os.chmod(dirpath, 0o755 if writable else 0o555)
+        if not writable:
+            for filename in filenames:
+                os.chmod(os.path.join(dirpath, filename), 0o444)
+
+
+def _remove_tree(path):
+    """
+    Remove a (possibly read-only) directory tree, ignoring it if it's already gone.
+    """
+    try:
+        _set_tree_writable(path, True)
+        shutil.rmtree(path)
+    except FileNotFoundError:
+        pass
+
+
+class LibraryExtractions:
+    """
+    A directory of extracted libraries named by digest, up to a size cap.
+    """
+
+    def __init__(self, root, max_bytes, python_bin=None):
+        """
+        Extract into directory ``root``, up to ``max_bytes`` in total, compiling with ``python_bin`` if given.
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.python_bin = python_bin
+
+    def get(self, digest, contents):
+        """
+        Return the path of the extracted library with this digest, extracting ``contents`` if needed.
+        """
+        if not SHA256_RE.match(digest):
+            raise ValueError(f"Not a SHA-256 hex digest: {digest!r}")
+
+        path = os.path.join(self.root, digest)
+        if os.path.isdir(path):
+            # Mark as recently used, for eviction
+            os.utime(path)
+            return path
+
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        _remove_tree(tmp_path)
+        try:
+            self._extract(contents, tmp_path)
+        except BaseException:
+            _remove_tree(tmp_path)
+            raise
+
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # Possibly another worker finished extracting it first
+            _remove_tree(tmp_path)
+            if not os.path.isdir(path):
+                raise
+            return path
+
+        self._evict(keep=digest)
+        return path
+
+    def _extract(self, contents, path):
+        """
+        Extract a library into a new read-only directory, with bytecode.
+        """
+        os.makedirs(path)
+        with zipfile.ZipFile(io.BytesIO(contents)) as archive:
+            # ZipFile.extractall refuses to write outside the target directory
+            archive.extractall(path)
+
+        if self.python_bin:
+            result = subprocess.run(
+                [self.python_bin, '-m', 'compileall', '-q', path],
+                capture_output=True, env={}, timeout=COMPILE_TIMEOUT, check=False,
+            )
+            uncompiled = _uncompiled_modules(path)
+            if result.returncode != 0 or uncompiled:
+                # A module with a syntax error is reported when it's imported,
+                # and the rest of the library is still compiled. But if the
+                # sandbox's Python couldn't write bytecode here at all (such as
+                # when its AppArmor profile doesn't allow it), every import
+                # compiles from source again, which is what this is meant to avoid.
+                log.warning(
+                    f"{len(uncompiled)} modules of library at {path} were not compiled "
+                    f"(compileall exited with {result.returncode}): "
+                    f"uncompiled={uncompiled[:10]!r} stdout={result.stdout[-500:]!r} "
+                    f"stderr={result.stderr[-500:]!r}"
+                )
+
+        _set_tree_writable(path, False)
+
+    def _entries(self):
+        """
+        Return a list of (last used time, path) for each extracted library.
+        """
+        entries = []
+        for entry in os.scandir(self.root):
+            if SHA256_RE.match(entry.name):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:  # evicted by another worker
+                    continue
+        return entries
+
+    def _evict(self, keep):
+        """
+        Remove least recently used extractions until under the size cap, if possible.
+        """
+        entries = sorted(self._entries())
+        sizes = {path: _tree_size(path) for _, path in entries}
+        total = sum(sizes.values())
+        grace_cutoff = time.time() - EVICTION_GRACE_SECONDS
+        for mtime, path in entries:
+            if total <= self.max_bytes or mtime > grace_cutoff:
+                break
+            if os.path.basename(path) == keep:
+                continue
+            _remove_tree(path)
+            total -= sizes[path]
+
+
+_extractions = None
+_extractions_lock = threading.Lock()
+
+
+def get_library_extractions():
+    """
+    Return the library extractions, or None if ``CODEJAIL_LIBRARY_EXTRACT_DIR`` is not set.
+    """
+    global _extractions
+
+    root = getattr(settings, 'CODEJAIL_LIBRARY_EXTRACT_DIR', None)
+    if not root:
+        return None
+
+    with _extractions_lock:
+        if _extractions is None or _extractions.root != root:
+            python_bin = getattr(settings, 'CODE_JAIL', {}).get('python_bin')
+            _extractions = LibraryExtractions(root, settings.CODEJAIL_LIBRARY_EXTRACT_MAX_BYTES, python_bin)
+        return _extractions
+
+
+def extracted_library_dir(digest, contents):
+    """
+    Return the directory of the extracted library, or None if extraction is disabled or fails.
+
+    Never raises; failures are logged, and the caller should fall back to the zip.
+    """
+    extractions = get_library_extractions()
+    if extractions is None:
+        return None
+
+    try:
+        return extractions.get(digest, contents)
+    except (OSError, ValueError, zipfile.BadZipFile, subprocess.SubprocessError) as e:
+        log.warning(f"Unable to extract library {digest}: {e!r}")
+        return None
@@ -0,0 +1,198 @@
+"""
+Content-addressed store of course libraries, so that callers can send a hash instead of the file.
+
+Course libraries (``python_lib.zip``) are the same for every execution in a
+course, and can be large. When ``CODEJAIL_LIBRARY_STORE_DIR`` is set, every
+uploaded library is kept on disk under its SHA-256 hex digest, and a request
+can then name the library by ``python_lib_sha256`` without uploading it. If
+the library isn't in the store (never uploaded, evicted, or uploaded to a
+different host), the request is refused with a 409 and the caller retries
+with the file.
+
+The directory may be shared by all workers on a host. Its total size is kept
+under ``CODEJAIL_LIBRARY_STORE_MAX_BYTES`` by evicting the least recently
+used libraries.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+
+from django.conf import settings
+
+log = logging.getLogger(__name__)
+
+# The only name a course library may have in the sandbox.
+LIBRARY_FILENAME = 'python_lib.zip'
+
+# Response header telling callers that uploaded libraries are being stored,
+# so that they can send just the hash next time.
+LIBRARY_STORE_HEADER = 'X-Codejail-Library-Store'
+
+SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+# How often (in seconds) to re-measure the store's size on disk, since other
+# workers are adding to it as well.
+SIZE_RECHECK_INTERVAL = 60
+
+
+def library_digest(contents):
+    """
+    Return the SHA-256 hex digest by which a library is stored.
+    """
+    return hashlib.sha256(contents).hexdigest()
+
+
+class LibraryStore:
+    """
+    A directory of libraries named by digest, up to a size cap.
+    """
+
+    def __init__(self, root, max_bytes):
+        """
+        Store libraries in directory ``root``, up to ``max_bytes`` in total.
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self._size = None
+        self._size_checked_at = 0
+        self._size_lock = threading.Lock()
+
+    def path_for(self, digest):
+        """
+        Return the path where the library with this digest is (or would be) stored.
+        """
+        if not SHA256_RE.match(digest):
+            raise ValueError(f"Not a SHA-256 hex digest: {digest!r}")
+        return os.path.join(self.root, digest)
+
+    def get(self, digest):
+        """
+        Return the contents of the library with this digest, or None if it isn't stored.
+        """
+        path = self.path_for(digest)
+        try:
+            with open(path, 'rb') as f:
+                contents = f.read()
+        except FileNotFoundError:
+            return None
+
+        # Guard against corruption (e.g. a full disk during an earlier write)
+        if library_digest(contents) != digest:
+            log.warning(f"Removing corrupt library {digest} from store")
+            _remove_quietly(path)
+            return None
+
+        # Mark as recently used, for eviction
+        os.utime(path)
+        return contents
+
+    def put(self, contents):
+        """
+        Store a library (if not already stored) and return its digest.
+        """
+        digest = library_digest(contents)
+        path = self.path_for(digest)
+        if os.path.exists(path):
+            os.utime(path)
+            return digest
+
+        os.makedirs(self.root, exist_ok=True)
+        with self._size_lock:
+            size_before = self._store_size()
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(contents)
+            os.replace(tmp_path, path)
+
+            self._size = size_before + len(contents)
+            if self._size > self.max_bytes:
+                self._evict()
+        return digest
+
+    def _store_size(self):
+        """
+        Return the (approximate) current size of the store in bytes.
+        """
+        now = time.monotonic()
+        if self._size is None or now - self._size_checked_at > SIZE_RECHECK_INTERVAL:
+            self._size = sum(size for _, _, size in self._entries())
+            self._size_checked_at = now
+        return self._size
+
+    def _entries(self):
+        """
+        Return a list of (last used time, path, size) for each stored library.
+        """
+        entries = []
+        for entry in os.scandir(self.root):
+            if SHA256_RE.match(entry.name):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:  # evicted by another worker
+                    continue
+                entries.append((stat.st_mtime, entry.path, stat.st_size))
+        return entries
+
+    def _evict(self):
+        """
+        Remove least recently used libraries until the store is under its size cap.
+        """
+        entries = sorted(self._entries())
+        total = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if total <= self.max_bytes:
+                break
+            _remove_quietly(path)
+            total -= size
+        self._size = total
+        self._size_checked_at = time.monotonic()
+
+
+def _remove_quietly(path):
+    """
+    Remove a file, ignoring it if it's already gone.
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_library_store():
+    """
+    Return the library store, or None if ``CODEJAIL_LIBRARY_STORE_DIR`` is not set.
+    """
+    global _store
+
+    root = getattr(settings, 'CODEJAIL_LIBRARY_STORE_DIR', None)
+    if not root:
+        return None
+
+    with _store_lock:
+        if _store is None or _store.root != root:
+            _store = LibraryStore(root, settings.CODEJAIL_LIBRARY_STORE_MAX_BYTES)
+        return _store
+
+
+def remember_library(contents):
+    """
+    Add an uploaded library to the store, if the store is enabled.
+
+    Never raises; failures are logged.
+    """
+    store = get_library_store()
+    if store is None:
+        return
+
+    try:
+        store.put(contents)
+    except OSError as e:
+        log.warning(f"Unable to add library to store: {e!r}")
@@ -0,0 +1,115 @@
+"""
+Import-aware routing of executions to sandbox pools.
+
+Each pool configured in ``CODEJAIL_WARM_POOLS`` names a set of modules that
+its sandboxes would have preloaded. An execution is routed to the smallest
+pool whose modules cover everything its code imports (standard library
+modules are assumed to be cheap and are ignored), or to "cold" if no pool
+covers it. Imports are found by parsing the code; it is never executed here.
+
+This module only decides and accounts for the routing. Every execution is
+still run in a freshly spawned sandbox, so the per-pool statistics show how
+pool composition *would* perform: the hit rate of each pool, and the peak
+memory and CPU time of the executions it would serve.
+"""
+
+import sys
+import threading
+
+from django.conf import settings
+from edx_django_utils.monitoring import set_custom_attribute
+
+from codejail_service.imports import extract_imports
+
+# Route name for executions that no pool covers.
+COLD = 'cold'
+
+
+def get_pools():
+    """
+    Return a list of (pool name, frozenset of module names), smallest pools first.
+    """
+    pools = getattr(settings, 'CODEJAIL_WARM_POOLS', None) or {}
+    return sorted(
+        ((name, frozenset(config.get('modules', ()))) for name, config in pools.items()),
+        key=lambda pool: (len(pool[1]), pool[0]),
+    )
+
+
+def choose_pool(code):
+    """
+    Return the name of the pool that should serve ``code``, or COLD if none covers it.
+
+    Returns None if no pools are configured (routing is disabled).
+    """
+    pools = get_pools()
+    if not pools:
+        return None
+
+    needed = {module for module in extract_imports(code) if module not in sys.stdlib_module_names}
+    for name, modules in pools:
+        if needed <= modules:
+            return name
+    return COLD
+
+
+class PoolStats:
+    """
+    Per-route counts and resource usage in this worker process.
+    """
+
+    def __init__(self):
+        """
+        Start with no routes recorded.
+        """
+        self._lock = threading.Lock()
+        self.routes = {}
+
+    def record(self, pool, usage):
+        """
+        Record an execution's usage against the route it was assigned.
+        """
+        with self._lock:
+            stats = self.routes.setdefault(pool, {'executions': 0, 'cpu': 0.0, 'max_rss_kb': 0})
+            stats['executions'] += 1
+            stats['cpu'] += usage.cpu_user + usage.cpu_sys
+            if usage.max_rss_kb is not None:
+                stats['max_rss_kb'] = max(stats['max_rss_kb'], usage.max_rss_kb)
+
+    def report(self):
+        """
+        Return per-route statistics, including each route's share of executions (hit rate).
+        """
+        with self._lock:
+            total = sum(stats['executions'] for stats in self.routes.values())
+            return {
+                pool: {**stats, 'hit_rate': stats['executions'] / total}
+                for pool, stats in self.routes.items()
+            }
+
+
+POOL_STATS = PoolStats()
+
+
+def route_execution(code):
+    """
+    Choose the route for an execution and record it as a custom attribute.
+
+    Returns the route name, or None if routing is disabled.
+    """
+    pool = choose_pool(code)
+    if pool is not None:
+        # .. custom_attribute_name: codejail.exec.pool
+        # .. custom_attribute_description: The sandbox pool whose preloaded modules cover
+        #   the imports of the submitted code, or "cold" if none does. Only present when
+        #   ``CODEJAIL_WARM_POOLS`` is configured.
+        set_custom_attribute('codejail.exec.pool', pool)
+    return pool
+
+
+def record_route_usage(pool, usage):
+    """
+    Add an execution's resource usage to its route's statistics, if routing is enabled.
+    """
+    if pool is not None:
+        POOL_STATS.record(pool, usage)
@@ -0,0 +1,317 @@
+"""
+Environment setup for code running inside the sandbox.
+
+The sandboxed Python is started with ``-E``, so environment variables can't
+be passed to it in the usual way. Instead, we prepend a short prolog to the
+submitted code which adjusts the sandbox process before any of the submitted
+code runs.
+"""
+
+import io
+import itertools
+import os
+import re
+import tokenize
+from textwrap import dedent
+
+from django.conf import settings
+from edx_django_utils.monitoring import set_custom_attribute
+
+# Subdirectories of CODEJAIL_SANDBOX_CACHE_DIR for each library's cache.
+MATPLOTLIB_CACHE_SUBDIR = 'matplotlib'
+NLTK_DATA_SUBDIR = 'nltk_data'
+
+# Where matplotlib's cache is copied to inside the sandbox, relative to the
+# sandbox's working directory. matplotlib refuses to use a config directory
+# it can't write to (and rebuilds its font cache in a temporary one instead),
+# so we give it a writable copy of the prebuilt cache rather than pointing it
+# directly at the read-only one.
+SANDBOX_MPLCONFIGDIR = 'tmp/matplotlib'
+
+# Environment variables that control the size of thread pools in numeric
+# libraries (BLAS backends, OpenMP, numexpr). These are read when the library
+# is first imported, so they must be set before any submitted code runs.
+THREAD_LIMIT_VARS = [
+    'OPENBLAS_NUM_THREADS',
+    'OMP_NUM_THREADS',
+    'MKL_NUM_THREADS',
+    'NUMEXPR_NUM_THREADS',
+    'VECLIB_MAXIMUM_THREADS',
+]
+
+
+def get_cache_dirs(cache_dir):
+    """
+    Return a dict of library names to their cache directories under ``cache_dir``.
+    """
+    return {
+        'matplotlib': os.path.join(cache_dir, MATPLOTLIB_CACHE_SUBDIR),
+        'nltk': os.path.join(cache_dir, NLTK_DATA_SUBDIR),
+    }
+
+
+# Scheduling policies that an unprivileged process may switch itself to.
+SCHED_POLICIES = {
+    'batch': 'SCHED_BATCH',
+    'idle': 'SCHED_IDLE',
+}
+
+# Round-robin position for CPU pinning. Starting from the PID spreads the
+# sandboxes of different workers over different CPUs. This module is
+# imported before gunicorn forks its workers, so each one starts again from
+# its own PID after the fork.
+_cpu_rotation = itertools.count(os.getpid())
+
+
+def _reseed_cpu_rotation():
+    """
+    Start the CPU pinning rotation from this process's PID.
+    """
+    global _cpu_rotation
+    _cpu_rotation = itertools.count(os.getpid())
+
+
+os.register_at_fork(after_in_child=_reseed_cpu_rotation)
+
+
+def available_cpus():
+    """
+    Return a sorted list of the CPUs this process may run on.
+    """
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:  # pragma: no cover
+        # Not available on all platforms
+        return list(range(os.cpu_count() or 1))
+
+
+def get_sandbox_cpus():
+    """
+    Return a sorted list of the CPUs that sandboxes may run on.
+
+    This is all available CPUs except those reserved for the webapp by
+    ``CODEJAIL_SANDBOX_RESERVED_CPUS``. If nothing would be left over, the
+    reservation is ignored.
+    """
+    cpus = available_cpus()
+    reserved = getattr(settings, 'CODEJAIL_SANDBOX_RESERVED_CPUS', 0) or 0
+    return cpus[reserved:] or cpus
+
+
+def get_sandbox_capacity():
+    """
+    Return the number of sandboxes expected to run concurrently on this host.
+    """
+    return getattr(settings, 'CODEJAIL_SANDBOX_CAPACITY', None) or len(get_sandbox_cpus())
+
+
+def get_thread_limit(limit_overrides_context=None):
+    """
+    Return the number of threads numeric libraries may use in one sandbox.
+
+    Explicit settings win (per limit-override context first); otherwise, the
+    CPUs are divided evenly among the sandboxes that may run at once.
+    """
+    overrides = getattr(settings, 'CODEJAIL_SANDBOX_THREADS_OVERRIDES', None) or {}
+    if limit_overrides_context in overrides:
+        return overrides[limit_overrides_context]
+
+    configured = getattr(settings, 'CODEJAIL_SANDBOX_THREADS', None)
+    if configured:
+        return configured
+
+    return max(1, len(get_sandbox_cpus()) // get_sandbox_capacity())
+
+
+def choose_cpu_placement(limit_overrides_context=None):
+    """
+    Choose the CPUs that the next sandbox will be pinned to.
+
+    Each sandbox gets as many CPUs as it is allowed threads, taken in
+    round-robin order from the sandbox CPUs. Returns a sorted list of CPU
+    numbers, or None if pinning is disabled.
+    """
+    if not getattr(settings, 'CODEJAIL_SANDBOX_CPU_PINNING', False):
+        return None
+
+    cpus = get_sandbox_cpus()
+    count = min(len(cpus), get_thread_limit(limit_overrides_context))
+    start = next(_cpu_rotation)
+    return sorted(cpus[(start + i) % len(cpus)] for i in range(count))
+
+
+def _thread_prolog_lines(limit_overrides_context):
+    """
+    Return prolog source lines capping thread pools in numeric libraries.
+    """
+    threads = str(get_thread_limit(limit_overrides_context))
+    return [f"os.environ[{var!r}] = {threads!r}" for var in THREAD_LIMIT_VARS]
+
+
+def _scheduling_prolog_lines(limit_overrides_context):
+    """
+    Return prolog source lines setting CPU placement and priority of the sandbox.
+
+    Failures are ignored, as these are optimizations rather than security
+    measures. (The submitted code could undo the affinity, although it cannot
+    raise its own priority again.)
+    """
+    lines = []
+
+    policy = getattr(settings, 'CODEJAIL_SANDBOX_SCHED_POLICY', None)
+    if policy:
+        lines.append(_ignoring_oserror(
+            f"os.sched_setscheduler(0, os.{SCHED_POLICIES[policy]}, os.sched_param(0))"
+        ))
+
+    nice = getattr(settings, 'CODEJAIL_SANDBOX_NICE', 0)
+    if nice:
+        lines.append(_ignoring_oserror(f"os.nice({int(nice)})"))
+
+    cpus = choose_cpu_placement(limit_overrides_context)
+    if cpus is not None:
+        lines.append(_ignoring_oserror(f"os.sched_setaffinity(0, {set(cpus)!r})"))
+        # .. custom_attribute_name: codejail.exec.cpus
+        # .. custom_attribute_description: Comma-separated list of the CPUs that the
+        #   sandbox was pinned to, when ``CODEJAIL_SANDBOX_CPU_PINNING`` is enabled.
+        set_custom_attribute('codejail.exec.cpus', ','.join(str(cpu) for cpu in cpus))
+
+    return lines
+
+
+def _ignoring_oserror(statement):
+    """
+    Wrap a prolog statement so that an OSError doesn't prevent execution.
+    """
+    return f"try:\n    {statement}\nexcept OSError:\n    pass"
+
+
+def _cache_prolog_lines():
+    """
+    Return prolog source lines pointing libraries at the prebuilt caches.
+
+    The matplotlib cache is only copied (see ``SANDBOX_MPLCONFIGDIR``) when
+    matplotlib is first imported, by a finder at the front of
+    ``sys.meta_path``, so that executions which don't use matplotlib don't
+    pay for the copy.
+    """
+    cache_dir = getattr(settings, 'CODEJAIL_SANDBOX_CACHE_DIR', None)
+    if not cache_dir:
+        return []
+
+    cache_dirs = get_cache_dirs(cache_dir)
+    return [
+        dedent(f"""
+            os.environ['NLTK_DATA'] = {cache_dirs['nltk']!r}
+            os.environ['MPLCONFIGDIR'] = {SANDBOX_MPLCONFIGDIR!r}
+            class MatplotlibCacheInstaller:
+                def find_spec(self, name, path=None, target=None):
+                    if name == 'matplotlib':
+                        sys.meta_path.remove(self)
+                        import shutil
+                        try:
+                            shutil.copytree({cache_dirs['matplotlib']!r}, {SANDBOX_MPLCONFIGDIR!r}, dirs_exist_ok=True)
+                        except OSError:
+                            pass
+                    return None
+            sys.meta_path.insert(0, MatplotlibCacheInstaller())
+        """).strip(),
+    ]
+
+
+def _library_prolog_lines(library_dir):
+    """
+    Return prolog source lines making a pre-extracted course library importable.
+    """
+    if not library_dir:
+        return []
+
+    # Appended, as codejail would have appended the zip
+    return [f"sys.path.append({library_dir!r})"]
+
+
+def get_sandbox_prolog(limit_overrides_context=None, library_dir=None):
+    """
+    Return Python source to be prepended to code before it is sandboxed.
+
+    The prolog is a single line, so that line numbers in tracebacks from the
+    submitted code are only shifted by one. It runs in its own namespace so
+    that it does not add anything to the globals returned to the caller.
+
+    Arguments:
+        limit_overrides_context: The execution's limit-override context, if any,
+            which may select different settings
+        library_dir: Directory of the pre-extracted course library, if any
+            (see ``library_extract``), to put on ``sys.path``
+    """
+    lines = [
+        *_thread_prolog_lines(limit_overrides_context),
+        *_scheduling_prolog_lines(limit_overrides_context),
+        *_cache_prolog_lines(),
+        *_library_prolog_lines(library_dir),
+    ]
+    source = "\n".join(["import os", "import sys", *lines])
+    return f"exec({source!r}, {{}})\n"
+
+
+# Line endings, as counted by the Python parser.
+_LINE_END = re.compile(r'\r\n|\r|\n')
+
+
+def _header_end(code):
+    """
+    Return the offset in ``code`` just past its docstring and ``__future__`` imports, if any.
+
+    Those must come before any other statement, so the prolog can only go
+    after them. The offset is at the end of a line, or of the code.
+    """
+    # Only worth looking for if there might be __future__ imports
+    if '__future__' not in code:
+        return 0
+
+    # The code is untrusted, so rather than parsing all of it, only the
+    # leading statements are tokenized (lazily, and without recursion).
+    tokens = tokenize.generate_tokens(io.StringIO(code, newline=None).readline)
+    end_lineno = 0
+    statement = []
+    try:
+        for token in tokens:
+            if token.type in (tokenize.COMMENT, tokenize.NL):
+                continue
+            if token.type in (tokenize.NEWLINE, tokenize.ENDMARKER):
+                if not statement:
+                    break
+                end_lineno = token.start[0]
+                statement = []
+                continue
+            statement.append(token)
+            # Stop at the first token showing this isn't a header statement
+            is_docstring = not end_lineno and all(t.type == tokenize.STRING for t in statement)
+            is_future_import = [t.string for t in statement[:2]] == ['from', '__future__'][:len(statement)]
+            if not (is_docstring or is_future_import):
+                break
+    except (tokenize.TokenError, SyntaxError):
+        # Let the sandbox report the error
+        return 0
+    if not end_lineno:
+        return 0
+
+    for (lineno, match) in enumerate(_LINE_END.finditer(code), start=1):
+        if lineno == end_lineno:
+            return match.end()
+    return len(code)
+
+
+def add_sandbox_prolog(code, limit_overrides_context=None, library_dir=None):
+    """
+    Return ``code`` with the sandbox prolog (see ``get_sandbox_prolog``) added.
+
+    The prolog goes at the start, or after the docstring and ``__future__``
+    imports if there are any, since those must come first.
+    """
+    prolog = get_sandbox_prolog(limit_overrides_context, library_dir)
+    split = _header_end(code)
+    (header, rest) = (code[:split], code[split:])
+    if header and not _LINE_END.match(header[-1]):
+        header += "\n"
+    return header + prolog + rest
@@ -0,0 +1,215 @@
+"""
+Watchdog for sandbox processes: NPROC accounting and removal of leftovers.
+
+All sandboxes on a host run as the same sandbox user (or one of a few, see
+``sandbox_users``), and ``RLIMIT_NPROC`` limits the number of processes and
+threads owned by that user in total (see the deployment docs). Processes forked by submitted code that escape
+codejail's cleanup keep counting against that limit, and a few of them can
+cause later sandboxes to fail to fork under load.
+
+The watchdog runs as a thread in each worker (started by a gunicorn hook).
+Every ``CODEJAIL_PROCESS_WATCHDOG_INTERVAL`` seconds it scans ``/proc`` for
+processes owned by each sandbox user, counting them and their threads, and
+kills any that have been running for longer than any execution can last,
+using the ``sudo pkill`` that codejail's sudoers configuration allows. It
+keeps the resulting NPROC headroom, which the code-exec view consults to
+refuse executions that would likely fail to start.
+"""
+
+import logging
+import os
+import pwd
+import subprocess
+import threading
+import time
+
+from django.conf import settings
+
+from codejail_service.sandbox_users import get_sandbox_user_names
+
+log = logging.getLogger(__name__)
+
+# codejail's defaults, if not set in CODE_JAIL['limits'].
+DEFAULT_NPROC = 15
+DEFAULT_REALTIME = 3
+
+# Time in seconds allowed, beyond the longest wall-clock limit, for codejail
+# to kill and clean up a sandbox before its processes are treated as leftovers.
+CLEANUP_GRACE_SECONDS = 60
+
+
+def get_max_execution_seconds():
+    """
+    Return the age in seconds beyond which a sandbox process is a leftover.
+
+    Uses ``CODEJAIL_SANDBOX_PROCESS_MAX_AGE`` if set, and otherwise the
+    longest wall-clock limit of any limit-override context, plus a grace period.
+    """
+    if (configured := getattr(settings, 'CODEJAIL_SANDBOX_PROCESS_MAX_AGE', None)) is not None:
+        return configured
+
+    code_jail = getattr(settings, 'CODE_JAIL', {})
+    realtimes = [code_jail.get('limits', {}).get('REALTIME', DEFAULT_REALTIME)]
+    realtimes += [
+        overrides['REALTIME']
+        for overrides in code_jail.get('limit_overrides', {}).values()
+        if 'REALTIME' in overrides
+    ]
+    return max(realtimes) + CLEANUP_GRACE_SECONDS
+
+
+def _read_uptime():
+    """
+    Return the system uptime in seconds.
+    """
+    with open('/proc/uptime', encoding='ascii') as f:
+        return float(f.read().split()[0])
+
+
+def scan_processes(uid, proc_root='/proc'):
+    """
+    Return a list of (pid, thread count, age in seconds) for processes whose real UID is ``uid``.
+    """
+    ticks_per_second = os.sysconf('SC_CLK_TCK')
+    uptime = _read_uptime()
+    processes = []
+    for name in os.listdir(proc_root):
+        if not name.isdigit():
+            continue
+        try:
+            with open(os.path.join(proc_root, name, 'status'), encoding='utf-8') as f:
+                status = dict(line.split(':', 1) for line in f if ':' in line)
+            with open(os.path.join(proc_root, name, 'stat'), encoding='utf-8') as f:
+                stat = f.read()
+        except OSError:  # exited in the meantime
+            continue
+
+        if int(status['Uid'].split()[0]) != uid:
+            continue
+        # The command name (in parentheses) may contain spaces; start time is
+        # the 22nd field overall, so the 20th after the command name.
+        start_ticks = int(stat.rsplit(')', 1)[1].split()[19])
+        processes.append((int(name), int(status['Threads']), uptime - start_ticks / ticks_per_second))
+    return processes
+
+
+class ProcessWatchdog:
+    """
+    Tracks processes owned by the sandbox users, and kills leftovers.
+    """
+
+    def __init__(self):
+        """
+        Start with no checks recorded.
+        """
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def check(self):
+        """
+        Scan the sandbox users' processes, kill leftovers, and record the results.
+
+        Returns the recorded snapshot, or None if there is no sandbox user.
+        """
+        users = get_sandbox_user_names()
+        if not users:
+            return None
+        nproc = getattr(settings, 'CODE_JAIL', {}).get('limits', {}).get('NPROC', DEFAULT_NPROC)
+        max_age = get_max_execution_seconds()
+
+        per_user = {user: self._check_user(user, nproc, max_age) for user in users}
+        snapshot = {
+            'checked_at': time.time(),
+            'processes': sum(counts['processes'] for counts in per_user.values()),
+            'threads': sum(counts['threads'] for counts in per_user.values()),
+            'leftovers_killed': sum(counts['leftovers_killed'] for counts in per_user.values()),
+            'nproc_limit': nproc,
+            # NPROC applies to each user separately, so the busiest one sets the headroom
+            'nproc_headroom': min(counts['nproc_headroom'] for counts in per_user.values()),
+            'users': per_user,
+        }
+        with self._lock:
+            total_killed = (self._snapshot or {}).get('total_leftovers_killed', 0) + snapshot['leftovers_killed']
+            self._snapshot = {**snapshot, 'total_leftovers_killed': total_killed}
+            return dict(self._snapshot)
+
+    def _check_user(self, user, nproc, max_age):
+        """
+        Scan one sandbox user's processes and kill leftovers, returning counts.
+        """
+        uid = pwd.getpwnam(user).pw_uid
+        processes = scan_processes(uid)
+        leftovers = [(pid, threads) for (pid, threads, age) in processes if age > max_age]
+        if leftovers:
+            log.warning(
+                f"Killing {len(leftovers)} leftover processes of sandbox user {user} "
+                f"(PIDs {sorted(pid for pid, _ in leftovers)}) older than {max_age} seconds"
+            )
+            subprocess.run(
+                ['sudo', 'pkill', '-9', '-u', user, '--older', str(int(max_age))],
+                capture_output=True, timeout=30, check=False,
+            )
+
+        threads = sum(count for (_pid, count, _age) in processes)
+        return {
+            'processes': len(processes),
+            'threads': threads,
+            'leftovers_killed': len(leftovers),
+            # Killed leftovers will be gone shortly
+            'nproc_headroom': nproc - threads + sum(count for (_pid, count) in leftovers),
+        }
+
+    def headroom(self):
+        """
+        Return the NPROC headroom from a recent check, or None if there isn't one.
+        """
+        interval = getattr(settings, 'CODEJAIL_PROCESS_WATCHDOG_INTERVAL', 0)
+        with self._lock:
+            if not interval or self._snapshot is None:
+                return None
+            # Don't act on stale readings, e.g. if the watchdog has died
+            if time.time() - self._snapshot['checked_at'] > 3 * interval:
+                return None
+            return self._snapshot['nproc_headroom']
+
+    def report(self):
+        """
+        Return a JSON-ready copy of the latest check, or None.
+        """
+        with self._lock:
+            return None if self._snapshot is None else dict(self._snapshot)
+
+
+SANDBOX_PROCESSES = ProcessWatchdog()
+
+_started_in_pid = None
+
+
+def _run_forever(watchdog, interval):
+    """
+    Check every ``interval`` seconds. Never raises.
+    """
+    while True:
+        try:
+            watchdog.check()
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            log.error(f"Error in sandbox process watchdog: {e!r}", exc_info=True)
+        time.sleep(interval)
+
+
+def start_process_watchdog():
+    """
+    Start the watchdog thread in this process, if enabled and not already started.
+
+    Call from each worker process after it has been forked.
+    """
+    global _started_in_pid
+
+    interval = getattr(settings, 'CODEJAIL_PROCESS_WATCHDOG_INTERVAL', 0)
+    if not interval or _started_in_pid == os.getpid():
+        return
+
+    _started_in_pid = os.getpid()
+    threading.Thread(
+        target=_run_forever, args=(SANDBOX_PROCESSES, interval), name='codejail-process-watchdog', daemon=True,
+    ).start()
@@ -0,0 +1,212 @@
+"""
+Spreading concurrent executions across several sandbox users.
+
+``RLIMIT_NPROC`` is accounted per UID, so when every sandbox runs as the
+same user, ``CODE_JAIL.limits.NPROC`` has to allow for all of the
+executions that may be running on a host at once. With
+``CODEJAIL_SANDBOX_USERS``, each execution instead runs as one of several
+sandbox users, each with its own sandbox Python (and so its own sudoers
+entry and AppArmor binding), and no more than
+``CODEJAIL_SANDBOX_USER_CONCURRENCY`` executions run as any one user at a
+time. ``NPROC`` then only needs to cover that many executions.
+
+Workers on a host coordinate through lock files, one per slot (user and
+index). An execution takes the first free slot, starting from a different
+one each time; if all are taken, it checks again every
+``SLOT_POLL_SECONDS`` until any one is free.
+
+codejail keeps a single, process-wide table of configured commands, so the
+chosen user and Python are configured for the current thread only (see
+``_ThreadCommands``). Threads of a worker can then run executions as
+different users at the same time.
+"""
+
+import contextlib
+import fcntl
+import itertools
+import os
+import tempfile
+import threading
+import time
+
+from codejail import jail_code
+from codejail.jail_code import configure
+from django.conf import settings
+from edx_django_utils.monitoring import set_custom_attribute
+
+# Where each execution starts looking for a free slot. Starting from the PID
+# spreads the workers over different slots; this module is imported before
+# gunicorn forks its workers, so each one starts again from its own PID after
+# the fork.
+_next_slot = itertools.count(os.getpid())
+
+
+def _reseed_next_slot():
+    """
+    Start the slot rotation from this process's PID.
+    """
+    global _next_slot
+    _next_slot = itertools.count(os.getpid())
+
+
+os.register_at_fork(after_in_child=_reseed_next_slot)
+
+# How often to look again for a free slot, when all are taken.
+SLOT_POLL_SECONDS = 0.05
+
+# Restricts executions in the current thread to one user, for startup checks.
+_pinned = threading.local()
+
+
+def get_sandbox_users():
+    """
+    Return the configured sandbox users, as a list of dicts with keys ``user`` and ``python_bin``.
+
+    Empty if ``CODEJAIL_SANDBOX_USERS`` is not set, in which case codejail's
+    own configuration (``CODE_JAIL``) is used as is.
+    """
+    return list(getattr(settings, 'CODEJAIL_SANDBOX_USERS', None) or [])
+
+
+def get_sandbox_user_names():
+    """
+    Return the names of all users that sandboxes may run as.
+    """
+    if users := get_sandbox_users():
+        return [user['user'] for user in users]
+    if user := getattr(settings, 'CODE_JAIL', {}).get('user'):
+        return [user]
+    return []
+
+
+@contextlib.contextmanager
+def pinned_sandbox_user(user):
+    """
+    Run executions in this thread as the given sandbox user, within the context.
+    """
+    _pinned.user = user
+    try:
+        yield
+    finally:
+        _pinned.user = None
+
+
+class _ThreadCommands(dict):
+    """
+    codejail's table of configured commands, with overrides for the current thread.
+
+    Installed in place of ``codejail.jail_code.COMMANDS``. Within
+    ``overriding()``, commands configured by a thread are only seen by that
+    thread, and only until the context exits; elsewhere, this behaves as a
+    plain dict.
+    """
+
+    def __init__(self, commands):
+        """
+        Start with the commands already configured in ``commands``.
+        """
+        super().__init__(commands)
+        self._local = threading.local()
+
+    def _overrides(self):
+        return getattr(self._local, 'overrides', None)
+
+    def __getitem__(self, command):
+        overrides = self._overrides()
+        if overrides is not None and command in overrides:
+            return overrides[command]
+        return super().__getitem__(command)
+
+    def __contains__(self, command):
+        overrides = self._overrides()
+        return (overrides is not None and command in overrides) or super().__contains__(command)
+
+    def __setitem__(self, command, value):
+        overrides = self._overrides()
+        if overrides is not None:
+            overrides[command] = value
+        else:
+            super().__setitem__(command, value)
+
+    @contextlib.contextmanager
+    def overriding(self):
+        """
+        Make commands configured by this thread, within the context, private to it.
+        """
+        self._local.overrides = {}
+        try:
+            yield
+        finally:
+            self._local.overrides = None
+
+
+def _thread_commands():
+    """
+    Return codejail's command table, first replacing it with a ``_ThreadCommands`` if needed.
+    """
+    if not isinstance(jail_code.COMMANDS, _ThreadCommands):
+        jail_code.COMMANDS = _ThreadCommands(jail_code.COMMANDS)
+    return jail_code.COMMANDS
+
+
+def _lock_path(user, index):
+    lock_dir = getattr(settings, 'CODEJAIL_SANDBOX_USER_LOCK_DIR', None) or tempfile.gettempdir()
+    return os.path.join(lock_dir, f".codejail-user-{user}.{index}.lock")
+
+
+def _open_lock(user, index):
+    return open(_lock_path(user['user'], index), 'a', encoding='utf-8')
+
+
+def _take_free_slot(slots):
+    """
+    Lock the first free slot of ``slots``, and return a tuple of (lock file, user), or None if all are taken.
+    """
+    for (user, index) in slots:
+        lock_file = _open_lock(user, index)
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            continue
+        return (lock_file, user)
+    return None
+
+
+@contextlib.contextmanager
+def sandbox_user_slot():
+    """
+    Hold a slot for one execution as one of the configured sandbox users, and configure codejail to use it.
+
+    Yields the user's name, or None if multiple sandbox users are not configured.
+    """
+    users = get_sandbox_users()
+    if pinned := getattr(_pinned, 'user', None):
+        users = [user for user in users if user['user'] == pinned]
+    if not users:
+        yield None
+        return
+
+    # Interleave users, so that consecutive slots belong to different users
+    concurrency = getattr(settings, 'CODEJAIL_SANDBOX_USER_CONCURRENCY', 1)
+    slots = [(user, index) for index in range(concurrency) for user in users]
+    start = next(_next_slot) % len(slots)
+    slots = slots[start:] + slots[:start]
+
+    # If all are busy, poll rather than block on one of them, since any of
+    # them may be the next to free up.
+    while (taken := _take_free_slot(slots)) is None:
+        time.sleep(SLOT_POLL_SECONDS)
+    (lock_file, chosen) = taken
+
+    try:
+        with _thread_commands().overriding():
+            configure('python', chosen['python_bin'], user=chosen['user'])
+            # .. custom_attribute_name: codejail.exec.sandbox_user
+            # .. custom_attribute_description: The sandbox user an execution ran as, when several
+            #   are configured with ``CODEJAIL_SANDBOX_USERS``.
+            set_custom_attribute('codejail.exec.sandbox_user', chosen['user'])
+            yield chosen['user']
+    finally:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
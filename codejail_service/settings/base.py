@@ -31,7 +31,7 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE = (
-    'edx_django_utils.monitoring.DeploymentMonitoringMiddleware',  # python and django version
+    'codejail_service.apps.core.middleware.DeploymentMonitoringMiddleware',  # python and django version
     'edx_django_utils.monitoring.CachedCustomMonitoringMiddleware',  # support accumulate & increment
 
     'django.middleware.locale.LocaleMiddleware',
@@ -48,6 +48,10 @@ REST_FRAMEWORK = {
     'STRICT_JSON': False,
 }
 
+# Course libraries are spooled to disk and hashed as they are uploaded, rather
+# than held in memory.
+FILE_UPLOAD_HANDLERS = ['codejail_service.uploads.HashingFileUploadHandler']
+
 ROOT_URLCONF = 'codejail_service.urls'
 
 # Python dotted path to the WSGI application used by Django's runserver.
@@ -72,6 +76,368 @@ LOCALE_PATHS = (
     root('conf', 'locale'),
 )
 
+# Codejail service
+
+# .. setting_name: CODEJAIL_SANDBOX_CACHE_DIR
+# .. setting_default: None
+# .. setting_description: Directory containing read-only caches for sandbox libraries,
+#   as built by the ``build_sandbox_caches`` management command. When set, sandboxed
+#   code is pointed at these caches so that libraries such as matplotlib don't
+#   rebuild them on every execution. The sandbox must be allowed to read this
+#   directory.
+CODEJAIL_SANDBOX_CACHE_DIR = None
+
+# .. setting_name: CODEJAIL_SANDBOX_CAPACITY
+# .. setting_default: None
+# .. setting_description: Number of sandboxes that may run concurrently on one host
+#   (across all workers). Used to divide up CPUs between sandboxes. If unset, this
+#   defaults to the number of available CPUs.
+CODEJAIL_SANDBOX_CAPACITY = None
+
+# .. setting_name: CODEJAIL_SANDBOX_THREADS
+# .. setting_default: None
+# .. setting_description: Number of threads that numeric libraries (OpenBLAS, MKL,
+#   OpenMP, numexpr) may use inside a sandbox. If unset, this is the number of
+#   available CPUs divided by ``CODEJAIL_SANDBOX_CAPACITY``, with a minimum of 1.
+#   Keep in mind that each thread counts against ``CODE_JAIL.limits.NPROC``.
+CODEJAIL_SANDBOX_THREADS = None
+
+# .. setting_name: CODEJAIL_SANDBOX_THREADS_OVERRIDES
+# .. setting_default: {}
+# .. setting_description: Dictionary of ``limit_overrides_context`` values to thread
+#   counts, overriding ``CODEJAIL_SANDBOX_THREADS`` for executions requesting those
+#   contexts. Analogous to ``CODE_JAIL.limit_overrides``.
+CODEJAIL_SANDBOX_THREADS_OVERRIDES = {}
+
+# .. setting_name: CODEJAIL_SANDBOX_RESERVED_CPUS
+# .. setting_default: 0
+# .. setting_description: Number of CPUs (the lowest-numbered of those available) on
+#   which sandboxes should not run, leaving them to the webapp so that health checks
+#   and request parsing are not starved. Only affects sandbox placement when
+#   ``CODEJAIL_SANDBOX_CPU_PINNING`` is enabled, but always reduces the CPU count
+#   used to derive default thread limits.
+CODEJAIL_SANDBOX_RESERVED_CPUS = 0
+
+# .. setting_name: CODEJAIL_SANDBOX_CPU_PINNING
+# .. setting_default: False
+# .. setting_description: If True, pin each sandbox to its own set of CPUs (as many
+#   as its thread limit), chosen round-robin from the CPUs not reserved by
+#   ``CODEJAIL_SANDBOX_RESERVED_CPUS``.
+CODEJAIL_SANDBOX_CPU_PINNING = False
+
+# .. setting_name: CODEJAIL_SANDBOX_NICE
+# .. setting_default: 0
+# .. setting_description: Niceness increment applied to sandbox processes, lowering
+#   their CPU priority relative to the webapp.
+CODEJAIL_SANDBOX_NICE = 0
+
+# .. setting_name: CODEJAIL_SANDBOX_SCHED_POLICY
+# .. setting_default: None
+# .. setting_description: Linux scheduling policy for sandbox processes: ``'batch'``
+#   (``SCHED_BATCH``), ``'idle'`` (``SCHED_IDLE``), or None to leave the default.
+CODEJAIL_SANDBOX_SCHED_POLICY = None
+
+# .. setting_name: CODEJAIL_USAGE_RESPONSE_HEADER
+# .. setting_default: False
+# .. setting_description: If True, report each execution's sandbox resource usage
+#   (CPU time, wall time, and peak memory when known) to the caller in an
+#   ``X-Codejail-Usage`` response header.
+CODEJAIL_USAGE_RESPONSE_HEADER = False
+
+# .. setting_name: CODEJAIL_USAGE_LOG_INTERVAL
+# .. setting_default: 1000
+# .. setting_description: Log each worker's running totals of sandbox resource usage
+#   every this many executions. Set to 0 to disable.
+CODEJAIL_USAGE_LOG_INTERVAL = 1000
+
+# .. setting_name: CODEJAIL_SLOW_PROBLEMS_TOP_K
+# .. setting_default: 20
+# .. setting_description: Number of slugs to keep in each worker's summary of the
+#   problems consuming the most sandbox time.
+CODEJAIL_SLOW_PROBLEMS_TOP_K = 20
+
+# .. setting_name: CODEJAIL_SLOW_PROBLEMS_HALF_LIFE
+# .. setting_default: 3600
+# .. setting_description: Half-life, in seconds, of the costs in the slow-problem
+#   summary, so that it reflects recent load. Set to 0 to never decay.
+CODEJAIL_SLOW_PROBLEMS_HALF_LIFE = 3600
+
+# .. setting_name: CODEJAIL_CIRCUIT_BREAKER_THRESHOLD
+# .. setting_default: 0
+# .. setting_description: Number of consecutive executions of the same code that must be
+#   killed for exceeding time or memory limits (within ``CODEJAIL_CIRCUIT_BREAKER_WINDOW``)
+#   before further identical executions are answered with the cached error instead of
+#   being run. Set to 0 to disable the circuit breaker.
+CODEJAIL_CIRCUIT_BREAKER_THRESHOLD = 0
+
+# .. setting_name: CODEJAIL_CIRCUIT_BREAKER_WINDOW
+# .. setting_default: 600
+# .. setting_description: Window, in seconds, in which resource limit kills are counted
+#   towards ``CODEJAIL_CIRCUIT_BREAKER_THRESHOLD``.
+CODEJAIL_CIRCUIT_BREAKER_WINDOW = 600
+
+# .. setting_name: CODEJAIL_CIRCUIT_BREAKER_COOLDOWN
+# .. setting_default: 300
+# .. setting_description: Seconds for which an open circuit breaker skips executions
+#   before letting one through as a probe.
+CODEJAIL_CIRCUIT_BREAKER_COOLDOWN = 300
+
+# .. setting_name: CODEJAIL_CIRCUIT_BREAKER_KEY
+# .. setting_default: 'code'
+# .. setting_description: What identifies "the same code" for the circuit breaker:
+#   ``'code'`` for a hash of the code, globals, and uploaded course library, or ``'slug'`` for
+#   the slug sent by the caller.
+CODEJAIL_CIRCUIT_BREAKER_KEY = 'code'
+
+# .. setting_name: CODEJAIL_CAPTURE_DIR
+# .. setting_default: None
+# .. setting_description: If set, a sample of valid code-exec requests (payload and
+#   uploaded files) is saved to a corpus in this directory, for replay with
+#   ``benchmarks/replay.py``. The corpus contains learner-submitted code and data.
+CODEJAIL_CAPTURE_DIR = None
+
+# .. setting_name: CODEJAIL_CAPTURE_SAMPLE_RATE
+# .. setting_default: 0.01
+# .. setting_description: Fraction of requests to capture when ``CODEJAIL_CAPTURE_DIR`` is set.
+CODEJAIL_CAPTURE_SAMPLE_RATE = 0.01
+
+# .. setting_name: CODEJAIL_CAPTURE_MAX_BYTES
+# .. setting_default: 1 GiB
+# .. setting_description: Capture stops once the corpus reaches roughly this size.
+CODEJAIL_CAPTURE_MAX_BYTES = 1024 ** 3
+
+# .. setting_name: CODEJAIL_LIBRARY_STORE_DIR
+# .. setting_default: None
+# .. setting_description: If set, uploaded course libraries are kept in this directory
+#   under their SHA-256 digest, and callers may then send ``python_lib_sha256`` in place
+#   of uploading the library again. Requests naming a library that isn't stored are
+#   refused with a 409, and the caller should retry with the file. May be shared by all
+#   workers on a host.
+CODEJAIL_LIBRARY_STORE_DIR = None
+
+# .. setting_name: CODEJAIL_LIBRARY_STORE_MAX_BYTES
+# .. setting_default: 512 MiB
+# .. setting_description: Least recently used libraries are removed from
+#   ``CODEJAIL_LIBRARY_STORE_DIR`` to keep it under roughly this size.
+CODEJAIL_LIBRARY_STORE_MAX_BYTES = 512 * 1024 ** 2
+
+# .. setting_name: CODEJAIL_LIBRARY_EXTRACT_DIR
+# .. setting_default: None
+# .. setting_description: If set, course libraries are extracted once into read-only
+#   directories here, keyed by hash and with precompiled bytecode, and the sandbox imports
+#   from those instead of from the uploaded zip. The sandbox user must be allowed to read
+#   this directory (including by AppArmor). May be shared by all workers on a host.
+CODEJAIL_LIBRARY_EXTRACT_DIR = None
+
+# .. setting_name: CODEJAIL_LIBRARY_EXTRACT_MAX_BYTES
+# .. setting_default: 1 GiB
+# .. setting_description: Least recently used extractions are removed from
+#   ``CODEJAIL_LIBRARY_EXTRACT_DIR`` to keep it under roughly this size.
+CODEJAIL_LIBRARY_EXTRACT_MAX_BYTES = 1024 ** 3
+
+# .. setting_name: CODEJAIL_JANITOR_INTERVAL
+# .. setting_default: 600
+# .. setting_description: How often (in seconds) each worker checks for sandbox working
+#   directories left behind by killed executions, and removes those older than
+#   ``CODEJAIL_JANITOR_MAX_AGE``. Only one worker per host does so at a time. 0 to disable.
+#   Started by a gunicorn hook, so only applies under gunicorn.
+CODEJAIL_JANITOR_INTERVAL = 600
+
+# .. setting_name: CODEJAIL_JANITOR_MAX_AGE
+# .. setting_default: 3600
+# .. setting_description: Age in seconds after which a sandbox working directory is assumed
+#   to have been left behind, and is removed. Must be well above the longest possible
+#   execution (and gunicorn's worker timeout).
+CODEJAIL_JANITOR_MAX_AGE = 3600
+
+# .. setting_name: CODEJAIL_PROCESS_WATCHDOG_INTERVAL
+# .. setting_default: 0
+# .. setting_description: If positive, each worker checks the sandbox user's processes this
+#   often (in seconds): it counts them and their threads against ``CODE_JAIL.limits.NPROC``,
+#   and kills any older than ``CODEJAIL_SANDBOX_PROCESS_MAX_AGE`` with ``sudo pkill``.
+#   Started by a gunicorn hook, so only applies under gunicorn.
+CODEJAIL_PROCESS_WATCHDOG_INTERVAL = 0
+
+# .. setting_name: CODEJAIL_SANDBOX_PROCESS_MAX_AGE
+# .. setting_default: None
+# .. setting_description: Age in seconds after which the process watchdog treats a sandbox
+#   process as left over from a finished execution, and kills it. If None, the longest
+#   ``REALTIME`` limit in ``CODE_JAIL`` (including limit overrides) plus 60 seconds.
+CODEJAIL_SANDBOX_PROCESS_MAX_AGE = None
+
+# .. setting_name: CODEJAIL_MIN_NPROC_HEADROOM
+# .. setting_default: 0
+# .. setting_description: If the process watchdog last found fewer than this many processes
+#   and threads left before the sandbox user's NPROC limit, code-exec requests are refused
+#   with a 503 (``codejail.exec.status`` of ``rejected.nproc_headroom``) rather than run
+#   sandboxes that would likely fail to fork. 0 to never refuse.
+CODEJAIL_MIN_NPROC_HEADROOM = 0
+
+# .. setting_name: CODEJAIL_SANDBOX_USERS
+# .. setting_default: None
+# .. setting_description: Optional list of sandbox users to spread executions across, each a dict
+#   with keys ``user`` and ``python_bin`` (that user's sandbox Python, with its own sudoers entry
+#   and AppArmor profile). Each execution runs as a user with a free slot (see
+#   ``CODEJAIL_SANDBOX_USER_CONCURRENCY``), overriding the user and Python configured in
+#   ``CODE_JAIL``. Since ``NPROC`` is counted per user, it then only needs to allow for that
+#   many concurrent executions. If unset, all executions run as the ``CODE_JAIL`` user.
+CODEJAIL_SANDBOX_USERS = None
+
+# .. setting_name: CODEJAIL_SANDBOX_USER_CONCURRENCY
+# .. setting_default: 1
+# .. setting_description: Maximum number of executions that run as each of the
+#   ``CODEJAIL_SANDBOX_USERS`` at once, across all workers on the host. Executions wait
+#   for a free slot if all are taken.
+CODEJAIL_SANDBOX_USER_CONCURRENCY = 1
+
+# .. setting_name: CODEJAIL_SANDBOX_USER_LOCK_DIR
+# .. setting_default: None
+# .. setting_description: Directory for the lock files through which workers share
+#   ``CODEJAIL_SANDBOX_USERS`` slots. Must be shared by all workers on the host and not
+#   by other hosts. Defaults to the temp directory.
+CODEJAIL_SANDBOX_USER_LOCK_DIR = None
+
+# .. setting_name: CODEJAIL_WORKER_MAX_RSS_BYTES
+# .. setting_default: None
+# .. setting_description: When running under gunicorn with the provided configuration, a
+#   worker whose resident set size is over this many bytes after a request exits gracefully
+#   and is replaced, as on reaching ``--max-requests``. None to only recycle workers by
+#   request count.
+CODEJAIL_WORKER_MAX_RSS_BYTES = None
+
+# .. setting_name: CODEJAIL_WORKER_CONCURRENCY
+# .. setting_default: None
+# .. setting_description: Maximum number of executions each worker process runs at once, when
+#   running with several threads per worker (gunicorn's ``--threads``, or
+#   ``CODEJAIL_SERVICE_THREADS`` with the provided configuration). Code-exec requests arriving
+#   while a worker is at the limit are refused with a 503 (``codejail.exec.status`` of
+#   ``rejected.capacity``). Should be at most the number of threads, and match the number of
+#   sandboxes the worker's share of the host can run. None for no limit. Under ASGI, requests
+#   to ``/api/v0/code-exec-async`` over the limit wait for a slot instead, and if None, the
+#   limit is ``CODEJAIL_SANDBOX_CAPACITY`` divided by the number of worker processes (from
+#   gunicorn's configuration, or else the ``WEB_CONCURRENCY`` environment variable).
+CODEJAIL_WORKER_CONCURRENCY = None
+
+# .. setting_name: CODEJAIL_SUPERVISOR_SOCKET
+# .. setting_default: None
+# .. setting_description: Path of the Unix socket of the sandbox supervisor (run with
+#   ``python -m codejail_service.supervisor``). When set, web workers hand all executions
+#   to the supervisor rather than running sandboxes themselves, and the supervisor runs
+#   up to ``CODEJAIL_SANDBOX_CAPACITY`` at once for the whole host. The supervisor must
+#   share a filesystem with the web workers. None to run sandboxes in the web workers.
+CODEJAIL_SUPERVISOR_SOCKET = None
+
+# .. setting_name: CODEJAIL_SUPERVISOR_MAX_QUEUE
+# .. setting_default: 100
+# .. setting_description: Number of executions the sandbox supervisor holds waiting while
+#   all sandboxes are busy. Executions arriving when the queue is full are refused with a
+#   503 (``codejail.exec.status`` of ``rejected.supervisor_busy``). 0 to refuse any
+#   execution that can't start right away.
+CODEJAIL_SUPERVISOR_MAX_QUEUE = 100
+
+# .. setting_name: CODEJAIL_SUPERVISOR_TIMEOUT
+# .. setting_default: 240
+# .. setting_description: Seconds a web worker waits for the sandbox supervisor to return
+#   an execution's result, including time spent in the supervisor's queue. Executions with
+#   no result in time are refused with a 503 (``codejail.exec.status`` of
+#   ``rejected.supervisor_unreachable``), and the supervisor drops them from its queue
+#   rather than start them. Should be clearly below the gunicorn timeout (300
+#   seconds in the provided configuration), so that the worker answers before gunicorn
+#   kills it, and above the longest ``REALTIME`` limit in ``CODE_JAIL``.
+CODEJAIL_SUPERVISOR_TIMEOUT = 240
+
+# .. setting_name: CODEJAIL_SUPERVISOR_STARTUP_WAIT
+# .. setting_default: 60
+# .. setting_description: Seconds a web worker waits at startup for the sandbox supervisor
+#   to come up and pass its own startup checks, before running its startup checks through
+#   the supervisor. If the supervisor isn't ready in time, the checks fail and the web
+#   worker reports itself unhealthy.
+CODEJAIL_SUPERVISOR_STARTUP_WAIT = 60
+
+# .. setting_name: CODEJAIL_BATCH_MAX_REQUESTS
+# .. setting_default: 16
+# .. setting_description: Maximum number of code-exec requests in one call to the batch
+#   endpoint. The requests are executed concurrently by a single worker, up to its limit
+#   of concurrent executions (see ``CODEJAIL_WORKER_CONCURRENCY``), so this divided by
+#   that limit, times the longest allowed execution, should stay within the worker timeout.
+CODEJAIL_BATCH_MAX_REQUESTS = 16
+
+# .. setting_name: CODEJAIL_MAX_REQUEST_BYTES
+# .. setting_default: 32 MiB
+# .. setting_description: Code-exec requests whose declared body size (``Content-Length``),
+#   including uploaded course libraries, is over this many bytes are refused with a 413
+#   before the body is read. None for no limit.
+CODEJAIL_MAX_REQUEST_BYTES = 32 * 1024 ** 2
+
+# .. setting_name: CODEJAIL_MAX_CODE_BYTES
+# .. setting_default: 1 MiB
+# .. setting_description: Code-exec requests whose ``code`` is longer than this (as encoded
+#   in the request) are refused with a 413. None for no limit.
+CODEJAIL_MAX_CODE_BYTES = 1024 ** 2
+
+# .. setting_name: CODEJAIL_MAX_GLOBALS_BYTES
+# .. setting_default: 2 MiB
+# .. setting_description: Code-exec requests whose ``globals_dict`` is larger than this (as
+#   encoded in the request) are refused with a 413. None for no limit. Note that Django's
+#   ``DATA_UPLOAD_MAX_MEMORY_SIZE`` separately limits the size of the form's ``payload`` field.
+CODEJAIL_MAX_GLOBALS_BYTES = 2 * 1024 ** 2
+
+# .. setting_name: CODEJAIL_MAX_PAYLOAD_DEPTH
+# .. setting_default: 100
+# .. setting_description: Code-exec requests whose payload has arrays and objects nested more
+#   deeply than this are refused with a 413, before the payload JSON is parsed. None for no limit.
+CODEJAIL_MAX_PAYLOAD_DEPTH = 100
+
+# .. setting_name: CODEJAIL_MAX_PAYLOAD_KEYS
+# .. setting_default: 100000
+# .. setting_description: Code-exec requests whose payload has more object keys than this in
+#   total are refused with a 413, before the payload JSON is parsed. None for no limit.
+CODEJAIL_MAX_PAYLOAD_KEYS = 100_000
+
+# .. setting_name: CODEJAIL_LIBRARY_MAX_ENTRIES
+# .. setting_default: 10000
+# .. setting_description: Course libraries whose zip archive has more entries than this
+#   are refused.
+CODEJAIL_LIBRARY_MAX_ENTRIES = 10_000
+
+# .. setting_name: CODEJAIL_LIBRARY_MAX_UNCOMPRESSED_BYTES
+# .. setting_default: 256 MiB
+# .. setting_description: Course libraries whose zip archive would uncompress to more than
+#   this many bytes in total are refused.
+CODEJAIL_LIBRARY_MAX_UNCOMPRESSED_BYTES = 256 * 1024 ** 2
+
+# .. setting_name: CODEJAIL_LIBRARY_MAX_COMPRESSION_RATIO
+# .. setting_default: 100
+# .. setting_description: Course libraries containing an entry of at least 1 MiB that is
+#   compressed by more than this ratio (uncompressed size over compressed size) are refused,
+#   as likely zip bombs.
+CODEJAIL_LIBRARY_MAX_COMPRESSION_RATIO = 100
+
+# .. setting_name: CODEJAIL_IMPORT_PROFILE_MODULES
+# .. setting_default: None
+# .. setting_description: List of modules whose import time in the sandbox is profiled
+#   by the ``profile_sandbox_imports`` management command (and at startup, if enabled).
+#   If None, this is the packages listed in ``requirements/sandbox/base.in``.
+CODEJAIL_IMPORT_PROFILE_MODULES = None
+
+# .. setting_name: CODEJAIL_IMPORT_PROFILE_AT_STARTUP
+# .. setting_default: False
+# .. setting_description: If True, each worker profiles sandbox import times at startup
+#   (after the startup safety checks pass) and publishes them as logs and custom
+#   attributes. Each module is imported in a fresh sandbox, which delays startup by
+#   several seconds.
+CODEJAIL_IMPORT_PROFILE_AT_STARTUP = False
+
+# .. setting_name: CODEJAIL_WARM_POOLS
+# .. setting_default: {}
+# .. setting_description: Dictionary of sandbox pool names to pool configuration, where
+#   the configuration is a dict with key ``modules`` listing the top-level modules the
+#   pool's sandboxes preload. Each execution is routed to the smallest pool covering
+#   the non-stdlib modules its code imports (or "cold"), and per-pool hit rates and
+#   resource usage are reported at ``/internal/sandbox-stats/``. Executions are
+#   currently always run in a fresh sandbox; this is used to evaluate pool composition.
+CODEJAIL_WARM_POOLS = {}
+
 # Allow overriding the default logging format string.
 LOGGING_FORMAT_STRING = None
 
@@ -38,7 +38,7 @@ def get_logger_config(
     syslog_format = (
         "[service_variant={service_variant}]"
         "[%(name)s][env:{logging_env}] %(levelname)s "
-        "[{hostname}  %(process)d] [user %(userid)s] [ip %(remoteip)s] [%(filename)s:%(lineno)d] "
+        "[{hostname}  %(process)d %(threadName)s] [user %(userid)s] [ip %(remoteip)s] [%(filename)s:%(lineno)d] "
         "- %(message)s"
     ).format(
         service_variant=service_variant,
@@ -48,7 +48,7 @@ def get_logger_config(
     handlers = ['console']
 
     standard_format = format_string or (
-        '%(asctime)s %(levelname)s %(process)d '
+        '%(asctime)s %(levelname)s %(process)d %(threadName)s '
         '[%(name)s] [user %(userid)s] [ip %(remoteip)s] %(filename)s:%(lineno)d - %(message)s'
     )
 
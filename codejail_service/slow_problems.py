@@ -0,0 +1,181 @@
+"""
+Tracking of the problems (slugs) that consume the most sandbox time.
+
+Each worker keeps a bounded, approximate "heavy hitters" summary: a count-min
+sketch estimates the total cost of every slug seen, and a small table holds
+the slugs with the highest estimates. Costs decay over time so that the
+summary reflects recent load rather than all-time totals.
+"""
+
+import hashlib
+import os
+import threading
+import time
+
+from django.conf import settings
+
+# Key used for executions that did not include a slug.
+NO_SLUG = '(none)'
+
+
+class CountMinSketch:
+    """
+    Approximate weighted counter for an unbounded set of keys, in fixed space.
+
+    Estimates are never lower than the true value, and are higher by at most
+    a small fraction of the total weight (governed by the width) with high
+    probability (governed by the depth).
+    """
+
+    def __init__(self, width=1024, depth=4):
+        """
+        Create an empty sketch with ``depth`` rows of ``width`` counters.
+        """
+        self.width = width
+        self.depth = depth
+        self.rows = [[0.0] * width for _ in range(depth)]
+
+    def _indexes(self, key):
+        """
+        Return the column for ``key`` in each row.
+        """
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=4 * self.depth).digest()
+        return [
+            int.from_bytes(digest[4 * row:4 * (row + 1)], 'little') % self.width
+            for row in range(self.depth)
+        ]
+
+    def add(self, key, weight):
+        """
+        Add ``weight`` to ``key`` and return the new estimate for it.
+        """
+        estimate = None
+        for row, col in zip(self.rows, self._indexes(key)):
+            row[col] += weight
+            estimate = row[col] if estimate is None else min(estimate, row[col])
+        return estimate
+
+    def estimate(self, key):
+        """
+        Return the estimated total weight of ``key``.
+        """
+        return min(row[col] for row, col in zip(self.rows, self._indexes(key)))
+
+    def scale(self, factor):
+        """
+        Multiply all counts by ``factor``.
+        """
+        for row in self.rows:
+            for col in range(self.width):
+                row[col] *= factor
+
+
+class TopK:
+    """
+    The ``k`` keys with the highest estimated total weight.
+
+    Candidates are held in a dict rather than a heap; with the small values of
+    ``k`` used here, a linear scan for the minimum is cheaper than keeping a
+    heap consistent as estimates change.
+    """
+
+    def __init__(self, k, width=1024, depth=4):
+        """
+        Create an empty summary, with a sketch of the given dimensions.
+        """
+        self.k = k
+        self.sketch = CountMinSketch(width, depth)
+        self.candidates = {}
+
+    def add(self, key, weight):
+        """
+        Add ``weight`` to ``key``.
+        """
+        estimate = self.sketch.add(key, weight)
+        if key in self.candidates or len(self.candidates) < self.k:
+            self.candidates[key] = estimate
+            return
+
+        smallest = min(self.candidates, key=self.candidates.get)
+        if estimate > self.candidates[smallest]:
+            del self.candidates[smallest]
+            self.candidates[key] = estimate
+
+    def scale(self, factor):
+        """
+        Multiply all weights by ``factor`` (for decay).
+        """
+        self.sketch.scale(factor)
+        for key in self.candidates:
+            self.candidates[key] *= factor
+
+    def top(self):
+        """
+        Return a list of (key, estimated weight) pairs, heaviest first.
+        """
+        return sorted(self.candidates.items(), key=lambda item: item[1], reverse=True)
+
+
+class SlowProblemTracker:
+    """
+    Heavy-hitter summaries of slugs by sandbox CPU time, wall time, and count.
+    """
+
+    def __init__(self, k, half_life):
+        """
+        Track the top ``k`` slugs, halving weights every ``half_life`` seconds (0 for no decay).
+        """
+        self._lock = threading.Lock()
+        self.half_life = half_life
+        self.last_decay = time.monotonic()
+        self.by_cpu = TopK(k)
+        self.by_wall = TopK(k)
+        self.by_count = TopK(k)
+
+    def _decay(self):
+        """
+        Halve all weights for each half-life that has elapsed since the last decay.
+        """
+        if not self.half_life:
+            return
+        now = time.monotonic()
+        elapsed = now - self.last_decay
+        if elapsed < self.half_life:
+            return
+        factor = 0.5 ** (elapsed / self.half_life)
+        for summary in (self.by_cpu, self.by_wall, self.by_count):
+            summary.scale(factor)
+        self.last_decay = now
+
+    def add(self, slug, usage):
+        """
+        Record an execution's usage against its slug.
+        """
+        with self._lock:
+            self._decay()
+            key = slug or NO_SLUG
+            self.by_cpu.add(key, usage.cpu_user + usage.cpu_sys)
+            self.by_wall.add(key, usage.wall)
+            self.by_count.add(key, 1)
+
+    def report(self):
+        """
+        Return the current top slugs as a dict suitable for JSON output.
+        """
+        def rows(summary):
+            return [{'slug': key, 'estimate': round(weight, 3)} for key, weight in summary.top()]
+
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'half_life': self.half_life,
+                'by_cpu_seconds': rows(self.by_cpu),
+                'by_wall_seconds': rows(self.by_wall),
+                'by_count': rows(self.by_count),
+            }
+
+
+SLOW_PROBLEMS = SlowProblemTracker(
+    k=getattr(settings, 'CODEJAIL_SLOW_PROBLEMS_TOP_K', 20),
+    half_life=getattr(settings, 'CODEJAIL_SLOW_PROBLEMS_HALF_LIFE', 3600),
+)
@@ -0,0 +1,79 @@
+"""
+Health check for an instance serving on a Unix domain socket.
+
+HTTP health probes generally can't reach a Unix socket, so this can be used
+as an exec-style probe instead. It does not load Django. Usage::
+
+  python -m codejail_service.socket_health /run/codejail/codejail.sock
+
+Exits with status 0 if the service reports itself healthy, and 1 otherwise.
+"""
+
+import argparse
+import http.client
+import socket
+import sys
+
+HEALTH_PATH = '/health/'
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """
+    HTTP connection over a Unix domain socket.
+
+    The host name is only used for the ``Host`` header, and must be allowed
+    by the service's ``ALLOWED_HOSTS``.
+    """
+
+    def __init__(self, socket_path, host='localhost', **kwargs):
+        """
+        Connect to ``socket_path``; other arguments are as for ``HTTPConnection``.
+        """
+        super().__init__(host, **kwargs)
+        self.socket_path = socket_path
+
+    def connect(self):
+        """
+        Connect to the socket instead of a TCP address.
+        """
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def check_health(socket_path, host='localhost', timeout=5.0):
+    """
+    Request the health endpoint over the socket and return a tuple of (healthy, detail).
+
+    - healthy: True if the service responded with a 200
+    - detail: The response status and body, or the connection error
+    """
+    conn = UnixHTTPConnection(socket_path, host=host, timeout=timeout)
+    try:
+        conn.request('GET', HEALTH_PATH)
+        resp = conn.getresponse()
+        body = resp.read().decode('utf-8', errors='replace')
+    except OSError as e:
+        return (False, f"Unable to reach service: {e!r}")
+    finally:
+        conn.close()
+    return (resp.status == 200, f"{resp.status} {body}")
+
+
+def main(argv=None):
+    """
+    Command-line entry point.
+    """
+    parser = argparse.ArgumentParser(description="Check the health of codejail-service over a Unix socket.")
+    parser.add_argument('socket_path', help="Path of the service's Unix domain socket")
+    parser.add_argument('--host', default='localhost', help="Host header to send; must be in ALLOWED_HOSTS")
+    parser.add_argument('--timeout', type=float, default=5.0, help="Timeout in seconds")
+    args = parser.parse_args(argv)
+
+    healthy, detail = check_health(args.socket_path, host=args.host, timeout=args.timeout)
+    print(detail)
+    sys.exit(0 if healthy else 1)
+
+
+if __name__ == '__main__':
+    main()
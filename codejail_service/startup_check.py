@@ -3,13 +3,18 @@ State and accessors for a safety check that is run at startup.
 """
 
 import logging
+import threading
 import urllib.request
 from textwrap import dedent
 from urllib.error import URLError
 
+from django.conf import settings
 from edx_django_utils.monitoring import set_custom_attribute
 
 from codejail_service.codejail import safe_exec
+from codejail_service.sandbox_env import SANDBOX_MPLCONFIGDIR, get_cache_dirs
+from codejail_service.sandbox_users import get_sandbox_users, pinned_sandbox_user
+from codejail_service.supervisor_client import uses_supervisor
 
 log = logging.getLogger(__name__)
 
@@ -28,6 +33,9 @@ log = logging.getLogger(__name__)
 # calls is `True`.
 STARTUP_SAFETY_CHECK_OK = None
 
+# Held while the checks run, so that concurrent callers wait for the result.
+_startup_check_lock = threading.Lock()
+
 
 def is_exec_safe():
     """
@@ -46,11 +54,18 @@ def run_startup_safety_check():
 
     This just initializes state. Afterwards, is_exec_safe can be called.
     """
-    global STARTUP_SAFETY_CHECK_OK
+    with _startup_check_lock:
+        # App initialization can happen multiple times; just run checks once.
+        if STARTUP_SAFETY_CHECK_OK is not None:
+            return
+        _run_checks()
+
 
-    # App initialization can happen multiple times; just run checks once.
-    if STARTUP_SAFETY_CHECK_OK is not None:
-        return
+def _run_checks():
+    """
+    Run the safety checks and record the result.
+    """
+    global STARTUP_SAFETY_CHECK_OK
 
     # These checks should be a subset of the full api_tests suite, with
     # the aim of providing *basic* coverage of the range of types of
@@ -87,24 +102,45 @@ def run_startup_safety_check():
         },
     ]
 
+    # Optional features get checked only when they are configured.
+    if getattr(settings, 'CODEJAIL_SANDBOX_CACHE_DIR', None):
+        checks.append({
+            "name": "Prebuilt library caches in use",
+            "id": "sandbox_caches",
+            "fn": _check_sandbox_caches,
+        })
+
+    # Each sandbox user has its own sudoers and AppArmor configuration, so
+    # when several are configured, each one is checked separately. (A sandbox
+    # supervisor checks each of its users itself when it starts.)
+    if uses_supervisor():
+        sandbox_users = [None]
+    else:
+        sandbox_users = [user['user'] for user in get_sandbox_users()] or [None]
+
     any_failed = False
     for check in checks:
-        try:
-            result = check['fn']()
-        except BaseException as e:
-            result = f"Uncaught exception from check: {e!r}"
+        check_passed = True
+        for user in sandbox_users:
+            with pinned_sandbox_user(user):
+                try:
+                    result = check['fn']()
+                except BaseException as e:
+                    result = f"Uncaught exception from check: {e!r}"
+
+            name = check['name'] if user is None else f"{check['name']} (sandbox user {user})"
+            if result is True:
+                log.info(f"Startup check {name!r} passed")
+            else:
+                check_passed = False
+                log.error(f"Startup check {name!r} failed with: {result!r}")
 
-        check_passed = result is True
         # .. custom_attribute_name: codejail.startup_check.<CHECK_NAME>
         # .. custom_attribute_description: Result of the check with ID ``<CHECK_NAME>``,
-        #   the string "pass" or "fail".
+        #   the string "pass" or "fail". With several sandbox users, the check
+        #   only passes if it passes for all of them.
         set_custom_attribute(f"codejail.startup_check.{check['id']}", 'pass' if check_passed else 'fail')
-
-        if check_passed:
-            log.info(f"Startup check {check['name']!r} passed")
-        else:
-            any_failed = True
-            log.error(f"Startup check {check['name']!r} failed with: {result!r}")
+        any_failed = any_failed or not check_passed
 
     STARTUP_SAFETY_CHECK_OK = not any_failed
     # .. custom_attribute_name: codejail.startup_check.status
@@ -239,3 +275,35 @@ def _check_webapp_egress():
         return True
     except BaseException as e:
         return f"Expected URLError, but got: {e!r}"
+
+
+def _check_sandbox_caches():
+    """
+    Check that the prebuilt library caches are present and used by the sandbox.
+    """
+    (globals_out, error_message) = safe_exec(
+        dedent("""
+          import os
+          import matplotlib  # installs the cache
+          nltk_data = os.environ.get('NLTK_DATA')
+          mplconfigdir = os.environ.get('MPLCONFIGDIR')
+          mpl_files = sorted(os.listdir(mplconfigdir)) if mplconfigdir else []
+        """),
+        {},
+    )
+
+    if error_message is not None:
+        return f"Unexpected error: {error_message}"
+
+    expected_nltk_data = get_cache_dirs(settings.CODEJAIL_SANDBOX_CACHE_DIR)['nltk']
+    if globals_out.get('nltk_data') != expected_nltk_data:
+        return f"Expected NLTK_DATA={expected_nltk_data!r}, but was {globals_out.get('nltk_data')!r}"
+    if globals_out.get('mplconfigdir') != SANDBOX_MPLCONFIGDIR:
+        return (
+            "matplotlib cache was not installed in sandbox "
+            f"(MPLCONFIGDIR was {globals_out.get('mplconfigdir')!r})"
+        )
+    if not any(name.startswith('fontlist-') for name in globals_out.get('mpl_files', [])):
+        return f"matplotlib font cache missing; found files: {globals_out.get('mpl_files')!r}"
+
+    return True
@@ -0,0 +1,289 @@
+"""
+Standalone sandbox supervisor.
+
+By default, each web worker runs its own sandboxes, and knows nothing of the
+sandboxes of other workers on the same host: ``CODEJAIL_WORKER_CONCURRENCY``
+can only divide the host's capacity up between workers in advance, and each
+worker reaps sandbox leftovers separately.
+
+With ``CODEJAIL_SUPERVISOR_SOCKET`` set, a single supervisor process per
+host, started alongside gunicorn, runs all sandboxed executions instead, and
+web workers hand their executions to it over that Unix socket (see
+``supervisor_client``). The supervisor runs up to
+``CODEJAIL_SANDBOX_CAPACITY`` executions at once, from all workers together,
+queues up to ``CODEJAIL_SUPERVISOR_MAX_QUEUE`` more, and refuses the rest,
+which the web workers then refuse with a 503. Queued executions that the web
+worker has already given up on (after ``CODEJAIL_SUPERVISOR_TIMEOUT``) are
+dropped rather than run. It also runs the janitor and the
+process watchdog. Usage::
+
+  DJANGO_SETTINGS_MODULE=codejail_service.settings.production python -m codejail_service.supervisor
+
+The supervisor loads the same settings as the web workers, and runs its own
+startup checks; if they fail, it answers health checks but refuses to execute
+anything, and web workers waiting for it report themselves unhealthy.
+"""
+
+import base64
+import contextlib
+import dataclasses
+import logging
+import os
+import socketserver
+import stat
+import threading
+import time
+
+import django
+from django.conf import settings
+
+from codejail_service import supervisor_client
+from codejail_service.codejail import safe_exec_locally
+from codejail_service.janitor import JANITOR, start_janitor
+from codejail_service.sandbox_env import get_sandbox_capacity
+from codejail_service.sandbox_procs import SANDBOX_PROCESSES, start_process_watchdog
+from codejail_service.startup_check import is_exec_safe
+from codejail_service.supervisor_client import recv_message, send_message
+from codejail_service.usage import UsageTotals, run_measured
+
+log = logging.getLogger(__name__)
+
+
+def _is_past(deadline):
+    """
+    Return True if a deadline (a ``time.time()`` value, or None for no deadline) has passed.
+    """
+    return deadline is not None and time.time() >= deadline
+
+
+class Scheduler:
+    """
+    Admits executions up to the sandbox capacity, and queues a limited number more.
+    """
+
+    def __init__(self, capacity, max_queue):
+        """
+        Run up to ``capacity`` executions at once, with up to ``max_queue`` waiting.
+        """
+        self._cond = threading.Condition()
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.running = 0
+        self.queued = 0
+        self.peak_running = 0
+        self.peak_queued = 0
+        self.refused = 0
+        self.expired = 0
+        self.completed = 0
+
+    @contextlib.contextmanager
+    def slot(self, deadline=None):
+        """
+        Hold an execution slot within the context, waiting for one if the queue has room.
+
+        Yields True once a slot is taken, or False (in which case the caller
+        should not execute anything) straight away if the queue is full, or
+        once ``deadline`` (a ``time.time()`` value, if given) has passed
+        without a slot being taken.
+        """
+        with self._cond:
+            if self.running >= self.capacity and self.queued >= self.max_queue:
+                self.refused += 1
+                admitted = False
+            else:
+                self.queued += 1
+                self.peak_queued = max(self.peak_queued, self.queued)
+                while self.running >= self.capacity and not _is_past(deadline):
+                    self._cond.wait(None if deadline is None else deadline - time.time())
+                self.queued -= 1
+                if _is_past(deadline):
+                    # Nobody is waiting for the result any more. Pass on the
+                    # wakeup, in case this waiter was the one notified.
+                    self.expired += 1
+                    self._cond.notify()
+                    admitted = False
+                else:
+                    self.running += 1
+                    self.peak_running = max(self.peak_running, self.running)
+                    admitted = True
+
+        if not admitted:
+            yield False
+            return
+
+        try:
+            yield True
+        finally:
+            with self._cond:
+                self.running -= 1
+                self.completed += 1
+                self._cond.notify()
+
+    def report(self):
+        """
+        Return a JSON-ready summary of the executions admitted and refused.
+        """
+        with self._cond:
+            return {
+                'capacity': self.capacity,
+                'max_queue': self.max_queue,
+                'running': self.running,
+                'queued': self.queued,
+                'peak_running': self.peak_running,
+                'peak_queued': self.peak_queued,
+                'refused': self.refused,
+                'expired': self.expired,
+                'completed': self.completed,
+            }
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    """
+    Answers the one request on a client connection.
+    """
+
+    def handle(self):
+        """
+        Read the request, and send back the server's response to it.
+        """
+        try:
+            request = recv_message(self.request)
+        except (OSError, EOFError, ValueError) as e:
+            log.warning(f"Unreadable request to sandbox supervisor: {e!r}")
+            return
+
+        if not isinstance(request, dict):
+            log.warning(f"Sandbox supervisor request is not an object: {type(request).__name__}")
+            response = {'ok': False, 'reason': 'error', 'error': "Request must be a JSON object"}
+        else:
+            try:
+                response = self.server.dispatch(request)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                log.error(f"Sandbox supervisor failed to answer {request.get('op')!r} request: {e!r}", exc_info=True)
+                response = {'ok': False, 'reason': 'error', 'error': "Sandbox supervisor error; see its logs"}
+
+        try:
+            send_message(self.request, response)
+        except OSError as e:
+            # Such as the web worker having timed out and gone away
+            log.warning(f"Unable to respond to sandbox supervisor client: {e!r}")
+
+
+class SupervisorServer(socketserver.ThreadingUnixStreamServer):
+    """
+    Serves supervisor requests on a Unix socket, with a thread per connection.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, scheduler=None):
+        """
+        Listen on ``socket_path``, scheduling executions with ``scheduler``.
+
+        The scheduler defaults to one with the sandbox capacity and
+        ``CODEJAIL_SUPERVISOR_MAX_QUEUE``.
+        """
+        self.scheduler = scheduler or Scheduler(get_sandbox_capacity(), settings.CODEJAIL_SUPERVISOR_MAX_QUEUE)
+        self.usage = UsageTotals()
+        super().__init__(socket_path, _Handler)
+
+    def server_bind(self):
+        """
+        Bind to the socket path, replacing the socket of a previous run, and limit access to the socket.
+        """
+        with contextlib.suppress(FileNotFoundError):
+            if stat.S_ISSOCK(os.stat(self.server_address).st_mode):
+                os.unlink(self.server_address)
+        super().server_bind()
+        os.chmod(self.server_address, 0o660)
+
+    def dispatch(self, request):
+        """
+        Return the response to a request.
+        """
+        op = request.get('op')
+        if op == 'exec':
+            return self._exec(request)
+        elif op == 'health':
+            return {'ok': True, 'safe': is_exec_safe()}
+        elif op == 'stats':
+            return {'ok': True, 'stats': self.report()}
+        else:
+            return {'ok': False, 'reason': 'error', 'error': f"Unknown op {op!r}"}
+
+    def _exec(self, request):
+        """
+        Run an execution in the sandbox, once the scheduler admits it.
+        """
+        if not is_exec_safe():
+            return {'ok': False, 'reason': 'error', 'error': "Sandbox supervisor failed its startup checks"}
+
+        with self.scheduler.slot(request.get('deadline')) as admitted:
+            if not admitted:
+                if _is_past(request.get('deadline')):
+                    return {'ok': False, 'reason': 'busy', 'error': "Deadline passed while queued"}
+                return {'ok': False, 'reason': 'busy', 'error': "Sandbox supervisor queue is full"}
+
+            # The web workers leave the process watchdog to the supervisor,
+            # so they have no readings, and it falls to the supervisor to
+            # check the headroom (just before the execution would start).
+            headroom = SANDBOX_PROCESSES.headroom()
+            if headroom is not None and headroom < settings.CODEJAIL_MIN_NPROC_HEADROOM:
+                log.warning(f"Refusing execution with only {headroom} sandbox processes left before NPROC limit")
+                return {'ok': False, 'reason': 'busy', 'error': "Sandbox process limit nearly exhausted"}
+
+            ((globals_out, error_message), usage) = run_measured(
+                safe_exec_locally,
+                request['code'],
+                request['globals_dict'],
+                python_path=request['python_path'],
+                extra_files=[(name, base64.b64decode(content)) for (name, content) in request['extra_files']],
+                limit_overrides_context=request['limit_overrides_context'],
+                slug=request['slug'],
+                library_dir=request['library_dir'],
+            )
+
+        self.usage.add(usage)
+        return {
+            'ok': True,
+            'globals_dict': globals_out,
+            'emsg': error_message,
+            'usage': dataclasses.asdict(usage),
+        }
+
+    def report(self):
+        """
+        Return a JSON-ready summary of the supervisor's state, for all workers on the host.
+        """
+        return {
+            'scheduler': self.scheduler.report(),
+            'usage': self.usage.snapshot(),
+            'janitor': JANITOR.report(),
+            'processes': SANDBOX_PROCESSES.report(),
+        }
+
+
+def main():
+    """
+    Command-line entry point: set up Django, then serve until interrupted.
+    """
+    # Before setup, so that the startup checks run sandboxes here
+    supervisor_client.mark_as_supervisor()
+    django.setup()
+
+    socket_path = settings.CODEJAIL_SUPERVISOR_SOCKET
+    if not socket_path:
+        raise SystemExit("CODEJAIL_SUPERVISOR_SOCKET must be set to run the sandbox supervisor")
+
+    start_janitor()
+    start_process_watchdog()
+    with SupervisorServer(socket_path) as server:
+        log.info(f"Sandbox supervisor serving on {socket_path} with {server.scheduler.report()!r}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
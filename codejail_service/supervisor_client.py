@@ -0,0 +1,197 @@
+"""
+Client side of the sandbox supervisor (see ``supervisor``).
+
+When ``CODEJAIL_SUPERVISOR_SOCKET`` is set, web workers don't run sandboxes
+themselves; ``codejail.safe_exec`` hands each execution to the supervisor
+through the functions here, and waits for the result.
+
+Protocol: each connection carries one request and then one response. Each
+message is a JSON object, preceded by its length in bytes as a 4-byte
+big-endian integer. Requests have an ``op`` of ``exec``, ``health``, or
+``stats``; responses have ``ok`` set to true, or else to false with a
+``reason`` and an ``error`` message.
+"""
+
+import base64
+import json
+import logging
+import socket
+import struct
+import time
+
+from django.conf import settings
+
+from codejail_service.usage import ExecutionUsage, report_usage
+
+log = logging.getLogger(__name__)
+
+# Length prefix of each message.
+_LENGTH = struct.Struct('>I')
+
+# Refuse to read messages larger than this, rather than trying to buffer
+# whatever length a corrupt prefix claims.
+MAX_MESSAGE_BYTES = 256 * 1024 * 1024
+
+# Set in the supervisor process itself, which runs sandboxes rather than
+# delegating them.
+_in_supervisor = False
+
+
+class SupervisorUnavailable(Exception):
+    """
+    The supervisor did not run an execution.
+    """
+
+    def __init__(self, reason, message):
+        """
+        Record why the supervisor didn't run the execution.
+
+        ``reason`` is ``'busy'`` if the supervisor's queue was full,
+        ``'unreachable'`` if it could not be reached or did not answer in
+        time, or ``'error'`` if it failed to run the execution.
+        """
+        super().__init__(message)
+        self.reason = reason
+
+
+def mark_as_supervisor():
+    """
+    Record that this process is the supervisor, so that it runs sandboxes itself.
+    """
+    global _in_supervisor
+    _in_supervisor = True
+
+
+def uses_supervisor():
+    """
+    Return True if this process should hand executions to the supervisor.
+    """
+    return bool(getattr(settings, 'CODEJAIL_SUPERVISOR_SOCKET', None)) and not _in_supervisor
+
+
+def send_message(sock, message):
+    """
+    Send a JSON-ready message on a socket.
+    """
+    data = json.dumps(message).encode('utf-8')
+    sock.sendall(_LENGTH.pack(len(data)) + data)
+
+
+def recv_message(sock):
+    """
+    Receive a message from a socket.
+
+    Raises EOFError if the connection closes part-way, or ValueError if the
+    message is too large or not valid JSON.
+    """
+    (length,) = _LENGTH.unpack(_recv_exactly(sock, _LENGTH.size))
+    if length > MAX_MESSAGE_BYTES:
+        raise ValueError(f"Message of {length} bytes is over the limit of {MAX_MESSAGE_BYTES}")
+    return json.loads(_recv_exactly(sock, length))
+
+
+def _recv_exactly(sock, size):
+    """
+    Receive exactly ``size`` bytes from a socket.
+    """
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            raise EOFError(f"Connection closed after {received} of {size} bytes")
+        received += count
+    return bytes(buf)
+
+
+def _request(message, timeout):
+    """
+    Send a request to the supervisor and return its response.
+
+    Raises SupervisorUnavailable if the supervisor can't be reached, doesn't
+    answer within ``timeout`` seconds, or answers with an error.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(settings.CODEJAIL_SUPERVISOR_SOCKET)
+        send_message(sock, message)
+        response = recv_message(sock)
+    except (OSError, EOFError, ValueError) as e:
+        raise SupervisorUnavailable('unreachable', f"No response from sandbox supervisor: {e!r}") from e
+    finally:
+        sock.close()
+
+    if not response.get('ok'):
+        raise SupervisorUnavailable(response.get('reason', 'error'), response.get('error', "Unknown error"))
+    return response
+
+
+def exec_in_supervisor(
+        code, globals_dict, *, python_path=None, extra_files=None, limit_overrides_context=None, slug=None,
+        library_dir=None,
+):
+    """
+    Have the supervisor run code in a sandbox, and return a tuple of (globals dict, error message).
+
+    Takes the same arguments as ``codejail.safe_exec``, and returns the same.
+    The usage that the supervisor measured is reported to the enclosing
+    ``usage.run_measured``, if any. Raises SupervisorUnavailable if the
+    supervisor didn't run the code.
+    """
+    timeout = settings.CODEJAIL_SUPERVISOR_TIMEOUT
+    response = _request(
+        {
+            'op': 'exec',
+            'code': code,
+            'globals_dict': globals_dict,
+            'python_path': python_path or [],
+            'extra_files': [
+                [name, base64.b64encode(content).decode('ascii')] for (name, content) in extra_files or []
+            ],
+            'limit_overrides_context': limit_overrides_context,
+            'slug': slug,
+            'library_dir': library_dir,
+            # After which the supervisor shouldn't start the execution, since
+            # this worker will have given up on it (the host's clock is shared)
+            'deadline': time.time() + timeout,
+        },
+        timeout,
+    )
+    report_usage(ExecutionUsage(**response['usage']))
+    return (response['globals_dict'], response['emsg'])
+
+
+def supervisor_stats(timeout=5.0):
+    """
+    Return the supervisor's statistics, or a dict with an ``error`` if it can't be reached.
+    """
+    try:
+        return _request({'op': 'stats'}, timeout)['stats']
+    except SupervisorUnavailable as e:
+        return {'error': str(e)}
+
+
+def wait_for_supervisor(timeout, poll_interval=0.5):
+    """
+    Wait until the supervisor is up, and return True if it passed its own startup checks.
+
+    The supervisor and the web workers are usually started together, and the
+    supervisor's checks take a few seconds. Returns False if the supervisor
+    failed its checks, or couldn't be reached within ``timeout`` seconds.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if _request({'op': 'health'}, poll_interval * 10)['safe']:
+                return True
+            log.error("Sandbox supervisor failed its startup checks")
+            return False
+        except SupervisorUnavailable as e:
+            detail = str(e)
+
+        if time.monotonic() >= deadline:
+            log.error(f"Sandbox supervisor not ready after {timeout} seconds: {detail}")
+            return False
+        time.sleep(poll_interval)
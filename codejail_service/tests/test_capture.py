@@ -0,0 +1,78 @@
+"""
+Tests for request capture.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from codejail_service import capture
+from codejail_service.capture import CorpusWriter, maybe_capture
+
+
+class TestCorpusWriter(TestCase):
+
+    def test_write(self):
+        with tempfile.TemporaryDirectory() as root:
+            writer = CorpusWriter(root, max_bytes=10 ** 6)
+            assert writer.write('{"code": "x = 1"}', [('python_lib.zip', b'zipbytes')])
+            assert writer.write('{"code": "x = 2"}', [('python_lib.zip', b'zipbytes')])
+
+            digest = hashlib.sha256(b'zipbytes').hexdigest()
+            assert os.listdir(os.path.join(root, 'files')) == [digest]
+
+            request_files = os.listdir(os.path.join(root, 'requests'))
+            assert len(request_files) == 2
+            with open(os.path.join(root, 'requests', request_files[0]), encoding='utf-8') as f:
+                record = json.load(f)
+            assert record['files'] == {'python_lib.zip': digest}
+            assert record['payload'] in ('{"code": "x = 1"}', '{"code": "x = 2"}')
+
+    def test_size_cap(self):
+        with tempfile.TemporaryDirectory() as root:
+            writer = CorpusWriter(root, max_bytes=100)
+            assert writer.write('{"code": "x = 1"}', [('python_lib.zip', b'z' * 200)])
+            assert not writer.write('{"code": "x = 1"}', [])
+            assert len(os.listdir(os.path.join(root, 'requests'))) == 1
+
+
+class TestMaybeCapture(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        capture._writer = None  # pylint: disable=protected-access
+
+    def test_disabled(self):
+        with patch('codejail_service.capture.CorpusWriter') as mock_writer:
+            maybe_capture('{}', [])
+        mock_writer.assert_not_called()
+
+    def test_sampling(self):
+        with tempfile.TemporaryDirectory() as root:
+            with override_settings(CODEJAIL_CAPTURE_DIR=root, CODEJAIL_CAPTURE_SAMPLE_RATE=0.5):
+                with patch('codejail_service.capture.random.random', side_effect=[0.2, 0.7]):
+                    maybe_capture('{"code": "a = 1"}', [])
+                    maybe_capture('{"code": "b = 1"}', [])
+
+            assert len(os.listdir(os.path.join(root, 'requests'))) == 1
+
+    @patch('codejail_service.capture.log.warning')
+    def test_errors_swallowed(self, mock_log_warning):
+        with override_settings(CODEJAIL_CAPTURE_DIR='/proc/not-writable', CODEJAIL_CAPTURE_SAMPLE_RATE=1):
+            maybe_capture('{}', [])
+        mock_log_warning.assert_called_once()
+
+    def test_params_serialized(self):
+        """Requests that didn't arrive as JSON are captured as JSON."""
+        with tempfile.TemporaryDirectory() as root:
+            with override_settings(CODEJAIL_CAPTURE_DIR=root, CODEJAIL_CAPTURE_SAMPLE_RATE=1):
+                maybe_capture(None, [], {'code': "a = 1", 'globals_dict': {}})
+
+            requests_dir = os.path.join(root, 'requests')
+            (name,) = os.listdir(requests_dir)
+            with open(os.path.join(requests_dir, name), encoding='utf-8') as f:
+                assert json.loads(json.load(f)['payload']) == {'code': "a = 1", 'globals_dict': {}}
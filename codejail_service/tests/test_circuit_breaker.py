@@ -0,0 +1,128 @@
+"""
+Tests for the resource-kill circuit breaker.
+"""
+
+from unittest.mock import patch
+
+import ddt
+from django.test import TestCase, override_settings
+
+from codejail_service.circuit_breaker import CircuitBreaker, get_breaker_key, is_resource_kill
+
+TIMEOUT = "Couldn't execute jailed code: stdout: b'', stderr: b'' with status code: -9"
+
+
+@ddt.ddt
+class TestIsResourceKill(TestCase):
+
+    @ddt.unpack
+    @ddt.data(
+        (None, False),
+        ("ZeroDivisionError: division by zero", False),
+        (TIMEOUT, True),
+        ("Couldn't execute jailed code: stdout: b'', stderr: b'' with status code: -24", True),
+        ("Couldn't execute jailed code: stdout: b'', stderr: b'MemoryError' with status code: 1", True),
+        ("Couldn't execute jailed code: stdout: b'', stderr: b'' with status code: -91", False),
+    )
+    def test_classify(self, error_message, expected):
+        assert is_resource_kill(error_message) is expected
+
+
+class TestBreakerKey(TestCase):
+
+    def test_disabled(self):
+        assert get_breaker_key("x = 1", {}, [], 'hw1') is None
+
+    @override_settings(CODEJAIL_CIRCUIT_BREAKER_THRESHOLD=3)
+    def test_code_key(self):
+        key = get_breaker_key("x = 1", {}, [('python_lib.zip', b'lib')], 'hw1')
+        assert key.startswith('code:')
+        assert key == get_breaker_key("x = 1", {}, [('python_lib.zip', b'lib')], 'other-slug')
+        assert key != get_breaker_key("x = 1", {}, [('python_lib.zip', b'lib2')], 'hw1')
+        assert key != get_breaker_key("x = 2", {}, [('python_lib.zip', b'lib')], 'hw1')
+
+    @override_settings(CODEJAIL_CIRCUIT_BREAKER_THRESHOLD=3)
+    def test_code_key_globals(self):
+        """Executions of the same code with different answers are kept apart."""
+        key = get_breaker_key("check(answer)", {'answer': "1/x", 'expected': 2}, [], 'hw1')
+        assert key != get_breaker_key("check(answer)", {'answer': "2", 'expected': 2}, [], 'hw1')
+        # The order of keys doesn't matter
+        assert key == get_breaker_key("check(answer)", {'expected': 2, 'answer': "1/x"}, [], 'hw1')
+
+    @override_settings(CODEJAIL_CIRCUIT_BREAKER_THRESHOLD=3, CODEJAIL_CIRCUIT_BREAKER_KEY='slug')
+    def test_slug_key(self):
+        assert get_breaker_key("x = 1", {}, [], 'hw1') == 'slug:hw1'
+        assert get_breaker_key("x = 1", {}, [], None) is None
+
+
+class TestCircuitBreaker(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.now = 1000.0
+        patcher = patch('codejail_service.circuit_breaker.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(threshold=3, window=60, cooldown=30)
+
+    def test_opens_after_threshold(self):
+        assert self.breaker.record('k', TIMEOUT) is False
+        assert self.breaker.record('k', TIMEOUT) is False
+        assert self.breaker.check('k') is None
+        assert self.breaker.record('k', TIMEOUT) is True
+        assert self.breaker.check('k') == TIMEOUT
+        # Other keys unaffected
+        assert self.breaker.check('other') is None
+
+    def test_success_resets(self):
+        self.breaker.record('k', TIMEOUT)
+        self.breaker.record('k', TIMEOUT)
+        self.breaker.record('k', None)
+        assert self.breaker.record('k', TIMEOUT) is False
+        assert self.breaker.check('k') is None
+
+    def test_ordinary_errors_reset(self):
+        self.breaker.record('k', TIMEOUT)
+        self.breaker.record('k', TIMEOUT)
+        self.breaker.record('k', "NameError: name 'x' is not defined")
+        self.breaker.record('k', TIMEOUT)
+        assert self.breaker.check('k') is None
+
+    def test_window(self):
+        self.breaker.record('k', TIMEOUT)
+        self.breaker.record('k', TIMEOUT)
+        self.now += 61
+        self.breaker.record('k', TIMEOUT)
+        assert self.breaker.check('k') is None
+
+    def test_half_open(self):
+        for _ in range(3):
+            self.breaker.record('k', TIMEOUT)
+
+        self.now += 31
+        # One probe gets through, others are still skipped
+        assert self.breaker.check('k') is None
+        assert self.breaker.check('k') == TIMEOUT
+
+        # Probe killed again: reopen
+        assert self.breaker.record('k', TIMEOUT) is False
+        assert self.breaker.check('k') == TIMEOUT
+
+        # Next probe succeeds: closed
+        self.now += 31
+        assert self.breaker.check('k') is None
+        self.breaker.record('k', None)
+        assert self.breaker.check('k') is None
+
+    def test_disabled(self):
+        breaker = CircuitBreaker(threshold=0, window=60, cooldown=30)
+        for _ in range(5):
+            breaker.record('k', TIMEOUT)
+        assert breaker.check('k') is None
+
+    def test_bounded(self):
+        breaker = CircuitBreaker(threshold=1, window=60, cooldown=30, max_keys=2)
+        breaker.record('a', TIMEOUT)
+        breaker.record('b', TIMEOUT)
+        breaker.record('c', TIMEOUT)
+        assert list(breaker.circuits) == ['b', 'c']
@@ -0,0 +1,84 @@
+"""
+Tests for sandbox import profiling.
+"""
+
+import os
+import tempfile
+from unittest.mock import call, patch
+
+from django.test import TestCase, override_settings
+
+from codejail_service.import_profile import (
+    get_profile_modules,
+    profile_imports,
+    publish_profile,
+    read_sandbox_modules,
+    run_startup_import_profile
+)
+
+
+class TestReadSandboxModules(TestCase):
+
+    def test_parse(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'base.in')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(
+                    "-c ../constraints.txt\n"
+                    "\n"
+                    "# A comment\n"
+                    "lxml[html_clean]                    # XML parser\n"
+                    "openedx-calc\n"
+                    "sympy>=1.12\n"
+                    "codejail-includes\n"
+                )
+            assert read_sandbox_modules(path) == ['lxml', 'calc', 'sympy', 'eia', 'loncapa', 'verifiers']
+
+    def test_repo_requirements(self):
+        modules = read_sandbox_modules()
+        assert 'sympy' in modules
+        assert 'calc' in modules
+        # codejail-includes has no module of its own name
+        assert {'eia', 'loncapa', 'verifiers'} <= set(modules)
+        assert 'codejail_includes' not in modules
+
+    @override_settings(CODEJAIL_IMPORT_PROFILE_MODULES=['numpy'])
+    def test_setting(self):
+        assert get_profile_modules() == ['numpy']
+
+
+class TestProfileImports(TestCase):
+
+    @patch('codejail_service.import_profile.safe_exec')
+    def test_profile(self, mock_safe_exec):
+        mock_safe_exec.side_effect = [
+            ({'module': 'sympy', 'seconds': 1.5, 'modules_loaded': 800}, None),
+            ({'module': 'nope'}, "ModuleNotFoundError: No module named 'nope'"),
+        ]
+
+        assert profile_imports(['sympy', 'nope']) == {
+            'sympy': {'seconds': 1.5, 'modules_loaded': 800},
+            'nope': {'error': "ModuleNotFoundError: No module named 'nope'"},
+        }
+        assert mock_safe_exec.call_args_list[0].args[1] == {'module': 'sympy'}
+
+    @patch('codejail_service.import_profile.set_custom_attribute')
+    def test_publish(self, mock_set_custom_attribute):
+        publish_profile({
+            'sympy': {'seconds': 1.5, 'modules_loaded': 800},
+            'nope': {'error': "ModuleNotFoundError"},
+        })
+        assert mock_set_custom_attribute.call_args_list == [call('codejail.import_profile.sympy', 1.5)]
+
+    @patch('codejail_service.import_profile.profile_imports')
+    def test_startup_disabled(self, mock_profile_imports):
+        run_startup_import_profile()
+        mock_profile_imports.assert_not_called()
+
+    @override_settings(CODEJAIL_IMPORT_PROFILE_AT_STARTUP=True, CODEJAIL_IMPORT_PROFILE_MODULES=['sympy'])
+    @patch('codejail_service.import_profile.publish_profile')
+    @patch('codejail_service.import_profile.profile_imports', side_effect=Exception("boom"))
+    def test_startup_never_raises(self, mock_profile_imports, mock_publish_profile):
+        run_startup_import_profile()
+        mock_profile_imports.assert_called_once_with(['sympy'])
+        mock_publish_profile.assert_not_called()
@@ -0,0 +1,65 @@
+"""
+Tests for static import analysis.
+"""
+
+import io
+import zipfile
+from textwrap import dedent
+
+from django.test import TestCase
+
+from codejail_service.imports import extract_imports, library_contents
+
+
+def make_zip(files):
+    """
+    Return the bytes of a zip file containing the given dict of names to source.
+    """
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w') as zf:
+        for name, source in files.items():
+            zf.writestr(name, source)
+    return buf.getvalue()
+
+
+class TestExtractImports(TestCase):
+
+    def test_forms(self):
+        code = dedent("""
+            import numpy as np, os.path
+            from sympy.physics import units
+            from . import sibling
+            import importlib
+
+            def check(expect, ans):
+                import scipy.optimize
+                return importlib.import_module('networkx')
+
+            calc = __import__('calc')
+            dynamic = __import__(name_from_somewhere)
+        """)
+        assert extract_imports(code) == {'numpy', 'os', 'sympy', 'importlib', 'scipy', 'networkx', 'calc'}
+
+    def test_unparseable(self):
+        assert extract_imports("import numpy\nthis is not (python") == set()
+        assert extract_imports("import os\0") == set()
+        # Too deeply nested for the parser
+        assert extract_imports("import os\nx = 1" + "+1" * 100000) == set()
+        assert extract_imports("import os\nx = " + "[" * 100000 + "]" * 100000) == set()
+
+
+class TestLibraryContents(TestCase):
+
+    def test_library(self):
+        zip_bytes = make_zip({
+            'course_library/__init__.py': "from course_library.helpers import grade\nimport sympy\n",
+            'course_library/helpers.py': "import numpy\n",
+            'standalone.py': "import course_library\nimport random2\n",
+            'data/table.csv': "a,b\n",
+        })
+        provided, imported = library_contents(zip_bytes)
+        assert provided == {'course_library', 'standalone'}
+        assert imported == {'sympy', 'numpy', 'random2'}
+
+    def test_corrupt(self):
+        assert library_contents(b'not a zip') == (set(), set())
@@ -0,0 +1,116 @@
+"""
+Tests for the sandbox directory janitor.
+"""
+
+import fcntl
+import os
+import tempfile
+import time
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from codejail_service import janitor
+from codejail_service.janitor import LOCK_FILENAME, Janitor, start_janitor
+
+
+class TestJanitor(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp.cleanup)
+        self.root = tmp.name
+
+    def make_dir(self, name, age, size=100):
+        """
+        Make a directory with a file of the given size, last modified ``age`` seconds ago.
+        """
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.join(path, 'tmp'))
+        with open(os.path.join(path, 'python_lib.zip'), 'wb') as f:
+            f.write(b'x' * size)
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_reap(self):
+        stale = self.make_dir('codejail-abc', age=7200, size=100)
+        self.make_dir('codejail-def', age=60)
+        self.make_dir('unrelated', age=7200)
+
+        janitor_ = Janitor(self.root, max_age=3600)
+        assert janitor_.find_stale() == [stale]
+        assert janitor_.reap() == {'dirs': 1, 'bytes': 100, 'failed': 0}
+        assert sorted(os.listdir(self.root)) == ['codejail-def', 'unrelated']
+
+        assert janitor_.reap() == {'dirs': 0, 'bytes': 0, 'failed': 0}
+        assert janitor_.report() == {'passes': 2, 'dirs': 1, 'bytes': 100, 'failed': 0}
+
+    def test_sandbox_user_fallback(self):
+        stale = self.make_dir('codejail-abc', age=7200)
+        janitor_ = Janitor(self.root, max_age=3600, sandbox_users=['sandbox'])
+
+        with (
+            patch('codejail_service.janitor.shutil.rmtree', side_effect=[PermissionError, None]) as mock_rmtree,
+            patch('codejail_service.janitor.subprocess.run') as mock_run,
+        ):
+            assert janitor_.reap()['dirs'] == 1
+
+        assert mock_run.call_args.args[0] == ['sudo', '-u', 'sandbox', 'find', stale, '-mindepth', '1', '-delete']
+        assert mock_rmtree.call_count == 2
+
+    def test_several_sandbox_users(self):
+        stale = self.make_dir('codejail-abc', age=7200)
+        janitor_ = Janitor(self.root, max_age=3600, sandbox_users=['sandbox1', 'sandbox2', 'sandbox3'])
+
+        with (
+            patch(
+                'codejail_service.janitor.shutil.rmtree', side_effect=[PermissionError, PermissionError, None],
+            ) as mock_rmtree,
+            patch('codejail_service.janitor.subprocess.run') as mock_run,
+        ):
+            assert janitor_.reap()['dirs'] == 1
+
+        assert [call.args[0][2] for call in mock_run.call_args_list] == ['sandbox1', 'sandbox2']
+        assert mock_run.call_args.args[0][3:5] == ['find', stale]
+        assert mock_rmtree.call_count == 3
+
+    def test_failure(self):
+        self.make_dir('codejail-abc', age=7200)
+        janitor_ = Janitor(self.root, max_age=3600)
+
+        with patch('codejail_service.janitor.shutil.rmtree', side_effect=PermissionError):
+            assert janitor_.reap() == {'dirs': 0, 'bytes': 0, 'failed': 1}
+
+    def test_one_worker_at_a_time(self):
+        self.make_dir('codejail-abc', age=7200)
+        janitor_ = Janitor(self.root, max_age=3600)
+
+        with open(os.path.join(self.root, LOCK_FILENAME), 'a', encoding='utf-8') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            assert janitor_.run_pass() is None
+        assert janitor_.run_pass()['dirs'] == 1
+
+
+class TestStartJanitor(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = patch.object(janitor, '_started_in_pid', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @override_settings(CODEJAIL_JANITOR_INTERVAL=600)
+    def test_started_once(self):
+        with patch('codejail_service.janitor.threading.Thread') as mock_thread:
+            start_janitor()
+            start_janitor()
+        mock_thread.assert_called_once()
+        mock_thread.return_value.start.assert_called_once_with()
+
+    @override_settings(CODEJAIL_JANITOR_INTERVAL=0)
+    def test_disabled(self):
+        with patch('codejail_service.janitor.threading.Thread') as mock_thread:
+            start_janitor()
+        mock_thread.assert_not_called()
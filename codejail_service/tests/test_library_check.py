@@ -0,0 +1,70 @@
+"""
+Tests for course library validation.
+"""
+
+import hashlib
+import io
+import zipfile
+from unittest.mock import patch
+
+import ddt
+from django.test import TestCase, override_settings
+
+from codejail_service import library_check
+from codejail_service.library_check import check_library, inspect_library
+
+
+def make_zip(files, compression=zipfile.ZIP_DEFLATED):
+    """
+    Return the bytes of a zip archive containing the given dict of names to contents.
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression=compression) as archive:
+        for name, contents in files.items():
+            archive.writestr(name, contents)
+    return buffer.getvalue()
+
+
+@ddt.ddt
+@override_settings(
+    CODEJAIL_LIBRARY_MAX_ENTRIES=10,
+    CODEJAIL_LIBRARY_MAX_UNCOMPRESSED_BYTES=4 * 1024 ** 2,
+    CODEJAIL_LIBRARY_MAX_COMPRESSION_RATIO=100,
+)
+class TestLibraryCheck(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        library_check._verdicts.clear()  # pylint: disable=protected-access
+
+    @ddt.data(
+        (make_zip({'course_library.py': "def f():\n    return 1\n"}), None),
+        # Small, highly compressible files are fine
+        (make_zip({'data.txt': "a" * 100_000}), None),
+        (b'TESTING', "Library is not a valid zip archive: File is not a zip file"),
+        (make_zip({f'm{i}.py': "" for i in range(11)}), "Library has 11 entries; the limit is 10"),
+        (
+            make_zip({'big.bin': "x" * (5 * 1024 ** 2)}, compression=zipfile.ZIP_STORED),
+            f"Library would uncompress to {5 * 1024 ** 2} bytes; the limit is {4 * 1024 ** 2}",
+        ),
+        (make_zip({'bomb.bin': "\0" * (3 * 1024 ** 2)}), "Library entry 'bomb.bin' has a suspicious compression ratio"),
+    )
+    @ddt.unpack
+    def test_inspect(self, contents, expected):
+        assert inspect_library(io.BytesIO(contents)) == expected
+
+    def test_verdict_cached(self):
+        contents = b'TESTING'
+        digest = hashlib.sha256(contents).hexdigest()
+        fileobj = io.BytesIO(contents)
+        with patch('codejail_service.library_check.inspect_library', wraps=inspect_library) as mock_inspect:
+            assert check_library(fileobj, digest) is not None
+            assert check_library(fileobj, digest) is not None
+        assert mock_inspect.call_count == 1
+        assert fileobj.tell() == 0
+
+    @patch('codejail_service.library_check.VERDICT_CACHE_SIZE', 2)
+    def test_cache_bounded(self):
+        for i in range(3):
+            check_library(io.BytesIO(b'TESTING'), str(i))
+        assert list(library_check._verdicts) == ['1', '2']  # pylint: disable=protected-access
@@ -0,0 +1,134 @@
+"""
+Tests for pre-extracted course libraries.
+"""
+
+import io
+import os
+import stat
+import sys
+import tempfile
+import zipfile
+from unittest.mock import patch
+
+import pytest
+from django.test import TestCase, override_settings
+
+from codejail_service.library_extract import LibraryExtractions, extracted_library_dir
+from codejail_service.library_store import library_digest
+
+
+def make_library(source="def triangular_number(n):\n    return n * (n + 1) // 2\n"):
+    """
+    Return the bytes of a course library zip with a single module.
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('course_library.py', source)
+        archive.writestr('data/answers.txt', "42")
+    return buffer.getvalue()
+
+
+class TestLibraryExtractions(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp.cleanup)
+        self.root = os.path.join(tmp.name, 'extracted')
+
+    def test_extract(self):
+        contents = make_library()
+        digest = library_digest(contents)
+        path = LibraryExtractions(self.root, max_bytes=10 ** 6).get(digest, contents)
+
+        assert path == os.path.join(self.root, digest)
+        with open(os.path.join(path, 'data', 'answers.txt'), encoding='utf-8') as f:
+            assert f.read() == "42"
+        # Read-only, and no bytecode without a sandbox Python
+        assert not os.stat(path).st_mode & stat.S_IWUSR
+        assert not os.stat(os.path.join(path, 'course_library.py')).st_mode & stat.S_IWUSR
+        assert not os.path.exists(os.path.join(path, '__pycache__'))
+        assert os.listdir(self.root) == [digest]
+
+    def test_compile(self):
+        contents = make_library()
+        path = LibraryExtractions(self.root, max_bytes=10 ** 6, python_bin=sys.executable).get(
+            library_digest(contents), contents,
+        )
+        assert any(name.startswith('course_library.') for name in os.listdir(os.path.join(path, '__pycache__')))
+
+    def test_compile_quietly(self):
+        """Nothing is logged when every module is compiled."""
+        contents = make_library()
+        with patch('codejail_service.library_extract.log.warning') as mock_warning:
+            LibraryExtractions(self.root, max_bytes=10 ** 6, python_bin=sys.executable).get(
+                library_digest(contents), contents,
+            )
+        mock_warning.assert_not_called()
+
+    def test_compile_errors(self):
+        """Modules that don't compile are logged as a warning, with the compiler's output."""
+        contents = make_library("def broken(:\n")
+        with patch('codejail_service.library_extract.log.warning') as mock_warning:
+            LibraryExtractions(self.root, max_bytes=10 ** 6, python_bin=sys.executable).get(
+                library_digest(contents), contents,
+            )
+        (message,) = mock_warning.call_args[0]
+        assert message.startswith("1 modules of library at ")
+        assert "uncompiled=['course_library.py']" in message
+        assert "SyntaxError" in message
+
+    def test_bytecode_not_written(self):
+        """A compiler that exits successfully without writing bytecode is also logged."""
+        contents = make_library()
+        with patch('codejail_service.library_extract.log.warning') as mock_warning:
+            path = LibraryExtractions(self.root, max_bytes=10 ** 6, python_bin='/bin/true').get(
+                library_digest(contents), contents,
+            )
+        assert os.path.exists(os.path.join(path, 'course_library.py'))
+        (message,) = mock_warning.call_args[0]
+        assert "(compileall exited with 0)" in message
+        assert "uncompiled=['course_library.py']" in message
+
+    def test_extracted_once(self):
+        contents = make_library()
+        digest = library_digest(contents)
+        extractions = LibraryExtractions(self.root, max_bytes=10 ** 6)
+        first = extractions.get(digest, contents)
+        with patch.object(extractions, '_extract') as mock_extract:
+            assert extractions.get(digest, contents) == first
+        mock_extract.assert_not_called()
+
+    def test_bad_digest(self):
+        with pytest.raises(ValueError):
+            LibraryExtractions(self.root, max_bytes=10 ** 6).get('../../etc', make_library())
+
+    @patch('codejail_service.library_extract.EVICTION_GRACE_SECONDS', -60)
+    def test_eviction(self):
+        extractions = LibraryExtractions(self.root, max_bytes=150)
+        libraries = [make_library(f"x = {i}\n" * 10) for i in range(3)]
+        digests = [library_digest(contents) for contents in libraries]
+        for i, (digest, contents) in enumerate(zip(digests, libraries)):
+            path = extractions.get(digest, contents)
+            os.utime(path, (1000 + i, 1000 + i))
+
+        # Each is 62 bytes, so only the two most recent fit
+        assert sorted(os.listdir(self.root)) == sorted(digests[1:])
+
+    def test_recently_used_not_evicted(self):
+        extractions = LibraryExtractions(self.root, max_bytes=1)
+        libraries = [make_library(f"x = {i}\n") for i in range(2)]
+        for contents in libraries:
+            extractions.get(library_digest(contents), contents)
+        assert len(os.listdir(self.root)) == 2
+
+
+class TestExtractedLibraryDir(TestCase):
+
+    def test_disabled(self):
+        assert extracted_library_dir('0' * 64, b'zip') is None
+
+    def test_failure(self):
+        with tempfile.TemporaryDirectory() as root, override_settings(CODEJAIL_LIBRARY_EXTRACT_DIR=root):
+            assert extracted_library_dir(library_digest(b'zip'), b'zip') is None
+            assert os.listdir(root) == []
@@ -0,0 +1,82 @@
+"""
+Tests for the course library store.
+"""
+
+import os
+import tempfile
+import time
+from unittest.mock import patch
+
+import pytest
+from django.test import TestCase, override_settings
+
+from codejail_service.library_store import LibraryStore, get_library_store, library_digest, remember_library
+
+
+class TestLibraryStore(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp.cleanup)
+        self.root = os.path.join(tmp.name, 'libraries')
+
+    def test_put_get(self):
+        store = LibraryStore(self.root, max_bytes=1000)
+        assert store.get(library_digest(b'zip')) is None
+
+        digest = store.put(b'zip')
+        assert digest == library_digest(b'zip')
+        assert store.get(digest) == b'zip'
+        # Idempotent
+        assert store.put(b'zip') == digest
+        assert os.listdir(self.root) == [digest]
+
+    def test_bad_digest(self):
+        store = LibraryStore(self.root, max_bytes=1000)
+        with pytest.raises(ValueError):
+            store.get('../../etc/passwd')
+
+    def test_corrupt(self):
+        store = LibraryStore(self.root, max_bytes=1000)
+        digest = store.put(b'zip')
+        with open(store.path_for(digest), 'wb') as f:
+            f.write(b'truncated')
+
+        assert store.get(digest) is None
+        assert not os.path.exists(store.path_for(digest))
+
+    def test_evict_least_recently_used(self):
+        store = LibraryStore(self.root, max_bytes=25)
+        old, used, new = b'a' * 10, b'b' * 10, b'c' * 10
+        store.put(old)
+        store.put(used)
+        # Make the first two distinguishable by last use
+        past = time.time() - 100
+        os.utime(store.path_for(library_digest(old)), (past, past))
+        os.utime(store.path_for(library_digest(used)), (past + 1, past + 1))
+        store.get(library_digest(used))
+
+        store.put(new)
+
+        assert store.get(library_digest(old)) is None
+        assert store.get(library_digest(used)) == used
+        assert store.get(library_digest(new)) == new
+
+    def test_disabled(self):
+        assert get_library_store() is None
+        remember_library(b'zip')  # no-op
+
+    def test_remember(self):
+        with override_settings(CODEJAIL_LIBRARY_STORE_DIR=self.root):
+            remember_library(b'zip')
+            assert get_library_store().get(library_digest(b'zip')) == b'zip'
+
+    @patch('codejail_service.library_store.log.warning')
+    def test_remember_failure(self, mock_log_warning):
+        with (
+                override_settings(CODEJAIL_LIBRARY_STORE_DIR=self.root),
+                patch.object(LibraryStore, 'put', side_effect=OSError("disk full")),
+        ):
+            remember_library(b'zip')
+        mock_log_warning.assert_called_once()
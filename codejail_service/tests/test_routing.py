@@ -0,0 +1,59 @@
+"""
+Tests for import-aware routing.
+"""
+
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from codejail_service.routing import COLD, PoolStats, choose_pool, route_execution
+from codejail_service.usage import ExecutionUsage
+
+POOLS = {
+    'scientific': {'modules': ['numpy', 'scipy', 'sympy', 'matplotlib']},
+    'symbolic': {'modules': ['sympy']},
+    'chemistry': {'modules': ['chem', 'nltk', 'pyparsing']},
+}
+
+
+@override_settings(CODEJAIL_WARM_POOLS=POOLS)
+class TestChoosePool(TestCase):
+
+    def test_smallest_covering_pool(self):
+        assert choose_pool("import sympy") == 'symbolic'
+        assert choose_pool("import sympy\nimport numpy as np") == 'scientific'
+        assert choose_pool("from chem import chemcalc") == 'chemistry'
+
+    def test_stdlib_ignored(self):
+        assert choose_pool("import math, random\nimport sympy") == 'symbolic'
+        # Every pool covers code that only uses the stdlib; the smallest wins
+        assert choose_pool("import math") == 'symbolic'
+
+    def test_cold(self):
+        assert choose_pool("import networkx\nimport sympy") == COLD
+
+    @override_settings(CODEJAIL_WARM_POOLS={})
+    def test_disabled(self):
+        with patch('codejail_service.routing.extract_imports') as mock_extract:
+            assert choose_pool("import sympy") is None
+        mock_extract.assert_not_called()
+
+    @patch('codejail_service.routing.set_custom_attribute')
+    def test_route_execution(self, mock_set_custom_attribute):
+        assert route_execution("import networkx") == COLD
+        mock_set_custom_attribute.assert_called_once_with('codejail.exec.pool', COLD)
+
+
+class TestPoolStats(TestCase):
+
+    def test_report(self):
+        stats = PoolStats()
+        stats.record('symbolic', ExecutionUsage(cpu_user=1.0, cpu_sys=0.5, wall=2.0, max_rss_kb=50000))
+        stats.record('symbolic', ExecutionUsage(cpu_user=1.0, cpu_sys=0.5, wall=2.0, max_rss_kb=None))
+        stats.record(COLD, ExecutionUsage(cpu_user=0.5, cpu_sys=0.0, wall=1.0, max_rss_kb=80000))
+        stats.record(COLD, ExecutionUsage(cpu_user=0.5, cpu_sys=0.0, wall=1.0, max_rss_kb=None))
+
+        assert stats.report() == {
+            'symbolic': {'executions': 2, 'cpu': 3.0, 'max_rss_kb': 50000, 'hit_rate': 0.5},
+            COLD: {'executions': 2, 'cpu': 1.0, 'max_rss_kb': 80000, 'hit_rate': 0.5},
+        }
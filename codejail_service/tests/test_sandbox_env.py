@@ -0,0 +1,253 @@
+"""
+Tests for sandbox environment prolog.
+"""
+
+import itertools
+import os
+import sys
+import tempfile
+from textwrap import dedent
+from unittest.mock import patch
+
+import codejail.safe_exec
+import ddt
+from django.test import TestCase, override_settings
+
+from codejail_service import sandbox_env
+from codejail_service.codejail import safe_exec
+from codejail_service.sandbox_env import add_sandbox_prolog, choose_cpu_placement, get_sandbox_prolog, get_thread_limit
+from test_utils import run_in_forked_child
+
+
+@ddt.ddt
+class TestThreadLimit(TestCase):
+
+    @ddt.unpack
+    @ddt.data(
+        # Default capacity is one sandbox per CPU
+        (None, 8, 1),
+        (2, 8, 4),
+        (3, 8, 2),
+        # More sandboxes than CPUs
+        (16, 8, 1),
+    )
+    def test_default(self, capacity, cpus, expected):
+        with (
+                override_settings(CODEJAIL_SANDBOX_CAPACITY=capacity),
+                patch('codejail_service.sandbox_env.available_cpus', return_value=list(range(cpus))),
+        ):
+            assert get_thread_limit() == expected
+
+    @override_settings(
+        CODEJAIL_SANDBOX_THREADS=2,
+        CODEJAIL_SANDBOX_THREADS_OVERRIDES={'course-v1:big+heavy+compute': 6},
+    )
+    def test_configured(self):
+        assert get_thread_limit() == 2
+        assert get_thread_limit('course-v1:other+course+run') == 2
+        assert get_thread_limit('course-v1:big+heavy+compute') == 6
+
+
+@patch('codejail_service.sandbox_env.available_cpus', return_value=[0, 1, 2, 3, 4, 5, 6, 7])
+class TestCpuPlacement(TestCase):
+
+    def test_disabled_by_default(self, _mock_cpus):
+        assert choose_cpu_placement() is None
+
+    @override_settings(CODEJAIL_SANDBOX_CPU_PINNING=True, CODEJAIL_SANDBOX_RESERVED_CPUS=1)
+    def test_round_robin(self, _mock_cpus):
+        """
+        Sandboxes are spread over the CPUs that aren't reserved for the webapp.
+        """
+        with patch.object(sandbox_env, '_cpu_rotation', itertools.count(0)):
+            placements = [choose_cpu_placement() for _ in range(8)]
+
+        # 7 sandbox CPUs with default capacity of 7 means one CPU each
+        assert placements == [[1], [2], [3], [4], [5], [6], [7], [1]]
+
+    @override_settings(
+        CODEJAIL_SANDBOX_CPU_PINNING=True, CODEJAIL_SANDBOX_RESERVED_CPUS=2, CODEJAIL_SANDBOX_CAPACITY=2,
+    )
+    def test_multiple_cpus(self, _mock_cpus):
+        """
+        Sandboxes allowed multiple threads get as many CPUs.
+        """
+        with patch.object(sandbox_env, '_cpu_rotation', itertools.count(4)):
+            assert choose_cpu_placement() == [2, 6, 7]
+
+    @override_settings(CODEJAIL_SANDBOX_CPU_PINNING=True)
+    def test_rotation_reseeded_after_fork(self, _mock_cpus):
+        """
+        Workers forked from a preloaded app each start the rotation from their own PID.
+        """
+        with patch.object(sandbox_env, '_cpu_rotation', itertools.count(0)):
+            (child_pid, child_placement) = run_in_forked_child(choose_cpu_placement)
+            assert choose_cpu_placement() == [0]
+        assert child_placement == [child_pid % 8]
+
+    @override_settings(CODEJAIL_SANDBOX_CPU_PINNING=True, CODEJAIL_SANDBOX_RESERVED_CPUS=8)
+    def test_reservation_too_large(self, _mock_cpus):
+        assert len(sandbox_env.get_sandbox_cpus()) == 8
+
+
+class TestSandboxProlog(TestCase):
+
+    @override_settings(
+        CODEJAIL_SANDBOX_CPU_PINNING=True, CODEJAIL_SANDBOX_NICE=10, CODEJAIL_SANDBOX_SCHED_POLICY='batch',
+    )
+    @patch('codejail_service.sandbox_env.choose_cpu_placement', return_value=[3])
+    @patch('codejail_service.sandbox_env.set_custom_attribute')
+    def test_scheduling_prolog(self, mock_set_custom_attribute, _mock_placement):
+        prolog = get_sandbox_prolog()
+        assert "os.sched_setaffinity(0, {3})" in prolog
+        assert "os.nice(10)" in prolog
+        assert "os.sched_setscheduler(0, os.SCHED_BATCH, os.sched_param(0))" in prolog
+        mock_set_custom_attribute.assert_called_once_with('codejail.exec.cpus', '3')
+
+    @override_settings(CODEJAIL_SANDBOX_THREADS=3)
+    def test_thread_prolog(self):
+        prolog = get_sandbox_prolog()
+        assert "'OPENBLAS_NUM_THREADS'] = '3'" in prolog
+        assert "'OMP_NUM_THREADS'] = '3'" in prolog
+        assert "MPLCONFIGDIR" not in prolog
+
+    @override_settings(CODEJAIL_SANDBOX_CACHE_DIR='/srv/caches')
+    def test_cache_prolog(self):
+        prolog = get_sandbox_prolog()
+
+        # Single line, so line numbers are barely disturbed
+        assert prolog.endswith("\n")
+        assert prolog.count("\n") == 1
+        assert "/srv/caches/nltk_data" in prolog
+        assert "/srv/caches/matplotlib" in prolog
+
+    def test_library_prolog(self):
+        assert "sys.path.append" not in get_sandbox_prolog()
+        prolog = get_sandbox_prolog(library_dir='/srv/extracted/abc')
+        assert "sys.path.append('/srv/extracted/abc')" in prolog
+        assert prolog.count("\n") == 1
+
+
+@ddt.ddt
+class TestAddSandboxProlog(TestCase):
+
+    @ddt.data(
+        # No header
+        ("x = 1\n", "", "x = 1\n"),
+        ("", "", ""),
+        # __future__ imports, after a docstring and comments, with other line endings
+        (
+            '"""Doc."""\n# comment\nfrom __future__ import absolute_import, division\nx = 1/2\n',
+            '"""Doc."""\n# comment\nfrom __future__ import absolute_import, division\n',
+            "x = 1/2\n",
+        ),
+        (
+            "from __future__ import division\r\nfrom __future__ import (\r\n    absolute_import)\r\nx = 1\r\n",
+            "from __future__ import division\r\nfrom __future__ import (\r\n    absolute_import)\r\n",
+            "x = 1\r\n",
+        ),
+        # Nothing after the header, without a final newline
+        ("from __future__ import division", "from __future__ import division\n", ""),
+        # A mention of __future__ elsewhere
+        ("x = '__future__'\n", "", "x = '__future__'\n"),
+        # Syntax errors are left for the sandbox to report
+        ("from __future__ import division\nx = (\n", "from __future__ import division\n", "x = (\n"),
+        ("from __future__ import (division\n", "", "from __future__ import (division\n"),
+        # A docstring alone is a header too, when there might be __future__ imports
+        ('"""See __future__."""\nx = 1\n', '"""See __future__."""\n', "x = 1\n"),
+    )
+    @ddt.unpack
+    def test_placement(self, code, expected_header, expected_rest):
+        prolog = get_sandbox_prolog()
+        assert add_sandbox_prolog(code) == expected_header + prolog + expected_rest
+
+    def test_deeply_nested(self):
+        """Only the header is read, however deeply nested the rest of the (untrusted) code."""
+        header = "from __future__ import division\n"
+        prolog = get_sandbox_prolog()
+        for rest in ["x = 1" + "+1" * 100000, "x = " + "(" * 100000, "x = " + "[" * 100000 + "]" * 100000]:
+            assert add_sandbox_prolog(header + rest) == header + prolog + rest
+
+
+class TestPrologExecution(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        codejail.safe_exec.ALWAYS_BE_UNSAFE = True
+        # Unsafe execution runs the prolog in this process
+        self._saved_environ = dict(os.environ)
+        self._saved_meta_path = list(sys.meta_path)
+
+    def tearDown(self):
+        super().tearDown()
+        codejail.safe_exec.ALWAYS_BE_UNSAFE = False
+        os.environ.clear()
+        os.environ.update(self._saved_environ)
+        sys.meta_path[:] = self._saved_meta_path
+
+    @override_settings(CODEJAIL_SANDBOX_THREADS_OVERRIDES={'big-lane': 5})
+    def test_thread_vars_by_lane(self):
+        (globals_out, error_message) = safe_exec(
+            "import os; threads = os.environ['OPENBLAS_NUM_THREADS']", {},
+            limit_overrides_context='big-lane',
+        )
+        assert error_message is None
+        assert globals_out == {'threads': '5'}
+
+    def test_future_imports(self):
+        """
+        Code starting with ``__future__`` imports, as edxapp's code prolog does, still compiles.
+        """
+        (globals_out, error_message) = safe_exec(
+            "from __future__ import absolute_import, division\nimport os\n"
+            "x = 1/2\nthreads = os.environ['OPENBLAS_NUM_THREADS']\n",
+            {},
+        )
+        assert error_message is None
+        assert globals_out == {'x': 0.5, 'threads': str(get_thread_limit())}
+
+    def test_matplotlib_cache_copied_on_import(self):
+        """
+        The matplotlib cache is only copied into the sandbox when matplotlib is imported.
+        """
+        with tempfile.TemporaryDirectory() as cache_dir:
+            os.makedirs(os.path.join(cache_dir, 'matplotlib'))
+            with open(os.path.join(cache_dir, 'matplotlib', 'fontlist-v390.json'), 'w') as f:
+                f.write('{}')
+
+            with override_settings(CODEJAIL_SANDBOX_CACHE_DIR=cache_dir):
+                (globals_out, error_message) = safe_exec(
+                    "from __future__ import division\nimport os\n"
+                    "copied = os.path.exists(os.environ['MPLCONFIGDIR'])",
+                    {},
+                )
+                assert error_message is None
+                assert globals_out == {'copied': False}
+
+                # (matplotlib need not actually be installed for the copy to happen)
+                (globals_out, error_message) = safe_exec(
+                    dedent("""
+                        import os
+                        try:
+                            import matplotlib
+                        except ImportError:
+                            pass
+                        files = os.listdir(os.environ['MPLCONFIGDIR'])
+                    """),
+                    {},
+                )
+                assert error_message is None
+                assert globals_out == {'files': ['fontlist-v390.json']}
+
+    def test_prolog_does_not_leak_globals(self):
+        """
+        The prolog runs in its own namespace and must not pollute the returned globals.
+        """
+        with tempfile.TemporaryDirectory() as cache_dir:
+            with override_settings(CODEJAIL_SANDBOX_CACHE_DIR=cache_dir):
+                (globals_out, error_message) = safe_exec(
+                    "import os; nltk_data = os.environ['NLTK_DATA']", {},
+                )
+
+        assert error_message is None
+        assert globals_out == {'nltk_data': os.path.join(cache_dir, 'nltk_data')}
@@ -0,0 +1,117 @@
+"""
+Tests for the sandbox process watchdog.
+"""
+
+import os
+import tempfile
+import time
+from unittest.mock import Mock, patch
+
+from django.test import TestCase, override_settings
+
+from codejail_service.sandbox_procs import ProcessWatchdog, get_max_execution_seconds, scan_processes
+
+CODE_JAIL = {
+    'user': 'sandbox',
+    'limits': {'NPROC': 20, 'REALTIME': 3},
+    'limit_overrides': {'big-lane': {'REALTIME': 30}, 'other': {'CPU': 5}},
+}
+
+
+def write_proc(root, pid, uid, threads, start_ticks, comm='python3'):
+    """
+    Write fake ``/proc/<pid>/status`` and ``stat`` files.
+    """
+    os.makedirs(os.path.join(root, str(pid)))
+    with open(os.path.join(root, str(pid), 'status'), 'w', encoding='utf-8') as f:
+        f.write(f"Name:\t{comm}\nUid:\t{uid}\t{uid}\t{uid}\t{uid}\nThreads:\t{threads}\n")
+    fields = ['S'] + ['0'] * 18 + [str(start_ticks), '0']
+    with open(os.path.join(root, str(pid), 'stat'), 'w', encoding='utf-8') as f:
+        f.write(f"{pid} ({comm}) {' '.join(fields)}\n")
+
+
+class TestScanProcesses(TestCase):
+
+    @patch('codejail_service.sandbox_procs._read_uptime', return_value=1000.0)
+    @patch('codejail_service.sandbox_procs.os.sysconf', return_value=100)
+    def test_scan(self, _mock_sysconf, _mock_uptime):
+        with tempfile.TemporaryDirectory() as root:
+            write_proc(root, 101, uid=5000, threads=1, start_ticks=99_000)
+            write_proc(root, 102, uid=5000, threads=4, start_ticks=50_000, comm='evil ) 1 2 3')
+            write_proc(root, 103, uid=1000, threads=1, start_ticks=0)
+            os.makedirs(os.path.join(root, 'self'))
+
+            assert sorted(scan_processes(5000, proc_root=root)) == [(101, 1, 10.0), (102, 4, 500.0)]
+
+
+@override_settings(CODE_JAIL=CODE_JAIL)
+class TestProcessWatchdog(TestCase):
+
+    def test_max_execution_seconds(self):
+        assert get_max_execution_seconds() == 90
+        with override_settings(CODEJAIL_SANDBOX_PROCESS_MAX_AGE=10):
+            assert get_max_execution_seconds() == 10
+
+    @override_settings(CODEJAIL_PROCESS_WATCHDOG_INTERVAL=10)
+    @patch('codejail_service.sandbox_procs.pwd.getpwnam')
+    @patch('codejail_service.sandbox_procs.subprocess.run')
+    def test_check(self, mock_run, mock_getpwnam):
+        mock_getpwnam.return_value.pw_uid = 5000
+        watchdog = ProcessWatchdog()
+        assert watchdog.headroom() is None
+
+        with patch('codejail_service.sandbox_procs.scan_processes', return_value=[(101, 3, 2.0), (102, 5, 500.0)]):
+            snapshot = watchdog.check()
+
+        mock_run.assert_called_once()
+        assert mock_run.call_args.args[0] == ['sudo', 'pkill', '-9', '-u', 'sandbox', '--older', '90']
+        assert snapshot['processes'] == 2
+        assert snapshot['threads'] == 8
+        assert snapshot['leftovers_killed'] == 1
+        assert snapshot['nproc_headroom'] == 17
+        assert watchdog.headroom() == 17
+
+        with patch('codejail_service.sandbox_procs.scan_processes', return_value=[(101, 3, 3.0)]):
+            watchdog.check()
+        assert mock_run.call_count == 1
+        assert watchdog.report()['total_leftovers_killed'] == 1
+
+    @override_settings(CODEJAIL_PROCESS_WATCHDOG_INTERVAL=10)
+    @patch('codejail_service.sandbox_procs.pwd.getpwnam')
+    def test_stale_reading(self, mock_getpwnam):
+        mock_getpwnam.return_value.pw_uid = 5000
+        watchdog = ProcessWatchdog()
+        with patch('codejail_service.sandbox_procs.scan_processes', return_value=[]):
+            watchdog.check()
+        assert watchdog.headroom() == 20
+
+        with patch('codejail_service.sandbox_procs.time.time', return_value=time.time() + 31):
+            assert watchdog.headroom() is None
+
+    @override_settings(
+        CODEJAIL_PROCESS_WATCHDOG_INTERVAL=10,
+        CODEJAIL_SANDBOX_USERS=[
+            {'user': 'sandbox1', 'python_bin': '/sandbox1/bin/python'},
+            {'user': 'sandbox2', 'python_bin': '/sandbox2/bin/python'},
+        ],
+    )
+    @patch('codejail_service.sandbox_procs.pwd.getpwnam')
+    def test_several_sandbox_users(self, mock_getpwnam):
+        mock_getpwnam.side_effect = lambda user: Mock(pw_uid={'sandbox1': 5001, 'sandbox2': 5002}[user])
+        processes = {5001: [(101, 3, 2.0)], 5002: [(102, 12, 2.0), (103, 1, 1.0)]}
+        watchdog = ProcessWatchdog()
+
+        with patch('codejail_service.sandbox_procs.scan_processes', side_effect=processes.get):
+            snapshot = watchdog.check()
+
+        assert snapshot['processes'] == 3
+        assert snapshot['threads'] == 16
+        assert snapshot['users']['sandbox1']['nproc_headroom'] == 17
+        assert snapshot['users']['sandbox2']['nproc_headroom'] == 7
+        assert watchdog.headroom() == 7
+
+    @override_settings(CODE_JAIL={})
+    def test_no_sandbox_user(self):
+        watchdog = ProcessWatchdog()
+        assert watchdog.check() is None
+        assert watchdog.report() is None
@@ -0,0 +1,193 @@
+"""
+Tests for spreading executions across sandbox users.
+"""
+
+import fcntl
+import itertools
+import tempfile
+import threading
+import time
+from unittest.mock import call, patch
+
+from codejail import jail_code
+from django.test import TestCase, override_settings
+
+from codejail_service.sandbox_users import (
+    _lock_path,
+    _ThreadCommands,
+    get_sandbox_user_names,
+    pinned_sandbox_user,
+    sandbox_user_slot
+)
+from test_utils import run_in_forked_child
+
+SANDBOX_USERS = [
+    {'user': 'sandbox1', 'python_bin': '/sandbox1/bin/python'},
+    {'user': 'sandbox2', 'python_bin': '/sandbox2/bin/python'},
+]
+
+
+@patch('codejail_service.sandbox_users.set_custom_attribute')
+@patch('codejail_service.sandbox_users.configure')
+class TestSandboxUserSlot(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp.cleanup)
+        patcher = override_settings(CODEJAIL_SANDBOX_USERS=SANDBOX_USERS, CODEJAIL_SANDBOX_USER_LOCK_DIR=tmp.name)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+
+    @override_settings(CODEJAIL_SANDBOX_USERS=None)
+    def test_not_configured(self, mock_configure, mock_set_custom_attribute):
+        with sandbox_user_slot() as user:
+            assert user is None
+        mock_configure.assert_not_called()
+        mock_set_custom_attribute.assert_not_called()
+
+    def test_spread_across_users(self, mock_configure, mock_set_custom_attribute):
+        with sandbox_user_slot() as first:
+            # The first user's only slot is taken, so this gets the other
+            with sandbox_user_slot() as second:
+                assert {first, second} == {'sandbox1', 'sandbox2'}
+                assert mock_configure.call_args == call(
+                    'python', f'/{second}/bin/python', user=second,
+                )
+        assert mock_set_custom_attribute.call_args_list == [
+            call('codejail.exec.sandbox_user', first),
+            call('codejail.exec.sandbox_user', second),
+        ]
+
+    @override_settings(CODEJAIL_SANDBOX_USER_CONCURRENCY=2)
+    def test_concurrency(self, _mock_configure, _mock_set_custom_attribute):
+        with sandbox_user_slot() as first, sandbox_user_slot() as second, sandbox_user_slot() as third:
+            assert {first, second} == {'sandbox1', 'sandbox2'}
+            assert third in ('sandbox1', 'sandbox2')
+
+    def test_pinned(self, mock_configure, _mock_set_custom_attribute):
+        with pinned_sandbox_user('sandbox2'):
+            for _ in range(3):
+                with sandbox_user_slot() as user:
+                    assert user == 'sandbox2'
+        assert mock_configure.call_count == 3
+
+    def test_wait_when_all_busy(self, _mock_configure, _mock_set_custom_attribute):
+        with pinned_sandbox_user('sandbox1'), sandbox_user_slot():
+            entered = threading.Event()
+
+            def run():
+                with pinned_sandbox_user('sandbox1'), sandbox_user_slot():
+                    entered.set()
+
+            thread = threading.Thread(target=run)
+            thread.start()
+            assert not entered.wait(0.2)
+        thread.join(5)
+        assert entered.is_set()
+
+    def test_wait_for_any_slot(self, _mock_configure, _mock_set_custom_attribute):
+        """
+        When all slots are busy, an execution takes whichever one is freed first.
+        """
+        holders = []
+        for user in ('sandbox1', 'sandbox2'):
+            holder = open(_lock_path(user, 0), 'a', encoding='utf-8')  # pylint: disable=consider-using-with
+            self.addCleanup(holder.close)
+            fcntl.flock(holder, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            holders.append(holder)
+
+        got = []
+
+        def run():
+            with sandbox_user_slot() as user:
+                got.append(user)
+
+        # Start from sandbox1's slot, which stays busy
+        with patch('codejail_service.sandbox_users._next_slot', itertools.count(0)):
+            thread = threading.Thread(target=run)
+            thread.start()
+            time.sleep(0.2)
+            assert not got
+            holders[1].close()
+            thread.join(5)
+        assert got == ['sandbox2']
+
+    def test_rotation_reseeded_after_fork(self, _mock_configure, _mock_set_custom_attribute):
+        """
+        Workers forked from a preloaded app each start looking from a slot chosen by their own PID.
+        """
+        def first_user():
+            with sandbox_user_slot() as user:
+                return user
+
+        with patch('codejail_service.sandbox_users._next_slot', itertools.count(0)):
+            (child_pid, child_user) = run_in_forked_child(first_user)
+            assert first_user() == 'sandbox1'
+        assert child_user == SANDBOX_USERS[child_pid % 2]['user']
+
+    def test_lock_released(self, _mock_configure, _mock_set_custom_attribute):
+        with pinned_sandbox_user('sandbox1'):
+            with sandbox_user_slot():
+                pass
+            with open(_lock_path('sandbox1', 0), 'a', encoding='utf-8') as f:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+
+class TestThreadCommands(TestCase):
+
+    def test_overriding(self):
+        commands = _ThreadCommands({'python': 'default'})
+        with commands.overriding():
+            commands['python'] = 'mine'
+            commands['node'] = 'also mine'
+            assert (commands['python'], 'node' in commands) == ('mine', True)
+
+            seen = []
+            thread = threading.Thread(target=lambda: seen.append((commands['python'], 'node' in commands)))
+            thread.start()
+            thread.join(5)
+            assert seen == [('default', False)]
+
+        assert (commands['python'], 'node' in commands) == ('default', False)
+
+    @override_settings(CODEJAIL_SANDBOX_USERS=SANDBOX_USERS)
+    def test_concurrent_slots(self):
+        """
+        Threads holding slots at the same time each see their own user's configuration.
+        """
+        with tempfile.TemporaryDirectory() as lock_dir, override_settings(CODEJAIL_SANDBOX_USER_LOCK_DIR=lock_dir):
+            entered = threading.Barrier(2, timeout=5)
+            seen = {}
+
+            def run(user):
+                with pinned_sandbox_user(user), sandbox_user_slot():
+                    entered.wait()
+                    seen[user] = (jail_code.COMMANDS['python']['user'], jail_code.COMMANDS['python']['cmdline_start'])
+                    entered.wait()
+
+            threads = [threading.Thread(target=run, args=(user['user'],)) for user in SANDBOX_USERS]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(5)
+
+        assert seen == {
+            'sandbox1': ('sandbox1', ['/sandbox1/bin/python', '-E', '-B']),
+            'sandbox2': ('sandbox2', ['/sandbox2/bin/python', '-E', '-B']),
+        }
+
+
+class TestSandboxUserNames(TestCase):
+
+    @override_settings(CODEJAIL_SANDBOX_USERS=SANDBOX_USERS)
+    def test_configured(self):
+        assert get_sandbox_user_names() == ['sandbox1', 'sandbox2']
+
+    @override_settings(CODE_JAIL={'user': 'sandbox'})
+    def test_single_user(self):
+        assert get_sandbox_user_names() == ['sandbox']
+
+    @override_settings(CODE_JAIL={})
+    def test_none(self):
+        assert get_sandbox_user_names() == []
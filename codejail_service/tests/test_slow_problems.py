@@ -0,0 +1,81 @@
+"""
+Tests for slow-problem tracking.
+"""
+
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from codejail_service.slow_problems import NO_SLUG, CountMinSketch, SlowProblemTracker, TopK
+from codejail_service.usage import ExecutionUsage
+
+
+class TestCountMinSketch(TestCase):
+
+    def test_never_underestimates(self):
+        sketch = CountMinSketch(width=8, depth=3)
+        truth = {}
+        for i in range(200):
+            key = f"key-{i % 37}"
+            sketch.add(key, 1.5)
+            truth[key] = truth.get(key, 0) + 1.5
+
+        for key, total in truth.items():
+            assert sketch.estimate(key) >= total
+
+    def test_exact_when_sparse(self):
+        sketch = CountMinSketch()
+        sketch.add('a', 2)
+        assert sketch.add('a', 3) == 5
+        assert sketch.estimate('b') == 0
+
+
+class TestTopK(TestCase):
+
+    def test_heavy_hitters(self):
+        """
+        Heavy keys are found among many light ones, even when they show up late.
+        """
+        top = TopK(3, width=256)
+        for i in range(300):
+            top.add(f"light-{i}", 1)
+        for _ in range(50):
+            top.add('heavy', 2)
+            top.add('medium', 1)
+
+        assert [key for key, _weight in top.top()[:2]] == ['heavy', 'medium']
+        assert len(top.top()) == 3
+
+    def test_scale(self):
+        top = TopK(2)
+        top.add('a', 10)
+        top.scale(0.5)
+        assert top.top() == [('a', 5)]
+        assert top.sketch.estimate('a') == 5
+
+
+class TestSlowProblemTracker(TestCase):
+
+    def test_report(self):
+        tracker = SlowProblemTracker(k=5, half_life=0)
+        tracker.add('slow', ExecutionUsage(cpu_user=2.0, cpu_sys=1.0, wall=4.0, max_rss_kb=None))
+        tracker.add('fast', ExecutionUsage(cpu_user=0.1, cpu_sys=0.0, wall=0.2, max_rss_kb=None))
+        tracker.add('fast', ExecutionUsage(cpu_user=0.1, cpu_sys=0.0, wall=0.2, max_rss_kb=None))
+        tracker.add(None, ExecutionUsage(cpu_user=0.5, cpu_sys=0.0, wall=0.5, max_rss_kb=None))
+
+        report = tracker.report()
+        assert report['by_cpu_seconds'][0] == {'slug': 'slow', 'estimate': 3.0}
+        assert report['by_wall_seconds'][0] == {'slug': 'slow', 'estimate': 4.0}
+        assert report['by_count'][0] == {'slug': 'fast', 'estimate': 2}
+        assert {'slug': NO_SLUG, 'estimate': 0.5} in report['by_cpu_seconds']
+
+    def test_decay(self):
+        with patch('codejail_service.slow_problems.time.monotonic', return_value=1000.0):
+            tracker = SlowProblemTracker(k=5, half_life=60)
+            tracker.add('a', ExecutionUsage(cpu_user=4.0, cpu_sys=0.0, wall=4.0, max_rss_kb=None))
+
+        # Two half-lives later, old costs count for a quarter
+        with patch('codejail_service.slow_problems.time.monotonic', return_value=1120.0):
+            tracker.add('b', ExecutionUsage(cpu_user=2.0, cpu_sys=0.0, wall=2.0, max_rss_kb=None))
+
+        assert tracker.by_cpu.top() == [('b', 2.0), ('a', 1.0)]
@@ -0,0 +1,76 @@
+"""
+Tests for the Unix socket health check.
+"""
+
+import json
+import os
+import socketserver
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+from django.test import TestCase
+
+from codejail_service.socket_health import check_health, main
+
+
+class _HealthHandler(BaseHTTPRequestHandler):
+    """
+    Responds to the health endpoint with the server's configured status.
+    """
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        self.server.requests.append((self.path, self.headers['Host']))
+        body = json.dumps({'status': 'OK' if self.server.status == 200 else 'UNAVAILABLE'}).encode()
+        self.send_response(self.server.status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        return 'unix'
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+class TestSocketHealth(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp.cleanup)
+        self.socket_path = os.path.join(tmp.name, 'codejail.sock')
+
+    def _serve(self, status):
+        server = socketserver.UnixStreamServer(self.socket_path, _HealthHandler)
+        server.status = status
+        server.requests = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def test_healthy(self):
+        server = self._serve(200)
+        assert check_health(self.socket_path, host='codejail.local') == (True, '200 {"status": "OK"}')
+        assert server.requests == [('/health/', 'codejail.local')]
+
+    def test_unhealthy(self):
+        self._serve(503)
+        healthy, detail = check_health(self.socket_path)
+        assert not healthy
+        assert detail.startswith('503 ')
+
+    def test_no_socket(self):
+        healthy, detail = check_health(self.socket_path)
+        assert not healthy
+        assert 'Unable to reach service' in detail
+
+    def test_main_exit_status(self):
+        self._serve(503)
+        with pytest.raises(SystemExit) as exc_info:
+            main([self.socket_path])
+        assert exc_info.value.code == 1
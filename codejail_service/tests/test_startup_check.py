@@ -2,13 +2,14 @@
 Tests for startup safety and function check.
 """
 
+import threading
 from unittest.mock import Mock, call, patch
 from urllib.error import URLError
 
 import codejail.safe_exec
 import ddt
 import pytest
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from codejail_service import startup_check
 from codejail_service.startup_check import _check_basic_function, is_exec_safe, run_startup_safety_check
@@ -252,6 +253,70 @@ class TestInit(TestCase):
         for call_args, snippet in zip(mock_log_error.call_args_list, expected_error_log_snippets):
             assert snippet in call_args[0][0]
 
+    @override_settings(CODEJAIL_SANDBOX_USERS=[
+        {'user': 'sandbox1', 'python_bin': '/sandbox1/bin/python'},
+        {'user': 'sandbox2', 'python_bin': '/sandbox2/bin/python'},
+    ])
+    @patch('codejail_service.startup_check.set_custom_attribute')
+    @patch('codejail_service.startup_check.log.error')
+    @patch('codejail_service.startup_check.STARTUP_SAFETY_CHECK_OK', None)
+    def test_several_sandbox_users(self, mock_log_error, mock_set_custom_attribute):
+        """
+        Each sandbox user is checked separately, and all must pass.
+        """
+        ok = responses()
+        bad = responses(child=({'ret': '1970\n'}, None))
+        # Each check runs for each user in turn
+        interleaved = [response for pair in zip(ok, bad) for response in pair]
+        with (
+                patch('codejail_service.startup_check.safe_exec', side_effect=interleaved) as mock_safe_exec,
+                patch(
+                    'codejail_service.startup_check.urllib.request.urlopen',
+                    side_effect=URLError(PermissionError(13, 'Permission denied')),
+                ),
+        ):
+            run_startup_safety_check()
+
+        assert startup_check.STARTUP_SAFETY_CHECK_OK is False
+        assert mock_safe_exec.call_count == 8
+        mock_log_error.assert_called_once()
+        assert "'Block sandbox escape by process execution (sandbox user sandbox2)'" in mock_log_error.call_args[0][0]
+        assert call('codejail.startup_check.exec', 'fail') in mock_set_custom_attribute.call_args_list
+        assert call('codejail.startup_check.disk', 'pass') in mock_set_custom_attribute.call_args_list
+
+    @ddt.data(
+        ({'nltk_data': '/srv/caches/nltk_data', 'mplconfigdir': 'tmp/matplotlib',
+          'mpl_files': ['fontlist-v390.json']}, None, True),
+        # Font cache wasn't built
+        ({'nltk_data': '/srv/caches/nltk_data', 'mplconfigdir': 'tmp/matplotlib', 'mpl_files': []}, None, False),
+        # Cache couldn't be copied in, so matplotlib would rebuild it
+        ({'nltk_data': '/srv/caches/nltk_data', 'mplconfigdir': None, 'mpl_files': []}, None, False),
+        # Prolog not in effect
+        ({'nltk_data': None, 'mplconfigdir': None, 'mpl_files': []}, None, False),
+        ({}, "PermissionError: [Errno 13] Permission denied", False),
+    )
+    @ddt.unpack
+    @override_settings(CODEJAIL_SANDBOX_CACHE_DIR='/srv/caches')
+    @patch('codejail_service.startup_check.STARTUP_SAFETY_CHECK_OK', None)
+    def test_sandbox_caches(self, cache_globals, cache_error, expected_status):
+        """
+        When caches are configured, check that the sandbox actually uses them.
+        """
+        with (
+                patch(
+                    'codejail_service.startup_check.safe_exec',
+                    side_effect=responses() + [(cache_globals, cache_error)],
+                ) as mock_safe_exec,
+                patch(
+                    'codejail_service.startup_check.urllib.request.urlopen',
+                    side_effect=URLError(PermissionError(13, 'Permission denied')),
+                ),
+        ):
+            run_startup_safety_check()
+
+        assert startup_check.STARTUP_SAFETY_CHECK_OK is expected_status
+        assert mock_safe_exec.call_count == 5
+
     @ddt.data(True, False)
     def test_skip_reinit(self, starting_state):
         """
@@ -265,3 +330,21 @@ class TestInit(TestCase):
             assert startup_check.STARTUP_SAFETY_CHECK_OK is starting_state
 
         mock_safe_exec.assert_not_called()
+
+    @patch('codejail_service.startup_check.STARTUP_SAFETY_CHECK_OK', None)
+    def test_concurrent_callers(self):
+        """
+        Callers arriving while the checks are running wait for them rather than running them again.
+        """
+        other_caller = threading.Thread(target=run_startup_safety_check)
+
+        def run_checks():
+            # Another caller arrives before these checks have finished
+            other_caller.start()
+            startup_check.STARTUP_SAFETY_CHECK_OK = True
+
+        with patch('codejail_service.startup_check._run_checks', side_effect=run_checks) as mock_run_checks:
+            run_startup_safety_check()
+            other_caller.join(5)
+
+        mock_run_checks.assert_called_once()
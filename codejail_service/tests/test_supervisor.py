@@ -0,0 +1,252 @@
+"""
+Tests for the sandbox supervisor and its client.
+"""
+
+import ast
+import os
+import socket
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+
+import codejail.safe_exec
+from django.conf import settings
+from django.test import TestCase, override_settings
+
+from codejail_service import startup_check
+from codejail_service.codejail import safe_exec
+from codejail_service.supervisor import Scheduler, SupervisorServer
+from codejail_service.supervisor_client import (
+    SupervisorUnavailable,
+    recv_message,
+    send_message,
+    supervisor_stats,
+    uses_supervisor,
+    wait_for_supervisor
+)
+from codejail_service.usage import run_measured
+
+
+class TestScheduler(TestCase):
+
+    def test_capacity_and_queue(self):
+        scheduler = Scheduler(capacity=1, max_queue=1)
+        queued = threading.Event()
+        results = []
+
+        def run():
+            queued.set()
+            with scheduler.slot() as admitted:
+                results.append(admitted)
+
+        with scheduler.slot() as first:
+            assert first is True
+            thread = threading.Thread(target=run)
+            thread.start()
+            queued.wait(5)
+            for _ in range(500):
+                if scheduler.report()['queued'] == 1:
+                    break
+                thread.join(0.01)
+            # One running, one waiting, so the queue is full
+            with scheduler.slot() as third:
+                assert third is False
+
+        thread.join(5)
+        assert results == [True]
+        assert scheduler.report() == {
+            'capacity': 1, 'max_queue': 1, 'running': 0, 'queued': 0,
+            'peak_running': 1, 'peak_queued': 1, 'refused': 1, 'expired': 0, 'completed': 2,
+        }
+
+    def test_deadline(self):
+        """A queued execution whose deadline passes is dropped, and doesn't hold up the next one."""
+        scheduler = Scheduler(capacity=1, max_queue=2)
+        with scheduler.slot() as first:
+            assert first is True
+            with scheduler.slot(deadline=time.time() + 0.1) as late:
+                assert late is False
+            with scheduler.slot(deadline=time.time() - 1) as past:
+                assert past is False
+        with scheduler.slot(deadline=time.time() + 5) as in_time:
+            assert in_time is True
+        report = scheduler.report()
+        assert (report['expired'], report['completed'], report['queued']) == (2, 2, 0)
+
+    def test_no_queue(self):
+        scheduler = Scheduler(capacity=2, max_queue=0)
+        with scheduler.slot() as first, scheduler.slot() as second, scheduler.slot() as third:
+            assert (first, second, third) == (True, True, False)
+        with scheduler.slot() as fourth:
+            assert fourth is True
+
+
+class TestSupervisorTimeout(TestCase):
+
+    def test_below_gunicorn_timeout(self):
+        """Web workers give up on the supervisor before gunicorn would kill them."""
+        # Parsed rather than imported, since importing the configuration disables gc.
+        config_path = os.path.join(os.path.dirname(startup_check.__file__), 'docker_gunicorn_configuration.py')
+        with open(config_path, encoding='utf-8') as f:
+            tree = ast.parse(f.read())
+        (gunicorn_timeout,) = [
+            ast.literal_eval(node.value) for node in tree.body
+            if isinstance(node, ast.Assign) and [getattr(t, 'id', None) for t in node.targets] == ['timeout']
+        ]
+        assert settings.CODEJAIL_SUPERVISOR_TIMEOUT <= gunicorn_timeout - 30
+
+
+class TestSupervisor(TestCase):
+    """
+    Run a supervisor in a thread of the test process, and hand executions to it.
+    """
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp.cleanup)
+        self.socket_path = os.path.join(tmp.name, 'supervisor.sock')
+
+        settings_override = override_settings(CODEJAIL_SUPERVISOR_SOCKET=self.socket_path)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        # Run code in-process, as in the view tests
+        startup_check.STARTUP_SAFETY_CHECK_OK = True
+        codejail.safe_exec.ALWAYS_BE_UNSAFE = True
+
+    def tearDown(self):
+        super().tearDown()
+        startup_check.STARTUP_SAFETY_CHECK_OK = None
+        codejail.safe_exec.ALWAYS_BE_UNSAFE = False
+
+    def _serve(self, scheduler=None):
+        server = SupervisorServer(self.socket_path, scheduler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def test_exec(self):
+        server = self._serve()
+        assert uses_supervisor()
+
+        (result, usage) = run_measured(safe_exec, "retval = x + 1", {'x': 6}, slug='course/problem')
+        assert result == ({'x': 6, 'retval': 7}, None)
+        # The usage is what the supervisor measured
+        assert server.usage.snapshot()['wall'] == usage.wall
+
+    def test_error(self):
+        self._serve()
+        (globals_out, error_message) = safe_exec("raise Exception('oops')", {'x': float('nan')})
+        assert 'oops' in error_message
+        assert list(globals_out) == ['x']
+
+    def test_extra_files(self):
+        self._serve()
+        (globals_out, error_message) = safe_exec(
+            "with open('data.bin', 'rb') as f: retval = f.read().decode()", {},
+            extra_files=[('data.bin', b'\x00hello')],
+        )
+        assert error_message is None
+        assert globals_out == {'retval': '\x00hello'}
+
+    def test_busy(self):
+        scheduler = Scheduler(capacity=1, max_queue=0)
+        self._serve(scheduler)
+        with scheduler.slot():
+            with self.assertRaises(SupervisorUnavailable) as caught:
+                safe_exec("x = 1", {})
+        assert caught.exception.reason == 'busy'
+        assert supervisor_stats()['scheduler']['refused'] == 1
+
+    @override_settings(CODEJAIL_MIN_NPROC_HEADROOM=10)
+    def test_nproc_headroom(self):
+        """The supervisor, which runs the process watchdog, refuses executions when NPROC headroom is low."""
+        self._serve()
+        with patch('codejail_service.supervisor.SANDBOX_PROCESSES.headroom', return_value=3):
+            with self.assertRaises(SupervisorUnavailable) as caught:
+                safe_exec("x = 1", {})
+        assert caught.exception.reason == 'busy'
+        assert "process limit" in str(caught.exception)
+
+        with patch('codejail_service.supervisor.SANDBOX_PROCESSES.headroom', return_value=10):
+            assert safe_exec("x = 1", {}) == ({'x': 1}, None)
+
+    @override_settings(CODEJAIL_SUPERVISOR_TIMEOUT=0.2)
+    def test_gave_up_while_queued(self):
+        """Executions the web worker has given up on by the time they'd start aren't run."""
+        scheduler = Scheduler(capacity=1, max_queue=1)
+        self._serve(scheduler)
+        with scheduler.slot():
+            with self.assertRaises(SupervisorUnavailable) as caught:
+                safe_exec("x = 1", {})
+            # Whichever of the two gives up first
+            assert caught.exception.reason in ('busy', 'unreachable')
+            for _ in range(500):
+                if scheduler.report()['expired']:
+                    break
+                time.sleep(0.01)
+        report = scheduler.report()
+        assert (report['expired'], report['completed']) == (1, 1)
+
+    def test_unreachable(self):
+        with self.assertRaises(SupervisorUnavailable) as caught:
+            safe_exec("x = 1", {})
+        assert caught.exception.reason == 'unreachable'
+        assert 'error' in supervisor_stats()
+        assert wait_for_supervisor(timeout=0) is False
+
+    def test_failed_startup_checks(self):
+        self._serve()
+        startup_check.STARTUP_SAFETY_CHECK_OK = False
+        with self.assertRaises(SupervisorUnavailable) as caught:
+            safe_exec("x = 1", {})
+        assert caught.exception.reason == 'error'
+        assert wait_for_supervisor(timeout=5) is False
+
+    def test_stats_and_health(self):
+        self._serve()
+        assert wait_for_supervisor(timeout=5) is True
+        safe_exec("x = 1", {})
+        stats = supervisor_stats()
+        assert stats['scheduler']['completed'] == 1
+        assert stats['usage']['executions'] == 1
+        assert set(stats) == {'scheduler', 'usage', 'janitor', 'processes'}
+
+    def test_bad_requests(self):
+        self._serve()
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(5)
+            sock.connect(self.socket_path)
+            sock.sendall(b'\x00\x00\x00\x05[1, ')
+            sock.shutdown(socket.SHUT_WR)
+            # The connection is dropped without a response
+            assert sock.recv(1) == b''
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(5)
+            sock.connect(self.socket_path)
+            send_message(sock, {'op': 'nope'})
+            assert recv_message(sock) == {'ok': False, 'reason': 'error', 'error': "Unknown op 'nope'"}
+
+        for not_an_object in [[1, 2], "exec", None]:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(5)
+                sock.connect(self.socket_path)
+                send_message(sock, not_an_object)
+                assert recv_message(sock) == {'ok': False, 'reason': 'error', 'error': "Request must be a JSON object"}
+
+    def test_replaces_stale_socket(self):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale:
+            stale.bind(self.socket_path)
+        self._serve()
+        assert wait_for_supervisor(timeout=5) is True
+        assert oct(os.stat(self.socket_path).st_mode & 0o777) == oct(0o660)
+
+    def test_send_message_framing(self):
+        (left, right) = socket.socketpair()
+        with left, right:
+            send_message(left, {'a': 1})
+            assert right.recv(100) == b'\x00\x00\x00\x08{"a": 1}'
@@ -0,0 +1,121 @@
+"""
+Tests for sandbox resource usage measurement.
+"""
+
+import subprocess
+import sys
+import threading
+from unittest.mock import call, patch
+
+from django.test import TestCase, override_settings
+
+from codejail_service import usage
+from codejail_service.usage import ExecutionUsage, UsageTotals, record_usage, report_usage, run_measured
+
+
+class TestRunMeasured(TestCase):
+
+    def test_measures_children(self):
+        """
+        CPU time of child processes is attributed to the call.
+        """
+        busy_loop = "import time\nend = time.process_time() + 0.2\nwhile time.process_time() < end: pass"
+        result, measured = run_measured(subprocess.run, [sys.executable, '-c', busy_loop], check=True)
+
+        assert result.returncode == 0
+        assert measured.cpu_user + measured.cpu_sys >= 0.15
+        assert measured.wall >= measured.cpu_user
+        # First child in this process to do much of anything, or not; either way
+        # the value must be plausible if present.
+        assert measured.max_rss_kb is None or measured.max_rss_kb > 0
+
+    def test_return_value_passthrough(self):
+        result, measured = run_measured(lambda x, y=0: x + y, 3, y=4)
+        assert result == 7
+        assert measured.max_rss_kb is None
+        assert measured.exclusive is True
+
+    def test_reported_usage(self):
+        """Usage reported from another process replaces the local measurement, once."""
+        reported = ExecutionUsage(cpu_user=1.5, cpu_sys=0.5, wall=2.5, max_rss_kb=1024)
+
+        def remote_call():
+            report_usage(reported)
+            return 'done'
+
+        assert run_measured(remote_call) == ('done', reported)
+        (_, usage) = run_measured(lambda: None)
+        assert usage != reported
+
+    def test_overlapping(self):
+        """
+        Executions that ran at the same time as another in the process are marked as not exclusive.
+        """
+        started = threading.Event()
+        release = threading.Event()
+        measured = {}
+
+        def wait():
+            started.set()
+            release.wait(5)
+
+        def run():
+            measured['outer'] = run_measured(wait)[1]
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        assert started.wait(5)
+        measured['inner'] = run_measured(lambda: None)[1]
+        release.set()
+        thread.join(5)
+
+        assert measured['outer'].exclusive is False
+        assert measured['inner'].exclusive is False
+        assert run_measured(lambda: None)[1].exclusive is True
+
+
+class TestExecutionUsage(TestCase):
+
+    def test_as_header(self):
+        assert ExecutionUsage(0.1234, 0.01, 0.5, 20480).as_header() == (
+            "cpu_user=0.123, cpu_sys=0.010, wall=0.500, max_rss_kb=20480"
+        )
+        assert ExecutionUsage(0.1234, 0.01, 0.5, None).as_header() == (
+            "cpu_user=0.123, cpu_sys=0.010, wall=0.500"
+        )
+        assert ExecutionUsage(0.1234, 0.01, 0.5, None, exclusive=False).as_header() == (
+            "cpu_user=0.123, cpu_sys=0.010, wall=0.500, exclusive=0"
+        )
+
+
+class TestRecordUsage(TestCase):
+
+    @override_settings(CODEJAIL_USAGE_LOG_INTERVAL=2)
+    @patch('codejail_service.usage.log.info')
+    @patch('codejail_service.usage.set_custom_attribute')
+    def test_record(self, mock_set_custom_attribute, mock_log_info):
+        with (
+                patch.object(usage, 'WORKER_USAGE', UsageTotals()),
+                patch.object(usage, 'SLOW_PROBLEMS') as mock_slow_problems,
+        ):
+            record_usage(ExecutionUsage(1.0, 0.5, 2.0, 1000), 'hw1')
+            record_usage(ExecutionUsage(3.0, 0.5, 4.0, None), 'hw2')
+
+            snapshot = usage.WORKER_USAGE.snapshot()
+
+        assert mock_set_custom_attribute.call_args_list == [
+            call('codejail.exec.cpu_user', 1.0),
+            call('codejail.exec.cpu_sys', 0.5),
+            call('codejail.exec.wall', 2.0),
+            call('codejail.exec.max_rss_kb', 1000),
+            call('codejail.exec.cpu_user', 3.0),
+            call('codejail.exec.cpu_sys', 0.5),
+            call('codejail.exec.wall', 4.0),
+        ]
+        assert snapshot['executions'] == 2
+        assert snapshot['cpu_user'] == 4.0
+        assert snapshot['wall'] == 6.0
+        assert snapshot['max_rss_kb'] == 1000
+        assert [c[0][0] for c in mock_slow_problems.add.call_args_list] == ['hw1', 'hw2']
+        # Totals and slow problems are logged once, at the interval
+        assert mock_log_info.call_count == 2
@@ -0,0 +1,107 @@
+"""
+Tests for the per-worker cap on concurrent executions.
+"""
+
+import os
+import threading
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from codejail_service import worker_concurrency
+from codejail_service.worker_concurrency import WorkerConcurrency, get_worker_limit, set_worker_count
+
+
+class TestWorkerConcurrency(TestCase):
+
+    def test_no_limit(self):
+        concurrency = WorkerConcurrency()
+        with concurrency.slot() as first, concurrency.slot() as second, concurrency.slot() as third:
+            assert (first, second, third) == (True, True, True)
+        assert concurrency.report() == {'limit': None, 'in_flight': 0, 'peak': 3, 'rejected': 0, 'waiting': 0}
+
+    @override_settings(CODEJAIL_WORKER_CONCURRENCY=2)
+    def test_limit(self):
+        concurrency = WorkerConcurrency()
+        with concurrency.slot() as first, concurrency.slot() as second:
+            with concurrency.slot() as third:
+                assert (first, second, third) == (True, True, False)
+                assert concurrency.report() == {'limit': 2, 'in_flight': 2, 'peak': 2, 'rejected': 1, 'waiting': 0}
+
+        # Slots are given back
+        with concurrency.slot() as fourth:
+            assert fourth is True
+        assert concurrency.report()['in_flight'] == 0
+
+    @override_settings(CODEJAIL_WORKER_CONCURRENCY=1)
+    def test_released_on_error(self):
+        concurrency = WorkerConcurrency()
+        try:
+            with concurrency.slot():
+                raise ValueError()
+        except ValueError:
+            pass
+        with concurrency.slot() as acquired:
+            assert acquired is True
+
+    @override_settings(CODEJAIL_WORKER_CONCURRENCY=3)
+    def test_threads(self):
+        concurrency = WorkerConcurrency()
+        entered = threading.Semaphore(0)
+        release = threading.Event()
+        results = []
+
+        def run():
+            with concurrency.slot() as acquired:
+                results.append(acquired)
+                if acquired:
+                    entered.release()
+                    release.wait(5)
+
+        threads = [threading.Thread(target=run) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        # The first three hold their slots until released
+        for _ in threads:
+            assert entered.acquire(timeout=5)
+        run()
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        assert sorted(results) == [False, True, True, True]
+        assert concurrency.report() == {'limit': 3, 'in_flight': 0, 'peak': 3, 'rejected': 1, 'waiting': 0}
+
+
+@override_settings(CODEJAIL_SANDBOX_CAPACITY=8, CODEJAIL_WORKER_CONCURRENCY=None)
+class TestWorkerLimit(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(set_worker_count, worker_concurrency._worker_count)  # pylint: disable=protected-access
+        set_worker_count(None)
+
+    def test_single_worker(self):
+        with patch.dict(os.environ):
+            os.environ.pop('WEB_CONCURRENCY', None)
+            assert get_worker_limit() == 8
+
+    def test_divided_between_workers(self):
+        set_worker_count(3)
+        assert get_worker_limit() == 2
+
+    @patch.dict(os.environ, {'WEB_CONCURRENCY': '4'})
+    def test_web_concurrency(self):
+        assert get_worker_limit() == 2
+        # The server's own count takes precedence
+        set_worker_count(8)
+        assert get_worker_limit() == 1
+
+    def test_at_least_one(self):
+        set_worker_count(16)
+        assert get_worker_limit() == 1
+
+    @override_settings(CODEJAIL_WORKER_CONCURRENCY=5)
+    def test_configured(self):
+        set_worker_count(4)
+        assert get_worker_limit() == 5
@@ -0,0 +1,89 @@
+"""
+Tests for worker memory reporting and recycling.
+"""
+
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from codejail_service.worker_memory import PAGE_SIZE, WorkerMemory, read_memory_rollup, read_rss_bytes
+
+SMAPS_ROLLUP = """\
+00400000-7ffd5e9f6000 ---p 00000000 00:00 0                              [rollup]
+Rss:              102400 kB
+Pss:               40960 kB
+Shared_Clean:      61440 kB
+Shared_Dirty:       2048 kB
+Private_Clean:      1024 kB
+Private_Dirty:     37888 kB
+Referenced:        98304 kB
+Anonymous:         40960 kB
+Swap:                  0 kB
+"""
+
+
+class TestReadMemory(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp.cleanup)
+        self.root = tmp.name
+
+    def write(self, name, content):
+        """
+        Write a fake proc file and return its path.
+        """
+        path = os.path.join(self.root, name)
+        with open(path, 'w', encoding='ascii') as f:
+            f.write(content)
+        return path
+
+    def test_rss(self):
+        assert read_rss_bytes(self.write('statm', '50000 2500 800 1 0 3000 0\n')) == 2500 * PAGE_SIZE
+
+    def test_rollup(self):
+        assert read_memory_rollup(self.write('smaps_rollup', SMAPS_ROLLUP)) == {
+            'rss_bytes': 100 * 1024 * 1024,
+            'pss_bytes': 40 * 1024 * 1024,
+            'shared_bytes': 62 * 1024 * 1024,
+            'private_bytes': 38 * 1024 * 1024,
+        }
+
+    def test_rollup_unavailable(self):
+        assert read_memory_rollup(os.path.join(self.root, 'missing')) is None
+
+    def test_real_process(self):
+        assert read_rss_bytes() > 0
+
+
+class TestWorkerMemory(TestCase):
+
+    @override_settings(CODEJAIL_WORKER_MAX_RSS_BYTES=1000)
+    def test_check(self):
+        with patch('codejail_service.worker_memory.read_rss_bytes', return_value=999):
+            assert WorkerMemory().check() is None
+        with patch('codejail_service.worker_memory.read_rss_bytes', return_value=1001):
+            assert WorkerMemory().check() == 1001
+
+    @override_settings(CODEJAIL_WORKER_MAX_RSS_BYTES=None)
+    def test_check_disabled(self):
+        with patch('codejail_service.worker_memory.read_rss_bytes') as mock_read:
+            assert WorkerMemory().check() is None
+        mock_read.assert_not_called()
+
+    @override_settings(CODEJAIL_WORKER_MAX_RSS_BYTES=10**9)
+    def test_report(self):
+        report = WorkerMemory().report()
+        assert report['rss_bytes'] > 0
+        assert report['peak_rss_bytes'] >= report['rss_bytes']
+        assert report['max_rss_bytes'] == 10**9
+
+    @patch('codejail_service.worker_memory.read_memory_rollup', return_value=None)
+    @patch('codejail_service.worker_memory.read_rss_bytes', return_value=4096)
+    def test_report_without_rollup(self, _mock_rss, _mock_rollup):
+        report = WorkerMemory().report()
+        assert report['rss_bytes'] == 4096
+        assert 'private_bytes' not in report
@@ -0,0 +1,47 @@
+"""
+Upload handling that spools files to disk and hashes them as they arrive.
+"""
+
+import hashlib
+
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+
+class HashingFileUploadHandler(TemporaryFileUploadHandler):
+    """
+    Streams each uploaded file to a temporary file, computing its SHA-256 digest on the way.
+
+    Unlike Django's default handlers, small files are not kept in memory
+    either, so a worker holds at most one chunk of an upload at a time. The
+    resulting file has a ``sha256`` attribute with the hex digest, which
+    is the same digest libraries are stored and validated under.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """
+        Set up the handler; arguments are as for Django's upload handlers.
+        """
+        super().__init__(*args, **kwargs)
+        self.hasher = None
+
+    def new_file(self, *args, **kwargs):
+        """
+        Start hashing a new file.
+        """
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        """
+        Hash a chunk, and pass it on to be spooled to disk.
+        """
+        self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        """
+        Return the spooled file, with its digest.
+        """
+        file = super().file_complete(file_size)
+        file.sha256 = self.hasher.hexdigest()
+        return file
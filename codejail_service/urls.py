@@ -27,4 +27,5 @@ from codejail_service.apps.core import views as core_views
 urlpatterns = [
     path(r'api/', include(api_urls)),
     path(r'health/', core_views.health, name='health'),
+    path(r'internal/sandbox-stats/', core_views.sandbox_stats, name='sandbox_stats'),
 ]
@@ -0,0 +1,208 @@
+"""
+Measurement and reporting of sandbox resource usage.
+"""
+
+import logging
+import os
+import resource
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from django.conf import settings
+from edx_django_utils.monitoring import set_custom_attribute
+
+from codejail_service.slow_problems import SLOW_PROBLEMS
+
+log = logging.getLogger(__name__)
+
+# Response header in which usage is reported to the caller, if enabled.
+USAGE_HEADER = 'X-Codejail-Usage'
+
+
+@dataclass(frozen=True)
+class ExecutionUsage:
+    """
+    Resources used by a single sandboxed execution.
+
+    CPU times come from the resource usage of child processes, so they are only
+    accurate when a worker runs one sandbox at a time. If other executions in
+    the same worker ran during this one (with a threaded worker), their CPU
+    time may be counted here too; ``exclusive`` is then False.
+
+    ``max_rss_kb`` is only known when the execution's peak RSS was higher than
+    that of any previous sandbox in the same worker process (the kernel only
+    reports a high-water mark for children). Otherwise it is None. This means
+    the maximum of the reported values is still the true peak across all
+    executions, which is what matters for setting memory limits.
+    """
+
+    cpu_user: float
+    cpu_sys: float
+    wall: float
+    max_rss_kb: Optional[int]
+    exclusive: bool = True
+
+    def as_header(self):
+        """
+        Format as a response header value.
+        """
+        parts = [
+            f"cpu_user={self.cpu_user:.3f}",
+            f"cpu_sys={self.cpu_sys:.3f}",
+            f"wall={self.wall:.3f}",
+        ]
+        if self.max_rss_kb is not None:
+            parts.append(f"max_rss_kb={self.max_rss_kb}")
+        if not self.exclusive:
+            parts.append("exclusive=0")
+        return ", ".join(parts)
+
+
+# Measurements in progress in this process, mapped to whether another
+# measurement has overlapped them.
+_measuring = {}
+_measuring_lock = threading.Lock()
+
+# Usage of an execution that ran in another process, reported on the
+# measuring thread (see ``report_usage``).
+_reported = threading.local()
+
+
+def report_usage(usage):
+    """
+    Report the usage of an execution that ran in another process, such as the sandbox supervisor.
+
+    Its sandboxes aren't children of this process, so ``run_measured`` can't
+    see their resource usage; if called within ``run_measured`` on the same
+    thread, it returns this usage instead of its own measurement.
+    """
+    _reported.usage = usage
+
+
+def run_measured(fn, *args, **kwargs):
+    """
+    Call ``fn`` with the given arguments and measure the sandbox resources it used.
+
+    If ``fn`` had its sandbox run elsewhere and reported that usage (see
+    ``report_usage``), the reported usage is used instead.
+
+    Returns a tuple of (return value, ExecutionUsage).
+    """
+    token = object()
+    with _measuring_lock:
+        for other in _measuring:
+            _measuring[other] = True
+        _measuring[token] = bool(_measuring)
+
+    _reported.usage = None
+    try:
+        before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        start = time.monotonic()
+        result = fn(*args, **kwargs)
+        wall = time.monotonic() - start
+        after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    finally:
+        with _measuring_lock:
+            overlapped = _measuring.pop(token)
+        (reported, _reported.usage) = (_reported.usage, None)
+
+    if reported is not None:
+        return (result, reported)
+
+    usage = ExecutionUsage(
+        cpu_user=after.ru_utime - before.ru_utime,
+        cpu_sys=after.ru_stime - before.ru_stime,
+        wall=wall,
+        max_rss_kb=after.ru_maxrss if after.ru_maxrss > before.ru_maxrss else None,
+        exclusive=not overlapped,
+    )
+    return (result, usage)
+
+
+class UsageTotals:
+    """
+    Running totals of sandbox resource usage in this worker process.
+    """
+
+    def __init__(self):
+        """
+        Start with no executions.
+        """
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.cpu_user = 0.0
+        self.cpu_sys = 0.0
+        self.wall = 0.0
+        self.max_rss_kb = 0
+
+    def add(self, usage):
+        """
+        Add an execution's usage to the totals, and return the new number of executions.
+        """
+        with self._lock:
+            self.executions += 1
+            self.cpu_user += usage.cpu_user
+            self.cpu_sys += usage.cpu_sys
+            self.wall += usage.wall
+            if usage.max_rss_kb is not None:
+                self.max_rss_kb = max(self.max_rss_kb, usage.max_rss_kb)
+            return self.executions
+
+    def snapshot(self):
+        """
+        Return the totals as a dict.
+        """
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'executions': self.executions,
+                'cpu_user': self.cpu_user,
+                'cpu_sys': self.cpu_sys,
+                'wall': self.wall,
+                'max_rss_kb': self.max_rss_kb,
+            }
+
+
+WORKER_USAGE = UsageTotals()
+
+
+def record_usage(usage, slug=None):
+    """
+    Report an execution's resource usage as custom attributes and add it to the totals.
+
+    The usage is also attributed to the slug in the slow-problem tracker.
+    Every ``CODEJAIL_USAGE_LOG_INTERVAL`` executions, the worker's totals and
+    slowest problems are logged.
+    """
+    # .. custom_attribute_name: codejail.exec.cpu_user
+    # .. custom_attribute_description: User CPU time, in seconds, used by the sandbox.
+    set_custom_attribute('codejail.exec.cpu_user', usage.cpu_user)
+    # .. custom_attribute_name: codejail.exec.cpu_sys
+    # .. custom_attribute_description: System CPU time, in seconds, used by the sandbox.
+    set_custom_attribute('codejail.exec.cpu_sys', usage.cpu_sys)
+    # .. custom_attribute_name: codejail.exec.wall
+    # .. custom_attribute_description: Wall-clock time, in seconds, of the sandboxed
+    #   execution (including sandbox setup and teardown).
+    set_custom_attribute('codejail.exec.wall', usage.wall)
+    if usage.max_rss_kb is not None:
+        # .. custom_attribute_name: codejail.exec.max_rss_kb
+        # .. custom_attribute_description: Peak resident memory of the sandbox, in KiB.
+        #   Only present when this was the highest peak so far in the worker process,
+        #   so the maximum of this attribute over any period is still the true peak.
+        set_custom_attribute('codejail.exec.max_rss_kb', usage.max_rss_kb)
+    if not usage.exclusive:
+        # .. custom_attribute_name: codejail.exec.usage_overlapped
+        # .. custom_attribute_description: Present (and True) when other executions ran in
+        #   the same worker process at the same time as this one, in which case the CPU time
+        #   attributes may include some of their usage.
+        set_custom_attribute('codejail.exec.usage_overlapped', True)
+
+    executions = WORKER_USAGE.add(usage)
+    SLOW_PROBLEMS.add(slug, usage)
+
+    interval = getattr(settings, 'CODEJAIL_USAGE_LOG_INTERVAL', 0)
+    if interval and executions % interval == 0:
+        log.info(f"Sandbox usage totals: {WORKER_USAGE.snapshot()!r}")
+        log.info(f"Slowest problems: {SLOW_PROBLEMS.report()!r}")
@@ -0,0 +1,190 @@
+"""
+Concurrent executions within one worker process.
+
+Most of the time spent serving a code-exec request is waiting for the
+sandbox, during which a worker process needs almost no CPU. With a threaded
+gunicorn worker (``--threads``), one process can therefore drive several
+sandboxes at once, and the memory of the webapp itself is shared between
+them rather than paid again for each concurrent execution.
+
+``CODEJAIL_WORKER_CONCURRENCY`` caps the number of executions a worker runs
+at once, and should match the number of sandboxes that the worker's share of
+the host can support. Requests arriving while all of a worker's execution
+slots are taken are refused with a 503 rather than queued, so that the load
+balancer can send them elsewhere.
+
+Under ASGI, the async code-exec endpoint instead waits for a slot, so a
+waiting request costs a coroutine rather than a thread or process. Its
+executions run on a thread pool of their own, sized to the cap, so they
+can't starve other views, such as ``/health/``, of threads. There, the cap
+defaults to this worker's share of the sandbox capacity (see
+``get_worker_limit``), since every worker process on the host has its own.
+"""
+
+import asyncio
+import contextlib
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from codejail_service.sandbox_env import get_sandbox_capacity
+
+# Number of worker processes on the host, when known from the server's
+# configuration (see ``set_worker_count``).
+_worker_count = None
+
+
+def set_worker_count(count):
+    """
+    Record the number of worker processes serving on this host.
+
+    Called from gunicorn's ``post_fork`` hook in the provided configuration.
+    """
+    global _worker_count
+    _worker_count = count
+
+
+def get_worker_count():
+    """
+    Return the number of worker processes serving on this host.
+
+    This is as recorded by ``set_worker_count``, or otherwise from the
+    ``WEB_CONCURRENCY`` environment variable (which gunicorn and uvicorn
+    also use as their default worker count), or else 1.
+    """
+    if _worker_count:
+        return _worker_count
+    return int(os.environ.get('WEB_CONCURRENCY', '1'))
+
+
+def get_worker_limit():
+    """
+    Return the number of executions this worker may run at once, when waiting for slots.
+
+    This is ``CODEJAIL_WORKER_CONCURRENCY`` if set, and otherwise this
+    worker's share of ``CODEJAIL_SANDBOX_CAPACITY`` (at least 1), so that the
+    workers together don't run more sandboxes than the host can.
+    """
+    configured = getattr(settings, 'CODEJAIL_WORKER_CONCURRENCY', None)
+    if configured:
+        return configured
+    return max(1, get_sandbox_capacity() // get_worker_count())
+
+
+class WorkerConcurrency:
+    """
+    Counts the executions in progress in this worker, and enforces the per-worker cap.
+    """
+
+    def __init__(self):
+        """
+        Start with no executions in progress.
+        """
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.peak = 0
+        self.rejected = 0
+        self.waiting = 0
+        # Event loop to (limit, semaphore); asyncio primitives belong to one loop.
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._executor = None
+        self._executor_size = None
+
+    @contextlib.contextmanager
+    def slot(self):
+        """
+        Hold an execution slot within the context, if one is free.
+
+        Yields True if a slot was taken, or False if the worker is already
+        running ``CODEJAIL_WORKER_CONCURRENCY`` executions (in which case the
+        caller should not execute anything).
+        """
+        limit = getattr(settings, 'CODEJAIL_WORKER_CONCURRENCY', None)
+        with self._lock:
+            if limit and self.in_flight >= limit:
+                self.rejected += 1
+                acquired = False
+            else:
+                self.in_flight += 1
+                self.peak = max(self.peak, self.in_flight)
+                acquired = True
+
+        if not acquired:
+            yield False
+            return
+
+        try:
+            yield True
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    async def run(self, fn, *args):
+        """
+        Wait for an execution slot, then call ``fn(*args)`` in an execution thread and return the result.
+
+        The limit is as given by ``get_worker_limit``. The slot is held until ``fn`` returns, even if the
+        caller is cancelled in the meantime (for example, because the client
+        disconnected), since the sandbox keeps running.
+        """
+        limit = get_worker_limit()
+        (semaphore, executor) = self._async_resources(limit)
+
+        with self._lock:
+            self.waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            with self._lock:
+                self.waiting -= 1
+
+        with self._lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+
+        def release(_future):
+            with self._lock:
+                self.in_flight -= 1
+            semaphore.release()
+
+        future = asyncio.ensure_future(sync_to_async(fn, thread_sensitive=False, executor=executor)(*args))
+        future.add_done_callback(release)
+        return await asyncio.shield(future)
+
+    def _async_resources(self, limit):
+        """
+        Return the semaphore for the running event loop and the execution thread pool, for this limit.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            (size, semaphore) = self._semaphores.get(loop, (None, None))
+            if size != limit:
+                semaphore = asyncio.Semaphore(limit)
+                self._semaphores[loop] = (limit, semaphore)
+
+            if self._executor_size != limit:
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                self._executor = ThreadPoolExecutor(max_workers=limit, thread_name_prefix='codejail-exec')
+                self._executor_size = limit
+            return (semaphore, self._executor)
+
+    def report(self):
+        """
+        Return a JSON-ready summary of this worker's concurrent executions.
+        """
+        with self._lock:
+            return {
+                'limit': getattr(settings, 'CODEJAIL_WORKER_CONCURRENCY', None),
+                'in_flight': self.in_flight,
+                'peak': self.peak,
+                'rejected': self.rejected,
+                'waiting': self.waiting,
+            }
+
+
+WORKER_CONCURRENCY = WorkerConcurrency()
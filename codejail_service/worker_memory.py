@@ -0,0 +1,97 @@
+"""
+Worker memory use: per-worker RSS reporting and recycling of bloated workers.
+
+A worker that has handled a very large request (such as a big
+``globals_dict``) keeps the memory it allocated, since the Python allocator
+rarely returns it to the OS, until gunicorn's ``--max-requests`` count
+restarts it. With ``CODEJAIL_WORKER_MAX_RSS_BYTES`` set, the gunicorn
+``post_request`` hook checks the worker's resident set size after each
+request and has the worker exit gracefully once it is over the limit; the
+arbiter then starts a fresh one.
+
+The gunicorn configuration also freezes the objects created while preloading
+the app, so that garbage collection in the workers doesn't write to (and so
+un-share) the pages they occupy. ``/internal/sandbox-stats/`` reports each
+worker's resident memory split into shared and private parts, which shows
+how much is really being shared.
+"""
+
+import os
+import resource
+
+from django.conf import settings
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+# Fields of smaps_rollup to report, and the keys to report them under.
+ROLLUP_FIELDS = {
+    'Rss': 'rss_bytes',
+    'Pss': 'pss_bytes',
+    'Shared_Clean': 'shared_bytes',
+    'Shared_Dirty': 'shared_bytes',
+    'Private_Clean': 'private_bytes',
+    'Private_Dirty': 'private_bytes',
+}
+
+
+def read_rss_bytes(statm_path='/proc/self/statm'):
+    """
+    Return the resident set size of this process in bytes.
+
+    Reads ``statm``, which is cheap enough to do after every request.
+    """
+    with open(statm_path, encoding='ascii') as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+def read_memory_rollup(rollup_path='/proc/self/smaps_rollup'):
+    """
+    Return a dict of this process's resident, proportional, shared, and private memory in bytes.
+
+    Returns None if ``smaps_rollup`` is not available (Linux before 4.14).
+    """
+    try:
+        with open(rollup_path, encoding='ascii') as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return None
+
+    rollup = dict.fromkeys(ROLLUP_FIELDS.values(), 0)
+    for line in lines:
+        (name, _, value) = line.partition(':')
+        if name in ROLLUP_FIELDS:
+            # Values are in kB
+            rollup[ROLLUP_FIELDS[name]] += int(value.split()[0]) * 1024
+    return rollup
+
+
+class WorkerMemory:
+    """
+    Reports this worker's memory use and decides when it should be recycled.
+    """
+
+    def check(self):
+        """
+        Return the current RSS if it is over ``CODEJAIL_WORKER_MAX_RSS_BYTES``, otherwise None.
+        """
+        limit = getattr(settings, 'CODEJAIL_WORKER_MAX_RSS_BYTES', None)
+        if not limit:
+            return None
+        rss = read_rss_bytes()
+        return rss if rss > limit else None
+
+    def report(self):
+        """
+        Return a JSON-ready summary of this worker's memory use.
+        """
+        rollup = read_memory_rollup() or {'rss_bytes': read_rss_bytes()}
+        # Since the worker was forked; in kB on Linux, and may lag slightly behind
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return {
+            **rollup,
+            'peak_rss_bytes': max(peak_rss, rollup['rss_bytes']),
+            'max_rss_bytes': getattr(settings, 'CODEJAIL_WORKER_MAX_RSS_BYTES', None),
+        }
+
+
+WORKER_MEMORY = WorkerMemory()
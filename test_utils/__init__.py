@@ -8,3 +8,29 @@ in multiple test modules (i.e. factoryboy factories, base test classes).
 
 So this package is the place to put them.
 """
+
+import json
+import os
+
+
+def run_in_forked_child(fn):
+    """
+    Call ``fn`` in a forked child process, and return a tuple of (child PID, return value).
+
+    The return value must be JSON-serializable.
+    """
+    (read_fd, write_fd) = os.pipe()
+    pid = os.fork()
+    if pid == 0:  # pragma: no cover
+        # Child: report the result and exit without running any cleanup
+        try:
+            os.close(read_fd)
+            os.write(write_fd, json.dumps(fn()).encode())
+        finally:
+            os._exit(0)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd, 'rb') as f:
+        output = f.read()
+    os.waitpid(pid, 0)
+    return (pid, json.loads(output))